@@ -0,0 +1,222 @@
+"""
+Alarm and interlock rules evaluated on telemetry batches.
+
+Rules are compiled once into index and limit arrays. Each batch is then checked with
+a fixed number of NumPy operations, however many rules there are:
+
+    engine = AlarmEngine([
+        ThresholdRule("dump high", "dump_pressure", ">", 900.0),
+        RateRule("4K rising", "stage_4k_temperature", ">", 0.01),
+        DurationRule("pump slow", "turbopump_frequency", "<", 800, duration=60,
+                     action=sweep_field_to_zero(AD)),
+    ])
+    poller.subscribe(engine)
+"""
+
+import logging
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# op -> (sign, inclusive); a rule holds where sign * (value - limit) > 0, or == 0 if inclusive
+_OPERATORS = {
+    '>':  (1.0, False),
+    '>=': (1.0, True),
+    '<':  (-1.0, False),
+    '<=': (-1.0, True),
+}
+
+# Rows of the stacked source matrix: values, rates and absolute rates of each channel
+_VALUE, _RATE, _ABS_RATE = range(3)
+
+
+class AlarmEvent:
+    """
+    A rule that started to hold.
+
+    Attributes:
+        rule (Rule): The rule that tripped.
+        time (float): Unix timestamp of the first sample where the rule held.
+        value (float): Value of the checked quantity at that time.
+    """
+
+    def __init__(self, rule, time: float, value: float):
+        self.rule = rule
+        self.time = time
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"AlarmEvent({self.rule.name!r}, time={self.time:.3f}, value={self.value:.6g})"
+
+
+class Rule:
+    """
+    Base class of all rules.
+
+    Args:
+        name (str): Name used in events and logs.
+        channel (str): Telemetry channel the rule looks at.
+        op (str): One of '>', '>=', '<', '<='.
+        limit (float): Threshold compared with the checked quantity.
+        duration (float): Seconds the comparison must hold before the rule trips.
+        action (callable): Called with the AlarmEvent when the rule trips.
+    """
+
+    source = _VALUE
+
+    def __init__(self, name: str, channel: str, op: str, limit: float,
+                 duration: float = 0.0, action=None):
+        if op not in _OPERATORS:
+            raise ValueError(f"Unknown comparison operator: {op}")
+        self.name = name
+        self.channel = channel
+        self.op = op
+        self.limit = float(limit)
+        self.duration = float(duration)
+        self.action = action
+
+
+class ThresholdRule(Rule):
+    """
+    Trips as soon as a channel value crosses a limit.
+    """
+
+    def __init__(self, name: str, channel: str, op: str, limit: float, action=None):
+        super().__init__(name, channel, op, limit, 0.0, action)
+
+
+class DurationRule(Rule):
+    """
+    Trips when a channel value stays beyond a limit for at least duration seconds.
+    """
+
+
+class RateRule(Rule):
+    """
+    Trips when the rate of change of a channel, in units per second, crosses a limit.
+    With absolute=True the magnitude of the rate is compared.
+    """
+
+    def __init__(self, name: str, channel: str, op: str, limit: float,
+                 duration: float = 0.0, absolute: bool = False, action=None):
+        super().__init__(name, channel, op, limit, duration, action)
+        self.source = _ABS_RATE if absolute else _RATE
+
+
+def sweep_field_to_zero(interface, lock=None):
+    """
+    Action that starts the "Zero Field" procedure.
+
+    Args:
+        interface (AttoDRYInterface): Connected interface.
+        lock: Lock to hold around the call, e.g. TelemetryPoller.lock.
+    """
+    def action(event):
+        logger.warning("%s tripped, sweeping field to zero", event.rule.name)
+        if lock is None:
+            interface.sweep_field_to_zero()
+        else:
+            with lock:
+                interface.sweep_field_to_zero()
+    return action
+
+
+class AlarmEngine:
+    """
+    Evaluates a fixed set of rules on TelemetryBatch objects.
+
+    Rules latch: an event is emitted when a rule starts to hold, and again only
+    after it has stopped holding at the end of a batch.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._channels = None
+
+    def _compile(self, channels: list) -> None:
+        index = {name: i for i, name in enumerate(channels)}
+        n = len(channels)
+        missing = [r.channel for r in self.rules if r.channel not in index]
+        if missing:
+            raise KeyError(f"Alarm rules use channels that are not polled: {missing}")
+
+        self._channels = list(channels)
+        self._rows = np.array([r.source * n + index[r.channel] for r in self.rules], dtype=np.intp)
+        sign = np.array([_OPERATORS[r.op][0] for r in self.rules])
+        self._sign = sign[:, None]
+        self._offset = (sign * np.array([r.limit for r in self.rules]))[:, None]
+        self._inclusive = np.array([_OPERATORS[r.op][1] for r in self.rules])[:, None]
+        self._duration = np.array([r.duration for r in self.rules])[:, None]
+
+        self._last_time = np.nan
+        self._last_values = np.full(n, np.nan)
+        self._since = np.full(len(self.rules), np.nan)
+        self._active = np.zeros(len(self.rules), dtype=bool)
+
+    @property
+    def active(self) -> list:
+        """
+        Rules that held at the end of the last batch.
+        """
+        if self._channels is None:
+            return []
+        return [rule for rule, on in zip(self.rules, self._active) if on]
+
+    def evaluate(self, batch) -> list:
+        """
+        Checks all rules on a batch and runs the actions of rules that tripped.
+
+        Args:
+            batch (TelemetryBatch): New samples.
+
+        Returns:
+            list: AlarmEvent per rule that tripped in this batch.
+        """
+        if not self.rules or len(batch) == 0:
+            return []
+        if self._channels != batch.channels:
+            self._compile(batch.channels)
+
+        t = batch.times
+        values = np.vstack([batch.values[name] for name in self._channels])
+
+        # Rates use the last sample of the previous batch as left neighbour
+        previous_t = np.concatenate(([self._last_time], t[:-1]))
+        previous_v = np.hstack((self._last_values[:, None], values[:, :-1]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = (values - previous_v) / (t - previous_t)
+        self._last_time = t[-1]
+        self._last_values = values[:, -1]
+        source = np.vstack((values, rates, np.abs(rates)))
+
+        margin = source[self._rows] * self._sign - self._offset
+        holds = (margin > 0) | (self._inclusive & (margin == 0))
+
+        # Start time of the current run of holding samples, carried across batches
+        index = np.arange(len(t))
+        last_miss = np.maximum.accumulate(np.where(holds, -1, index), axis=1)
+        run_start = np.where(last_miss >= 0, t[np.minimum(last_miss + 1, len(t) - 1)],
+                             self._since[:, None])
+        run_start = np.where(holds & np.isnan(run_start), t[0], run_start)
+        tripped = holds & (t - run_start >= self._duration)
+        self._since = np.where(holds[:, -1], run_start[:, -1], np.nan)
+
+        events = []
+        any_trip = tripped.any(axis=1)
+        first = np.argmax(tripped, axis=1)
+        for i in np.flatnonzero(any_trip & ~self._active):
+            rule = self.rules[i]
+            event = AlarmEvent(rule, float(t[first[i]]), float(source[self._rows[i], first[i]]))
+            events.append(event)
+            logger.warning("Alarm %s: %s %s %g", rule.name, rule.channel, rule.op, rule.limit)
+            if rule.action is not None:
+                try:
+                    rule.action(event)
+                except Exception:
+                    logger.exception("Action of alarm %s failed", rule.name)
+        self._active = tripped[:, -1]
+        return events
+
+    __call__ = evaluate
@@ -0,0 +1,234 @@
+"""
+Streaming anomaly detection on heater powers, pressures and the turbopump.
+
+Two detectors run on every sample, vectorized across channels and with constant
+memory per channel:
+
+- A two-sided CUSUM of the deviation from a trained baseline level catches slow
+  drifts, e.g. a reservoir heater working harder because of a leak.
+- An EWMA residual (sample minus the EWMA prediction) catches sudden jumps.
+
+Baselines are trained from historical telemetry with robust statistics. The detector
+is a TelemetryPoller subscriber, so it needs no extra DLL calls:
+
+    baseline = Baseline.from_archive(ArchiveReader("telemetry.adry"), t0=last_month, t1=last_week)
+    detector = AnomalyDetector(baseline, on_anomaly=print)
+    poller.subscribe(detector)
+"""
+
+import json
+import threading
+from collections import deque
+
+import numpy as np
+
+
+CHANNELS = ("reservoir_heater_power", "vti_heater_power", "dump_pressure", "turbopump_frequency")
+
+# Smallest spread per channel in channel units (W, mbar, Hz), about the readout
+# resolution. A channel that was constant during training otherwise gets a spread of
+# zero and every later change of one digit would count as an anomaly.
+RESOLUTION = {
+    "reservoir_heater_power": 1e-4,
+    "vti_heater_power":       1e-4,
+    "dump_pressure":          1e-2,
+    "turbopump_frequency":    1.0,
+}
+
+# Scale factor from the median absolute deviation to the standard deviation
+_MAD_SCALE = 1.4826
+
+
+def _robust_std(x: np.ndarray) -> float:
+    x = x[~np.isnan(x)]
+    if x.size == 0:
+        return np.nan
+    return _MAD_SCALE * float(np.median(np.abs(x - np.median(x))))
+
+
+class Baseline:
+    """
+    Normal level and noise of each channel.
+    """
+
+    def __init__(self, channels, mean, std, noise):
+        """
+        Args:
+            channels (list): Channel names.
+            mean (array_like): Baseline level per channel.
+            std (array_like): Spread of the level per channel.
+            noise (array_like): Sample-to-sample noise per channel.
+        """
+        self.channels = list(channels)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.noise = np.asarray(noise, dtype=np.float64)
+
+    @classmethod
+    def train(cls, values: dict, channels=CHANNELS, min_std: dict = None) -> "Baseline":
+        """
+        Robust baseline from a quiet period of telemetry.
+
+        The level uses the median and MAD, the noise the MAD of first differences,
+        so slow trends and single spikes in the training data do not inflate it.
+        Both are floored at the channel resolution.
+
+        Args:
+            values (dict): Channel name -> np.ndarray of samples.
+            min_std (dict): Channel name -> smallest spread in channel units,
+                            overriding RESOLUTION.
+        """
+        floor = dict(RESOLUTION, **(min_std or {}))
+        channels = [name for name in channels if name in values]
+        mean, std, noise = [], [], []
+        for name in channels:
+            x = np.asarray(values[name], dtype=np.float64)
+            # Channels without a known resolution only avoid a division by zero
+            low = floor.get(name, 1e-12)
+            mean.append(np.nanmedian(x) if np.any(~np.isnan(x)) else np.nan)
+            std.append(max(_robust_std(x), low))
+            noise.append(max(_robust_std(np.diff(x)) / np.sqrt(2), low))
+        return cls(channels, mean, std, noise)
+
+    @classmethod
+    def from_archive(cls, reader, channels=CHANNELS, t0: float = None, t1: float = None) -> "Baseline":
+        channels = [name for name in channels if name in reader.channels]
+        _, values = reader.read(channels, t0, t1)
+        return cls.train(values, channels)
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump({"channels": self.channels, "mean": self.mean.tolist(),
+                       "std": self.std.tolist(), "noise": self.noise.tolist()}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "Baseline":
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls(data["channels"], data["mean"], data["std"], data["noise"])
+
+
+class Anomaly:
+    """
+    One detected anomaly.
+    """
+
+    def __init__(self, t: float, channel: str, kind: str, score: float, value: float):
+        self.time = t
+        self.channel = channel
+        self.kind = kind
+        self.score = score
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"Anomaly({self.channel}, {self.kind}, score={self.score:.2f}, value={self.value:.4g})"
+
+
+class AnomalyDetector:
+    """
+    CUSUM and EWMA residual detectors over the baseline channels.
+
+    Scores are normalised so that 1 is the alarm threshold. An anomaly is emitted
+    when a score crosses 1. A CUSUM re-arms once it has returned to zero, the residual
+    detector once its score fell below one half. The CUSUM is capped at twice the
+    threshold, so it recovers quickly once the channel is back to normal.
+    """
+
+    KINDS = ("drift_up", "drift_down", "jump")
+
+    def __init__(self, baseline: Baseline, k: float = 1.0, h: float = 12.0, lam: float = 0.1,
+                 residual_limit: float = 6.0, on_anomaly=None, history: int = 1000):
+        """
+        Args:
+            baseline (Baseline): Trained baseline.
+            k (float): CUSUM allowance in baseline standard deviations.
+            h (float): CUSUM alarm threshold in baseline standard deviations.
+            lam (float): EWMA smoothing factor of the prediction.
+            residual_limit (float): Residual alarm threshold in residual standard deviations.
+            on_anomaly (callable): Called with each Anomaly.
+            history (int): Number of recent anomalies kept.
+        """
+        self.baseline = baseline
+        self.channels = baseline.channels
+        self.k = k
+        self.h = h
+        self.lam = lam
+        # Standard deviation of the one step EWMA prediction error for white noise
+        self.residual_std = baseline.noise * np.sqrt(2 / (2 - lam))
+        self.residual_limit = residual_limit
+        self.on_anomaly = on_anomaly
+        self.anomalies = deque(maxlen=history)
+
+        n = len(self.channels)
+        self._high = np.zeros(n)
+        self._low = np.zeros(n)
+        self._ewma = np.full(n, np.nan)
+        self._armed = np.ones((n, len(self.KINDS)), dtype=bool)
+        self.scores = np.zeros((n, len(self.KINDS)))
+        self._rearm = np.array([1e-12, 1e-12, 0.5])
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._high[:] = 0.0
+            self._low[:] = 0.0
+            self._ewma[:] = np.nan
+            self._armed[:] = True
+            self.scores[:] = 0.0
+
+    def update(self, times, values: dict) -> list:
+        """
+        Feeds samples of the baseline channels.
+
+        Args:
+            times (np.ndarray): Timestamps of the samples.
+            values (dict): Channel name -> np.ndarray aligned with times. Missing
+                           channels and NaN samples leave the detector state unchanged.
+
+        Returns:
+            list: Anomalies found in these samples.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        nan = np.full(times.size, np.nan)
+        matrix = np.stack([np.asarray(values.get(name, nan), dtype=np.float64) for name in self.channels], axis=1)
+        found = []
+        with self._lock:
+            z_all = (matrix - self.baseline.mean) / self.baseline.std
+            for row in range(times.size):
+                x = matrix[row]
+                present = ~np.isnan(x)
+                z = np.where(present, z_all[row], 0.0)
+
+                cap = 2 * self.h
+                self._high = np.where(present, np.clip(self._high + z - self.k, 0.0, cap), self._high)
+                self._low = np.where(present, np.clip(self._low - z - self.k, 0.0, cap), self._low)
+
+                residual = np.where(present & ~np.isnan(self._ewma), np.abs(x - self._ewma), 0.0)
+                residual /= self.residual_std
+                self._ewma = np.where(np.isnan(self._ewma), x,
+                                      np.where(present, self._ewma + self.lam * (x - self._ewma), self._ewma))
+
+                self.scores[:, 0] = self._high / self.h
+                self.scores[:, 1] = self._low / self.h
+                self.scores[:, 2] = residual / self.residual_limit
+                alarms = (self.scores >= 1.0) & self._armed
+                self._armed = (self._armed & ~alarms) | (self.scores < self._rearm)
+                if not alarms.any():
+                    continue
+
+                for channel, kind in zip(*np.nonzero(alarms)):
+                    anomaly = Anomaly(float(times[row]), self.channels[channel], self.KINDS[kind],
+                                      float(self.scores[channel, kind]), float(x[channel]))
+                    found.append(anomaly)
+                    self.anomalies.append(anomaly)
+
+        if self.on_anomaly is not None:
+            for anomaly in found:
+                self.on_anomaly(anomaly)
+        return found
+
+    def __call__(self, batch) -> None:
+        """
+        Subscriber entry point for TelemetryPoller.
+        """
+        self.update(batch.times, batch.values)
@@ -0,0 +1,474 @@
+"""
+Compact archival format for cryostat telemetry.
+
+Values are quantized per channel to a stated precision, then delta, zigzag and
+varint (LEB128) encoded in blocks of a few thousand samples. Slowly changing
+channels (valve states, setpoints, reservoir tsets, 4K stage temperature) end up
+at about one byte per sample, against ~10 bytes per value in the text logs.
+
+File layout:
+    b"ADRYARC1", uint32 header length, JSON header (channels, precisions)
+    blocks:  b"BLK1", uint32 n, uint32 time bytes, float64 t_first, float64 t_last,
+             uint32 bytes per channel, time payload, channel payloads
+    index:   b"IDX1", uint32 length, JSON list of [offset, n, t_first, t_last, low, high]
+             where low and high are the per-channel minima and maxima (zone maps)
+    trailer: uint64 index offset, b"ADRE"
+
+The index is written by close(). Files of writers that did not close are read by
+scanning the blocks, so a crash only loses the block that was being filled.
+
+    with ArchiveWriter("run.adry", poller.channels) as writer:
+        poller.subscribe(writer)
+        ...
+    times, values = ArchiveReader("run.adry").read(["sample_temperature"])
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+MAGIC = b"ADRYARC1"
+BLOCK_TAG = b"BLK1"
+INDEX_TAG = b"IDX1"
+END_TAG = b"ADRE"
+VERSION = 1
+
+_BLOCK_HEADER = struct.Struct("<4sIIdd")
+_TRAILER = struct.Struct("<Q4s")
+
+# Quantization step per channel, in the channel's unit
+DEFAULT_PRECISION = {
+    "sample_temperature":        1e-4,
+    "user_temperature_setpoint": 1e-4,
+    "vti_temperature":           1e-4,
+    "stage_4k_temperature":      1e-4,
+    "reservoir_temperature":     1e-4,
+    "cryostat_in_pressure":      1e-3,
+    "cryostat_out_pressure":     1e-3,
+    "dump_pressure":             1e-3,
+    "reservoir_heater_power":    1e-5,
+    "vti_heater_power":          1e-5,
+    "sample_heater_power":       1e-6,
+    "heater_output":             1e-2,
+    "magnetic_field_x":          1e-5,
+    "magnetic_field_y":          1e-5,
+    "magnetic_field_z":          1e-5,
+    "turbopump_frequency":       1.0,
+}
+
+# Quantization step of the timestamps in seconds
+TIME_PRECISION = 1e-3
+
+
+def _zigzag(q: np.ndarray) -> np.ndarray:
+    return ((q << 1) ^ (q >> 63)).view(np.uint64)
+
+
+def _unzigzag(u: np.ndarray) -> np.ndarray:
+    return (u >> np.uint64(1)).view(np.int64) ^ -(u & np.uint64(1)).view(np.int64)
+
+
+def varint_encode(values: np.ndarray) -> bytes:
+    """
+    LEB128 encodes unsigned 64 bit integers.
+    """
+    u = np.asarray(values, dtype=np.uint64)
+    if u.size == 0:
+        return b""
+    if u.max() < 0x80:
+        return u.astype(np.uint8).tobytes()
+
+    nbytes = np.ones(u.size, dtype=np.int64)
+    rest = u >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+
+    offsets = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max())):
+        mask = nbytes > k
+        chunk = (u[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = nbytes[mask] > k + 1
+        out[offsets[mask] + k] = chunk.astype(np.uint8) | (more.astype(np.uint8) << 7)
+    return out.tobytes()
+
+
+def varint_decode(data, count: int) -> np.ndarray:
+    """
+    Decodes count LEB128 encoded unsigned integers.
+    """
+    b = np.frombuffer(data, dtype=np.uint8)
+    if b.size == count:
+        return b.astype(np.uint64)
+
+    ends = np.flatnonzero(b < 0x80)
+    if ends.size != count:
+        raise ValueError("Corrupt varint payload")
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shift = np.arange(b.size, dtype=np.uint64) - np.repeat(starts, ends - starts + 1).astype(np.uint64)
+    parts = (b & 0x7F).astype(np.uint64) << (shift * np.uint64(7))
+    # The 7 bit groups do not overlap, so the sum equals the bitwise or
+    return np.add.reduceat(parts, starts)
+
+
+def _encode_column(values: np.ndarray, precision: float) -> bytes:
+    """
+    Encodes one channel of a block: NaN flag/bitmap, then varint zigzag deltas.
+    """
+    nan = np.isnan(values)
+    if nan.any():
+        head = b"\x01" + np.packbits(nan).tobytes()
+        values = values.copy()
+        valid = np.flatnonzero(~nan)
+        if valid.size == 0:
+            values[:] = 0.0
+        else:
+            # Repeat the previous valid value, so NaNs cost a zero delta
+            fill = np.maximum.accumulate(np.where(nan, 0, np.arange(values.size)))
+            fill[:valid[0]] = valid[0]
+            values = values[fill]
+    else:
+        head = b"\x00"
+    q = np.rint(values / precision).astype(np.int64)
+    deltas = np.diff(q, prepend=np.int64(0))
+    return head + varint_encode(_zigzag(deltas))
+
+
+def _decode_column(payload, count: int, precision: float) -> np.ndarray:
+    view = memoryview(payload)
+    offset = 1
+    nan = None
+    if view[0] == 1:
+        nbytes = (count + 7) // 8
+        nan = np.unpackbits(np.frombuffer(view[1:1 + nbytes], dtype=np.uint8), count=count).astype(bool)
+        offset += nbytes
+    q = np.cumsum(_unzigzag(varint_decode(view[offset:], count)))
+    values = q * precision
+    if nan is not None:
+        values[nan] = np.nan
+    return values
+
+
+class BlockInfo:
+    """
+    Location, time range and zone map of one block.
+
+    low and high hold the minimum and maximum of each channel (NaN if the channel has
+    no values in the block), or are None for blocks of archives without zone maps.
+    """
+
+    def __init__(self, offset: int, count: int, t_first: float, t_last: float,
+                 low=None, high=None):
+        self.offset = offset
+        self.count = count
+        self.t_first = t_first
+        self.t_last = t_last
+        self.low = None if low is None else np.array(low, dtype=np.float64)
+        self.high = None if high is None else np.array(high, dtype=np.float64)
+
+
+def _zone_list(values: np.ndarray) -> list:
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+class ArchiveWriter:
+    """
+    Streaming writer. Samples are buffered and written one block at a time.
+    """
+
+    def __init__(self, path: str, channels, precision: dict = None, block_size: int = 4096,
+                 time_precision: float = TIME_PRECISION):
+        """
+        Args:
+            path (str): File to create.
+            channels (list): Channel names, in the order stored.
+            precision (dict): Quantization step per channel, overriding DEFAULT_PRECISION.
+            block_size (int): Samples per block.
+            time_precision (float): Quantization step of the timestamps in seconds.
+        """
+        self.channels = list(channels)
+        precision = dict(precision or {})
+        self.precision = [float(precision.get(c, DEFAULT_PRECISION.get(c, 1e-6))) for c in self.channels]
+        self.block_size = block_size
+        self.time_precision = time_precision
+        self.blocks = []
+
+        self._file = open(path, 'wb')
+        header = json.dumps({
+            "version": VERSION,
+            "channels": self.channels,
+            "precision": self.precision,
+            "time_precision": time_precision,
+        }).encode('utf-8')
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self._times = []
+        self._rows = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def append(self, times, values: dict) -> None:
+        """
+        Adds samples. Channels missing from values are stored as NaN.
+
+        Args:
+            times (np.ndarray): Increasing Unix timestamps in seconds.
+            values (dict): Channel name -> np.ndarray aligned with times.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        rows = np.full((len(self.channels), times.size), np.nan)
+        for i, name in enumerate(self.channels):
+            if name in values:
+                rows[i] = values[name]
+        with self._lock:
+            self._times.append(times)
+            self._rows.append(rows)
+            self._pending += times.size
+            while self._pending >= self.block_size:
+                self._write_block(self.block_size)
+
+    def __call__(self, batch) -> None:
+        """
+        Subscriber entry point for TelemetryPoller.
+        """
+        self.append(batch.times, batch.values)
+
+    def _write_block(self, count: int) -> None:
+        times = np.concatenate(self._times)
+        rows = np.hstack(self._rows)
+        self._times = [times[count:]]
+        self._rows = [rows[:, count:]]
+        self._pending -= count
+        times, rows = times[:count], rows[:, :count]
+
+        ticks = np.rint((times - times[0]) / self.time_precision).astype(np.int64)
+        time_payload = varint_encode(_zigzag(np.diff(ticks, prepend=np.int64(0))))
+        payloads = [_encode_column(rows[i], p) for i, p in enumerate(self.precision)]
+
+        # Zone map of the values as they decode, so it bounds what readers see
+        precision = np.array(self.precision)[:, None]
+        quantized = np.rint(rows / precision) * precision
+        low = np.fmin.reduce(quantized, axis=1)
+        high = np.fmax.reduce(quantized, axis=1)
+
+        offset = self._file.tell()
+        self._file.write(_BLOCK_HEADER.pack(BLOCK_TAG, count, len(time_payload), times[0], times[-1]))
+        self._file.write(struct.pack(f"<{len(payloads)}I", *(len(p) for p in payloads)))
+        self._file.write(time_payload)
+        for payload in payloads:
+            self._file.write(payload)
+        self.blocks.append(BlockInfo(offset, count, float(times[0]), float(times[-1]), low, high))
+
+    def flush(self) -> None:
+        """
+        Writes the pending samples as a (short) block and flushes the file.
+        """
+        with self._lock:
+            if self._pending:
+                self._write_block(self._pending)
+            self._file.flush()
+
+    def close(self) -> None:
+        """
+        Writes the remaining samples and the block index, then closes the file.
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        index = json.dumps([[b.offset, b.count, b.t_first, b.t_last, _zone_list(b.low), _zone_list(b.high)]
+                            for b in self.blocks]).encode('utf-8')
+        offset = self._file.tell()
+        self._file.write(INDEX_TAG + struct.pack("<I", len(index)) + index)
+        self._file.write(_TRAILER.pack(offset, END_TAG))
+        self._file.close()
+
+
+class ArchiveReader:
+    """
+    Reader that decodes blocks in parallel threads. NumPy releases the GIL in the
+    decoding kernels, so blocks are decoded concurrently.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        data = self._data
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not an attoDRY telemetry archive: {path}")
+        (length,) = struct.unpack_from("<I", data, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(data[start:start + length]))
+        self._data_start = start + length
+        self.channels = header["channels"]
+        self.precision = header["precision"]
+        self.time_precision = header["time_precision"]
+        self.blocks = self._read_index()
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _read_index(self) -> list:
+        data = self._data
+        if len(data) >= _TRAILER.size:
+            offset, tag = _TRAILER.unpack_from(data, len(data) - _TRAILER.size)
+            if tag == END_TAG and data[offset:offset + 4] == INDEX_TAG:
+                (length,) = struct.unpack_from("<I", data, offset + 4)
+                entries = json.loads(bytes(data[offset + 8:offset + 8 + length]))
+                return [BlockInfo(*entry[:4], *[[np.nan if v is None else v for v in zone]
+                                                for zone in entry[4:]])
+                        for entry in entries]
+        return self._scan_blocks()
+
+    def _scan_blocks(self) -> list:
+        """
+        Walks the blocks of a file without index, stopping at a truncated block.
+        """
+        data = self._data
+        blocks = []
+        offset = self._data_start
+        table = struct.Struct(f"<{len(self.channels)}I")
+        while offset + _BLOCK_HEADER.size + table.size <= len(data):
+            tag, count, time_bytes, t_first, t_last = _BLOCK_HEADER.unpack_from(data, offset)
+            if tag != BLOCK_TAG:
+                break
+            sizes = table.unpack_from(data, offset + _BLOCK_HEADER.size)
+            end = offset + _BLOCK_HEADER.size + table.size + time_bytes + sum(sizes)
+            if end > len(data):
+                break
+            blocks.append(BlockInfo(offset, count, t_first, t_last))
+            offset = end
+        return blocks
+
+    def decode_block(self, block: BlockInfo, channels=None) -> tuple:
+        """
+        Decodes one block.
+
+        Returns:
+            tuple: (times, dict of channel name -> values)
+        """
+        channels = self.channels if channels is None else channels
+        data = self._data
+        tag, count, time_bytes, t_first, _ = _BLOCK_HEADER.unpack_from(data, block.offset)
+        table = struct.Struct(f"<{len(self.channels)}I")
+        sizes = table.unpack_from(data, block.offset + _BLOCK_HEADER.size)
+        start = block.offset + _BLOCK_HEADER.size + table.size
+
+        view = memoryview(data)
+        ticks = np.cumsum(_unzigzag(varint_decode(view[start:start + time_bytes], count)))
+        times = t_first + ticks * self.time_precision
+
+        offsets = np.concatenate(([start + time_bytes], start + time_bytes + np.cumsum(sizes)))
+        values = {}
+        for name in channels:
+            i = self.channels.index(name)
+            values[name] = _decode_column(view[offsets[i]:offsets[i + 1]], count, self.precision[i])
+        return times, values
+
+    def iter_blocks(self, channels=None, t0: float = None, t1: float = None):
+        """
+        Yields (times, values) per block overlapping [t0, t1], decoding one at a time.
+        """
+        for block in self.select_blocks(t0, t1):
+            yield self.decode_block(block, channels)
+
+    def select_blocks(self, t0: float = None, t1: float = None) -> list:
+        return [b for b in self.blocks
+                if (t0 is None or b.t_last >= t0) and (t1 is None or b.t_first <= t1)]
+
+    def zone_maps(self, workers: int = None, cache: bool = True) -> tuple:
+        """
+        Per-block minima and maxima of all channels.
+
+        Blocks without a zone map in the index (older archives, files recovered by
+        scanning) are decoded once. With cache, their zone maps are kept in a
+        "<path>.zones.npz" file next to the archive for the next reader.
+
+        Returns:
+            tuple: (low, high) arrays of shape (blocks, channels).
+        """
+        missing = [b for b in self.blocks if b.low is None]
+        sidecar = self.path + ".zones.npz"
+        if missing and cache and os.path.isfile(sidecar):
+            with np.load(sidecar) as zones:
+                known = {int(o): i for i, o in enumerate(zones["offsets"])}
+                for block in missing:
+                    i = known.get(block.offset)
+                    if i is not None:
+                        block.low, block.high = zones["low"][i], zones["high"][i]
+            missing = [b for b in missing if b.low is None]
+
+        if missing:
+            def compute(block):
+                _, values = self.decode_block(block)
+                columns = np.stack([values[name] for name in self.channels])
+                block.low = np.fmin.reduce(columns, axis=1)
+                block.high = np.fmax.reduce(columns, axis=1)
+
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+                list(pool.map(compute, missing))
+            computed = [b for b in self.blocks if b.low is not None]
+            if cache and computed:
+                try:
+                    np.savez(sidecar, offsets=np.array([b.offset for b in computed]),
+                             low=np.stack([b.low for b in computed]),
+                             high=np.stack([b.high for b in computed]))
+                except OSError:
+                    pass
+
+        n = len(self.channels)
+        low = np.stack([b.low for b in self.blocks]) if self.blocks else np.empty((0, n))
+        high = np.stack([b.high for b in self.blocks]) if self.blocks else np.empty((0, n))
+        return low, high
+
+    def read(self, channels=None, t0: float = None, t1: float = None, workers: int = None) -> tuple:
+        """
+        Decodes all samples between t0 and t1.
+
+        Args:
+            channels (list): Channels to decode, all if None.
+            t0, t1 (float): Time range in Unix seconds, open ended if None.
+            workers (int): Decoding threads, defaults to the number of CPUs.
+
+        Returns:
+            tuple: (times, dict of channel name -> values)
+        """
+        channels = self.channels if channels is None else list(channels)
+        blocks = self.select_blocks(t0, t1)
+        if not blocks:
+            return np.empty(0), {name: np.empty(0) for name in channels}
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            parts = list(pool.map(lambda b: self.decode_block(b, channels), blocks))
+
+        times = np.concatenate([p[0] for p in parts])
+        values = {name: np.concatenate([p[1][name] for p in parts]) for name in channels}
+        if t0 is not None or t1 is not None:
+            lo = 0 if t0 is None else np.searchsorted(times, t0, side='left')
+            hi = times.size if t1 is None else np.searchsorted(times, t1, side='right')
+            times = times[lo:hi]
+            values = {name: column[lo:hi] for name, column in values.items()}
+        return times, values
@@ -0,0 +1,130 @@
+"""
+As-of join of telemetry onto timestamps of measurements from other instruments.
+
+All telemetry channels share one time column, so the bracketing samples of every
+measurement timestamp are found once with np.searchsorted and reused for each
+channel. Values are the last sample before the timestamp (as of), the nearest sample
+or a linear interpolation, with flags for timestamps outside the recording and for
+samples older than a tolerance:
+
+    times, values = ArchiveReader("telemetry.adry").read(["sample_temperature", "magnetic_field_z"])
+    joined = asof_join(times, values, measurement_times, method="linear", tolerance=5.0)
+    joined.values["sample_temperature"][joined.stale] = np.nan
+"""
+
+import numpy as np
+
+
+METHODS = ("previous", "nearest", "linear")
+
+
+class AsOfResult:
+    """
+    Joined values and quality flags, all aligned with the query timestamps.
+
+    Attributes:
+        values (dict): Channel name -> np.ndarray of joined values.
+        staleness (np.ndarray): Seconds between each timestamp and the farthest
+                                sample used for its value.
+        stale (np.ndarray): staleness exceeds the tolerance.
+        outside (np.ndarray): Timestamp lies before the first or after the last sample.
+    """
+
+    def __init__(self, values: dict, staleness: np.ndarray, stale: np.ndarray, outside: np.ndarray):
+        self.values = values
+        self.staleness = staleness
+        self.stale = stale
+        self.outside = outside
+
+    def __getitem__(self, channel: str) -> np.ndarray:
+        return self.values[channel]
+
+    @property
+    def valid(self) -> np.ndarray:
+        return ~(self.stale | self.outside)
+
+
+def asof_join(times, values: dict, query_times, method: str = "previous", tolerance: float = None,
+              mask: bool = False) -> AsOfResult:
+    """
+    Looks up telemetry values at arbitrary timestamps.
+
+    Args:
+        times (np.ndarray): Increasing telemetry timestamps in seconds.
+        values (dict): Channel name -> np.ndarray aligned with times.
+        query_times (array_like): Timestamps to join onto, in any order.
+        method (str): "previous" takes the last sample at or before each timestamp,
+                      "nearest" the closest sample, "linear" interpolates between
+                      the two bracketing samples.
+        tolerance (float): Largest allowed staleness in seconds, no limit if None.
+        mask (bool): Replace stale and outside values with NaN.
+
+    Returns:
+        AsOfResult: Joined values and flags.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method!r}")
+    times = np.asarray(times, dtype=np.float64)
+    query = np.asarray(query_times, dtype=np.float64)
+    n = times.size
+    if n == 0:
+        nan = np.full(query.shape, np.nan)
+        flags = np.ones(query.shape, dtype=bool)
+        return AsOfResult({name: nan.copy() for name in values}, np.full(query.shape, np.inf), flags, flags)
+
+    # Index of the last sample at or before each timestamp, and the one after it
+    right = np.searchsorted(times, query, side='right')
+    before = np.clip(right - 1, 0, n - 1)
+    after = np.clip(right, 0, n - 1)
+    outside = (right == 0) | (query > times[-1])
+    dt_before = np.abs(query - times[before])
+    dt_after = np.abs(times[after] - query)
+
+    if method == "previous":
+        staleness = np.where(right == 0, dt_after, dt_before)
+        index = before
+    elif method == "nearest":
+        use_after = dt_after < dt_before
+        index = np.where(use_after, after, before)
+        staleness = np.minimum(dt_before, dt_after)
+    else:
+        staleness = np.maximum(dt_before, dt_after)
+        span = times[after] - times[before]
+        weight = np.divide(query - times[before], span, out=np.zeros_like(query), where=span > 0)
+        weight = np.clip(weight, 0.0, 1.0)
+
+    stale = staleness > tolerance if tolerance is not None else np.zeros(query.shape, dtype=bool)
+    invalid = stale | outside
+
+    joined = {}
+    for name, column in values.items():
+        column = np.asarray(column, dtype=np.float64)
+        if method == "linear":
+            low = column[before]
+            result = low + weight * (column[after] - low)
+        else:
+            result = column[index]
+        if mask:
+            result[invalid] = np.nan
+        joined[name] = result
+    return AsOfResult(joined, staleness, stale, outside)
+
+
+def join_archive(reader, query_times, channels=None, method: str = "previous",
+                 tolerance: float = None, margin: float = 60.0, mask: bool = False) -> AsOfResult:
+    """
+    As-of join against an ArchiveReader, decoding only the blocks around the timestamps.
+
+    Args:
+        reader (ArchiveReader): Telemetry archive.
+        query_times (array_like): Timestamps to join onto.
+        channels (list): Channels to join, all if None.
+        margin (float): Seconds of telemetry read beyond the first and last timestamp,
+                        so the bracketing samples are included.
+    """
+    query = np.asarray(query_times, dtype=np.float64)
+    if query.size == 0:
+        return asof_join(np.empty(0), {name: np.empty(0) for name in channels or reader.channels},
+                         query, method, tolerance, mask)
+    times, values = reader.read(channels, query.min() - margin, query.max() + margin)
+    return asof_join(times, values, query, method, tolerance, mask)
@@ -0,0 +1,497 @@
+"""
+Offline handling of temperature sensor calibration curves.
+
+download_temp_sensor_calibration_curve and download_sample_temp_sensor_calibration_curve
+save curves in the Lake Shore .crv/.340 text format used by the temperature monitor.
+This module parses those files back and converts raw sensor readings to temperature
+with a precomputed dense lookup table, so large NumPy arrays can be converted without
+calling into the DLL.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+
+# Data Format field of the curve header
+FORMAT_MV_K      = 1
+FORMAT_V_K       = 2
+FORMAT_OHM_K     = 3
+FORMAT_LOG_OHM_K = 4
+
+# Number of entries in the dense lookup table built from the breakpoints
+TABLE_SIZE = 1 << 16
+
+# Slot name used for the sample temperature sensor, user curves use 1 to 8
+SAMPLE_SLOT = "sample"
+
+
+def _pchip_slopes(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Fritsch-Carlson slopes for a monotone piecewise cubic Hermite interpolant.
+
+    Args:
+        x (np.ndarray): Strictly increasing breakpoints.
+        y (np.ndarray): Values at the breakpoints.
+
+    Returns:
+        np.ndarray: Derivative at each breakpoint.
+    """
+    h = np.diff(x)
+    delta = np.diff(y) / h
+    slopes = np.zeros_like(y)
+    if len(x) == 2:
+        slopes[:] = delta[0]
+        return slopes
+
+    # Interior points, weighted harmonic mean where the secant slopes agree in sign
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    same_sign = (delta[:-1] * delta[1:]) > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+    slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+
+    # One-sided three point end conditions, clipped to keep the curve monotone
+    for end, (h0, h1, d0, d1) in ((0, (h[0], h[1], delta[0], delta[1])),
+                                  (-1, (h[-1], h[-2], delta[-1], delta[-2]))):
+        d = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+        if np.sign(d) != np.sign(d0):
+            d = 0.0
+        elif np.sign(d0) != np.sign(d1) and abs(d) > abs(3 * d0):
+            d = 3 * d0
+        slopes[end] = d
+    return slopes
+
+
+class CalibrationCurve:
+    """
+    Parsed calibration curve with a dense lookup table for fast conversion.
+
+    The breakpoints are interpolated with a monotone cubic (PCHIP) and sampled on a
+    uniform grid of TABLE_SIZE points in sensor units. Conversion is then a single
+    index computation plus a linear blend between neighbouring table entries.
+    """
+
+    def __init__(self, units: np.ndarray, temperatures: np.ndarray, header: dict = None):
+        """
+        Build the lookup table from the curve breakpoints.
+
+        Args:
+            units (np.ndarray): Sensor readings of the breakpoints, in the units given by
+                                the Data Format header (log10 Ohm for format 4).
+            temperatures (np.ndarray): Temperatures of the breakpoints in Kelvin.
+            header (dict): Header fields of the curve file.
+        """
+        units = np.asarray(units, dtype=np.float64)
+        temperatures = np.asarray(temperatures, dtype=np.float64)
+        if units.shape != temperatures.shape or units.size < 2:
+            raise ValueError("Calibration curve needs at least two breakpoints")
+
+        order = np.argsort(units, kind='stable')
+        units = units[order]
+        temperatures = temperatures[order]
+        if np.any(np.diff(units) <= 0):
+            raise ValueError("Calibration curve has duplicate sensor unit breakpoints")
+
+        self.header = dict(header or {})
+        self.units = units
+        self.temperatures = temperatures
+        self.data_format = int(self.header.get("data_format", FORMAT_OHM_K))
+        self._build_table()
+
+    def _build_table(self) -> None:
+        """
+        Samples the monotone interpolant on a uniform grid over the breakpoint range.
+        """
+        x, y = self.units, self.temperatures
+        grid = np.linspace(x[0], x[-1], TABLE_SIZE)
+        slopes = _pchip_slopes(x, y)
+
+        i = np.clip(np.searchsorted(x, grid, side='right') - 1, 0, len(x) - 2)
+        h = x[i + 1] - x[i]
+        s = (grid - x[i]) / h
+        h00 = (1 + 2 * s) * (1 - s) ** 2
+        h10 = s * (1 - s) ** 2
+        h01 = s * s * (3 - 2 * s)
+        h11 = s * s * (s - 1)
+        table = h00 * y[i] + h10 * h * slopes[i] + h01 * y[i + 1] + h11 * h * slopes[i + 1]
+
+        self._x0 = grid[0]
+        self._scale = (TABLE_SIZE - 1) / (grid[-1] - grid[0])
+        self._table = table
+        # Per-entry slope so the conversion needs a single gather per lookup table
+        self._step = np.append(np.diff(table), 0.0)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Hash of the breakpoint table, independent of file formatting or header text.
+        """
+        digest = hashlib.sha256()
+        digest.update(np.round(self.units, 6).tobytes())
+        digest.update(np.round(self.temperatures, 6).tobytes())
+        return digest.hexdigest()
+
+    def to_temperature(self, readings, out: np.ndarray = None) -> np.ndarray:
+        """
+        Converts raw sensor readings to temperature.
+
+        Readings outside the curve range are clamped to the end points of the curve.
+        NaN readings, and readings <= 0 on a log Ohm curve, give NaN.
+
+        Args:
+            readings (array_like): Raw readings in mV, V or Ohm depending on the curve.
+                                   For log Ohm curves the readings are given in Ohm.
+            out (np.ndarray): Optional float64 output array of the same shape.
+
+        Returns:
+            np.ndarray: Temperatures in Kelvin.
+        """
+        x = np.asarray(readings, dtype=np.float64)
+        if self.data_format == FORMAT_LOG_OHM_K:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x = np.log10(x)
+
+        pos = np.subtract(x, self._x0, out=np.empty(x.shape))
+        pos *= self._scale
+        # A failed read must not break the conversion of the other samples
+        bad = ~np.isfinite(pos)
+        pos[bad] = 0.0
+        np.clip(pos, 0, TABLE_SIZE - 1, out=pos)
+        idx = pos.astype(np.intp)
+        pos -= idx
+
+        result = np.take(self._step, idx, out=np.empty(x.shape))
+        result *= pos
+        result += np.take(self._table, idx)
+        result[bad] = np.nan
+        if out is not None:
+            out[...] = result
+            return out
+        return result
+
+    __call__ = to_temperature
+
+
+def parse_curve_text(text: str) -> CalibrationCurve:
+    """
+    Parses the contents of a calibration curve file.
+
+    The header consists of 'Key: value' lines (Sensor Model, Serial Number,
+    Data Format, SetPoint Limit, Temperature coefficient, Number of Breakpoints).
+    Data lines contain either 'No. Units Temperature' or 'Units Temperature'.
+
+    Args:
+        text (str): File contents.
+
+    Returns:
+        CalibrationCurve: The parsed curve.
+    """
+    header = {}
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if ':' in line:
+            key, _, value = line.partition(':')
+            key = key.strip().lower().replace(' ', '_').replace('.', '')
+            header[key] = value.strip()
+            continue
+        fields = line.replace(',', ' ').split()
+        try:
+            numbers = [float(f) for f in fields]
+        except ValueError:
+            # Column title line such as 'No.  Units  Temperature (K)'
+            continue
+        if len(numbers) >= 3:
+            rows.append(numbers[1:3])
+        elif len(numbers) == 2:
+            rows.append(numbers)
+
+    if "data_format" in header:
+        header["data_format"] = int(header["data_format"].split()[0])
+    if not rows:
+        raise ValueError("No calibration breakpoints found")
+
+    data = np.array(rows, dtype=np.float64)
+    return CalibrationCurve(data[:, 0], data[:, 1], header)
+
+
+_curve_cache = {}
+_curve_cache_lock = threading.Lock()
+
+
+def load_calibration_curve(path: str) -> CalibrationCurve:
+    """
+    Loads a downloaded calibration curve file.
+
+    Parsed curves are memoized by the SHA-256 of the file contents, so repeated
+    analysis jobs on the same curve only parse and build the table once.
+
+    Args:
+        path (str): Path of the file written by one of the download functions.
+
+    Returns:
+        CalibrationCurve: The parsed curve.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    key = hashlib.sha256(raw).hexdigest()
+
+    with _curve_cache_lock:
+        curve = _curve_cache.get(key)
+    if curve is None:
+        curve = parse_curve_text(raw.decode('utf-8', errors='replace'))
+        with _curve_cache_lock:
+            curve = _curve_cache.setdefault(key, curve)
+    return curve
+
+
+def clear_curve_cache() -> None:
+    """
+    Drops all memoized curves.
+    """
+    with _curve_cache_lock:
+        _curve_cache.clear()
+
+
+def _wait_for_file(path: str, timeout: float, poll: float = 0.2) -> None:
+    """
+    Waits until a file written by the server exists and its size stopped changing.
+
+    The download functions only start the transfer, so the file appears some time
+    after the call returns.
+    """
+    deadline = time.monotonic() + timeout
+    last_size = -1
+    while time.monotonic() < deadline:
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+            if size > 0 and size == last_size:
+                return
+            last_size = size
+        time.sleep(poll)
+    raise TimeoutError(f"Calibration curve download did not finish: {path}")
+
+
+class CurveSyncReport:
+    """
+    Result of CalibrationCurveManager.sync.
+
+    Attributes:
+        actions (list): (slot, action, seconds) per requested slot, where action is
+                        'skipped', 'verified' or 'uploaded'.
+        elapsed (float): Wall time of the sync in seconds.
+        time_saved (float): Estimated seconds saved by the uploads that were skipped.
+    """
+
+    def __init__(self):
+        self.actions = []
+        self.elapsed = 0.0
+        self.time_saved = 0.0
+
+    @property
+    def uploaded(self) -> list:
+        return [slot for slot, action, _ in self.actions if action == 'uploaded']
+
+    def __str__(self) -> str:
+        lines = [f"slot {slot}: {action} ({seconds:.1f} s)" for slot, action, seconds in self.actions]
+        lines.append(f"total {self.elapsed:.1f} s, estimated {self.time_saved:.1f} s saved")
+        return "\n".join(lines)
+
+
+class CalibrationCurveManager:
+    """
+    Keeps track of which calibration curve is on each user curve slot.
+
+    A content-addressed cache directory holds a copy of every curve that was uploaded
+    or downloaded, named by the curve fingerprint, and a small JSON state file maps each
+    slot to the fingerprint last seen on the device. sync() then only uploads slots
+    whose wanted curve differs from the recorded one and only downloads a slot when
+    nothing is known about it.
+    """
+
+    # Upload time assumed before the first upload has been measured
+    DEFAULT_UPLOAD_SECONDS = 60.0
+
+    def __init__(self, interface, cache_dir: str, download_timeout: float = 300.0,
+                 upload_timeout: float = 600.0, upload_poll: float = 5.0):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface used for the transfers.
+            cache_dir (str): Directory for the curve cache and slot state.
+            download_timeout (float): Seconds to wait for a download to appear on disk.
+            upload_timeout (float): Seconds to wait until an uploaded curve reads back.
+            upload_poll (float): Seconds between read backs of an uploading slot.
+        """
+        self._ad = interface
+        self._download_timeout = download_timeout
+        self._upload_timeout = upload_timeout
+        self._upload_poll = upload_poll
+        self.cache_dir = cache_dir
+        self._objects = os.path.join(cache_dir, "objects")
+        self._state_path = os.path.join(cache_dir, "slots.json")
+        os.makedirs(self._objects, exist_ok=True)
+        self._state = {"slots": {}, "upload_seconds": None, "download_seconds": None}
+        if os.path.isfile(self._state_path):
+            with open(self._state_path, 'r') as f:
+                self._state.update(json.load(f))
+
+    def _save_state(self) -> None:
+        tmp = self._state_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp, self._state_path)
+
+    def _record_duration(self, key: str, seconds: float) -> None:
+        previous = self._state.get(key)
+        self._state[key] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+
+    def _store(self, path: str) -> str:
+        """
+        Copies a curve file into the cache and returns its fingerprint.
+        """
+        fingerprint = load_calibration_curve(path).fingerprint
+        target = os.path.join(self._objects, fingerprint + ".crv")
+        if not os.path.isfile(target):
+            shutil.copyfile(path, target)
+        return fingerprint
+
+    def cached_path(self, fingerprint: str) -> str:
+        """
+        Path of a cached curve file, given its fingerprint.
+        """
+        return os.path.join(self._objects, fingerprint + ".crv")
+
+    def known_fingerprint(self, slot) -> str:
+        """
+        Fingerprint recorded for a slot, or None if the slot content is unknown.
+        """
+        return self._state["slots"].get(str(slot))
+
+    def invalidate(self, slot=None) -> None:
+        """
+        Forgets what is on one slot, or on all slots if slot is None. Use this after
+        curves were changed outside of this manager, e.g. from the touch screen.
+        """
+        if slot is None:
+            self._state["slots"].clear()
+        else:
+            self._state["slots"].pop(str(slot), None)
+        self._save_state()
+
+    def _read_back(self, slot) -> str:
+        """
+        Downloads the curve on a slot into the cache without recording it.
+
+        Returns:
+            str: Fingerprint of the curve on the device.
+        """
+        target = os.path.join(self._objects, f"download_{slot}.tmp")
+        if os.path.exists(target):
+            os.remove(target)
+        if str(slot) == SAMPLE_SLOT:
+            self._ad.download_sample_temp_sensor_calibration_curve(target)
+        else:
+            self._ad.download_temp_sensor_calibration_curve(int(slot), target)
+        _wait_for_file(target, self._download_timeout)
+        fingerprint = self._store(target)
+        os.remove(target)
+        return fingerprint
+
+    def download(self, slot) -> str:
+        """
+        Downloads the curve on a slot into the cache and records its fingerprint.
+
+        Args:
+            slot (int | str): User curve number (1 to 8) or SAMPLE_SLOT.
+
+        Returns:
+            str: Fingerprint of the curve on the device.
+        """
+        start = time.monotonic()
+        fingerprint = self._read_back(slot)
+        self._record_duration("download_seconds", time.monotonic() - start)
+        self._state["slots"][str(slot)] = fingerprint
+        self._save_state()
+        return fingerprint
+
+    def upload(self, slot, path: str) -> str:
+        """
+        Uploads a curve file to a slot and records its fingerprint.
+
+        The upload functions only start the transfer and there is no status to poll,
+        so the slot is read back until it holds the new curve. Only then is the
+        fingerprint recorded, and the whole transfer is timed.
+
+        Args:
+            slot (int | str): User curve number (1 to 8) or SAMPLE_SLOT.
+            path (str): Path of the .crv file to upload.
+
+        Returns:
+            str: Fingerprint of the uploaded curve.
+
+        Raises:
+            TimeoutError: If the slot does not hold the curve within upload_timeout.
+        """
+        fingerprint = self._store(path)
+        start = time.monotonic()
+        if str(slot) == SAMPLE_SLOT:
+            self._ad.upload_sample_temperature_calibration_curve(path)
+        else:
+            self._ad.upload_temperature_calibration_curve(int(slot), path)
+
+        deadline = start + self._upload_timeout
+        while True:
+            time.sleep(self._upload_poll)
+            if self._read_back(slot) == fingerprint:
+                break
+            if time.monotonic() > deadline:
+                # The slot content is unknown now
+                self.invalidate(slot)
+                raise TimeoutError(f"Calibration curve upload to slot {slot} did not finish: {path}")
+        self._record_duration("upload_seconds", time.monotonic() - start)
+
+        self._state["slots"][str(slot)] = fingerprint
+        self._save_state()
+        return fingerprint
+
+    def sync(self, curves: dict, verify: bool = False) -> CurveSyncReport:
+        """
+        Makes the device slots hold the given curves, transferring as little as possible.
+
+        Args:
+            curves (dict): Mapping of slot (1 to 8 or SAMPLE_SLOT) to local .crv path.
+            verify (bool): Download slots even if their content is already recorded.
+
+        Returns:
+            CurveSyncReport: What was done per slot and the estimated time saved.
+        """
+        report = CurveSyncReport()
+        start = time.monotonic()
+        upload_estimate = self._state.get("upload_seconds") or self.DEFAULT_UPLOAD_SECONDS
+
+        for slot, path in curves.items():
+            slot_start = time.monotonic()
+            wanted = load_calibration_curve(path).fingerprint
+            known = self.known_fingerprint(slot)
+            action = 'skipped'
+            if known is None or verify:
+                known = self.download(slot)
+                action = 'verified'
+            if known != wanted:
+                self.upload(slot, path)
+                action = 'uploaded'
+            else:
+                report.time_saved += upload_estimate
+            report.actions.append((slot, action, time.monotonic() - slot_start))
+
+        report.elapsed = time.monotonic() - start
+        return report
@@ -0,0 +1,119 @@
+"""
+Per-model capabilities of AttoDRYInterface.
+
+The wrapper mixes functions that only exist on some cryostats: the Cryostat In/Out
+and Dump valves and pressures are attoDRY2100 only, the turbopump, Pump800 and
+Helium800 functions (get_pressure, get_valve_status, toggle_valve,
+get_turbopump_frequency) attoDRY800 only. On other models the DLL returns
+meaningless values for them. begin(device) selects the capabilities of the model;
+unsupported methods then raise UnsupportedFunctionError without calling the DLL,
+and pollers only read the channels the model has:
+
+    AD.begin(AttoDRYInterface.ATTODRY2100)
+    AD.capabilities.supports("get_turbopump_frequency")   # False
+    TelemetryPoller(AD).channels                          # without turbopump_frequency
+"""
+
+from Attodry_errors import UnsupportedFunctionError
+
+
+# Device identifiers passed to begin()
+ATTODRY1100 = 0
+ATTODRY2100 = 1
+ATTODRY800 = 2
+
+MODELS = {
+    ATTODRY1100: "attoDRY1100",
+    ATTODRY2100: "attoDRY2100",
+    ATTODRY800:  "attoDRY800",
+}
+
+# AttoDRYInterface method -> models that support it; methods not listed work on all models
+MODEL_ONLY = {
+    "toggle_cryostat_in_valve":     (ATTODRY2100,),
+    "toggle_cryostat_out_valve":    (ATTODRY2100,),
+    "toggle_dump_in_valve":         (ATTODRY2100,),
+    "toggle_dump_out_valve":        (ATTODRY2100,),
+    "get_cryostat_in_valve_status": (ATTODRY2100,),
+    "get_cryostat_out_valve_status": (ATTODRY2100,),
+    "get_dump_in_valve_status":     (ATTODRY2100,),
+    "get_dump_out_valve_status":    (ATTODRY2100,),
+    "get_cryostat_in_pressure":     (ATTODRY2100,),
+    "get_cryostat_out_pressure":    (ATTODRY2100,),
+    "get_dump_pressure":            (ATTODRY2100,),
+    "get_pressure":                 (ATTODRY800,),
+    "get_valve_status":             (ATTODRY800,),
+    "toggle_valve":                 (ATTODRY800,),
+    "get_turbopump_frequency":      (ATTODRY800,),
+}
+
+
+class Capabilities:
+    """
+    Functions available on one cryostat model.
+
+    Attributes:
+        device (int): Device identifier passed to begin().
+        model (str): Model name.
+        unsupported (frozenset): Methods the model does not have.
+    """
+
+    def __init__(self, device: int):
+        if device not in MODELS:
+            raise ValueError(f"Unknown device {device}, expected one of {sorted(MODELS)}")
+        self.device = device
+        self.model = MODELS[device]
+        self.unsupported = frozenset(method for method, models in MODEL_ONLY.items()
+                                     if device not in models)
+
+    def __repr__(self) -> str:
+        return f"Capabilities({self.model})"
+
+    def supports(self, method: str) -> bool:
+        return method not in self.unsupported
+
+    def bind(self, interface) -> dict:
+        """
+        Guards the unsupported methods of an interface and builds its dispatch table.
+
+        Unsupported methods are replaced on the instance by a function raising
+        UnsupportedFunctionError, supported ones are left untouched, so calls to
+        them cost nothing extra. Stubs of an earlier bind are removed first.
+
+        Returns:
+            dict: Method name -> bound method, for the supported public methods.
+        """
+        unbind(interface)
+        for method in self.unsupported:
+            setattr(interface, method, self._refuse(method))
+        return {name: getattr(interface, name) for name in dir(type(interface))
+                if not name.startswith('_') and callable(getattr(type(interface), name))
+                and self.supports(name)}
+
+    def _refuse(self, method: str):
+        model = self.model
+
+        def refuse(*args, **kwargs):
+            raise UnsupportedFunctionError(method, model)
+        refuse.__name__ = method
+        return refuse
+
+
+def unbind(interface) -> None:
+    """
+    Removes the refusal stubs that Capabilities.bind set on an interface.
+    """
+    for method in MODEL_ONLY:
+        vars(interface).pop(method, None)
+
+
+def supported_names(interface, table: dict) -> list:
+    """
+    Names of a table of name -> (method, arguments) whose method the connected
+    model supports, e.g. the telemetry channels. All names if the interface has
+    no capabilities (begin() not called yet).
+    """
+    capabilities = getattr(interface, 'capabilities', None)
+    if not isinstance(capabilities, Capabilities):
+        return list(table)
+    return [name for name, (method, _) in table.items() if capabilities.supports(method)]
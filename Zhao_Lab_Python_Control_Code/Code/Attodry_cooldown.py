@@ -0,0 +1,368 @@
+"""
+Cooldown and warmup orchestration with an ETA predicted from earlier runs.
+
+toggle_startup_shutdown() and go_to_base_temperature() return immediately. The
+orchestrator sends them, monitors the stage, VTI and sample temperatures and the
+pressures, and keeps an ETA up to date by matching the live temperature curve against
+a CurveIndex of past cooldowns and warmups, e.g. extracted from telemetry archives:
+
+    index = CurveIndex.from_archive(ArchiveReader("telemetry.adry"))
+    orchestrator = CooldownOrchestrator(AD, index, on_update=print)
+    orchestrator.start("cooldown")
+    orchestrator.ready.wait()
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+import Attodry_tracing as tracing
+from Attodry_telemetry import read_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+COOLDOWN = "cooldown"
+WARMUP = "warmup"
+
+MONITORED = ("stage_4k_temperature", "vti_temperature", "sample_temperature",
+             "cryostat_in_pressure", "cryostat_out_pressure", "dump_pressure")
+
+
+def find_runs(times: np.ndarray, temperatures: np.ndarray, warm: float = 250.0,
+              cold: float = 5.0) -> list:
+    """
+    Finds cooldowns and warmups in a temperature history.
+
+    A cooldown starts at the last sample above warm before the temperature drops
+    below cold, a warmup at the last sample below cold before it rises above warm.
+
+    Returns:
+        list: (kind, start index, end index) tuples, end is the first sample past the
+              other threshold.
+    """
+    keep = ~np.isnan(temperatures)
+    index = np.flatnonzero(keep)
+    temperatures = temperatures[keep]
+    state = np.zeros(temperatures.size, dtype=np.int8)
+    state[temperatures >= warm] = 1
+    state[temperatures <= cold] = -1
+    events = np.flatnonzero(state)
+    if events.size < 2:
+        return []
+    changes = np.flatnonzero(np.diff(state[events]) != 0)
+    runs = []
+    for c in changes:
+        kind = COOLDOWN if state[events[c]] == 1 else WARMUP
+        runs.append((kind, int(index[events[c]]), int(index[events[c + 1]])))
+    return runs
+
+
+class CurveIndex:
+    """
+    Past cooldown and warmup curves of one channel on a common time grid.
+    """
+
+    def __init__(self, channel: str = "sample_temperature", step: float = 30.0):
+        """
+        Args:
+            channel (str): Telemetry channel the curves are matched on.
+            step (float): Resampling interval of the curves in seconds.
+        """
+        self.channel = channel
+        self.step = step
+        self.runs = {COOLDOWN: [], WARMUP: []}
+        self._matrix = {}
+
+    def __len__(self) -> int:
+        return sum(len(runs) for runs in self.runs.values())
+
+    def add_run(self, kind: str, times, temperatures, start: float = None) -> None:
+        """
+        Adds one run. times are seconds, absolute or relative to the start.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        temperatures = np.asarray(temperatures, dtype=np.float64)
+        keep = ~np.isnan(temperatures) & (temperatures > 0)
+        times, temperatures = times[keep], temperatures[keep]
+        if times.size < 2:
+            return
+        grid = np.arange(times[0], times[-1], self.step)
+        curve = np.interp(grid, times, np.log10(temperatures))
+        self.runs[kind].append({'start': times[0] if start is None else start, 'curve': curve})
+        self._matrix.pop(kind, None)
+
+    @classmethod
+    def from_archive(cls, reader, channel: str = "sample_temperature", warm: float = 250.0,
+                     cold: float = 5.0, tail: float = 12 * 3600, step: float = 30.0) -> "CurveIndex":
+        """
+        Extracts all runs of an ArchiveReader. Each run continues for tail seconds past
+        the threshold, so the approach to base or room temperature is included.
+        """
+        index = cls(channel, step)
+        index.add_history(*reader.read([channel]), warm=warm, cold=cold, tail=tail)
+        return index
+
+    def add_history(self, times, values: dict, warm: float = 250.0, cold: float = 5.0,
+                    tail: float = 12 * 3600) -> int:
+        """
+        Adds all runs found in a history of the index channel.
+
+        Returns:
+            int: Number of runs added.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        temperatures = np.asarray(values[self.channel], dtype=np.float64)
+        runs = find_runs(times, temperatures, warm, cold)
+        for kind, begin, end in runs:
+            stop = np.searchsorted(times, times[end] + tail, side='right')
+            self.add_run(kind, times[begin:stop], temperatures[begin:stop])
+        return len(runs)
+
+    def _curves(self, kind: str) -> np.ndarray:
+        """
+        Curves of one kind as a NaN padded matrix in the direction of the run, so
+        that the values always decrease (log10 T for cooldowns, -log10 T for warmups).
+        """
+        matrix = self._matrix.get(kind)
+        if matrix is None:
+            runs = self.runs[kind]
+            length = max((r['curve'].size for r in runs), default=0)
+            matrix = np.full((len(runs), length), np.nan)
+            for row, run in zip(matrix, runs):
+                row[:run['curve'].size] = run['curve']
+            if kind == WARMUP:
+                matrix = -matrix
+            self._matrix[kind] = matrix
+        return matrix
+
+    def eta(self, kind: str, times, temperatures, target: float, window: float = 1800.0,
+            neighbours: int = 3):
+        """
+        Predicts the time until the temperature reaches target.
+
+        The live curve of the last window seconds is compared with each past run at
+        the point where that run passed the current temperature. The remaining times
+        of the closest runs are averaged, weighted by the inverse squared distance.
+
+        Args:
+            kind (str): COOLDOWN or WARMUP.
+            times, temperatures (array_like): Live history of the index channel.
+            target (float): Temperature that counts as arrived.
+            window (float): Seconds of live history compared.
+            neighbours (int): Number of closest runs averaged.
+
+        Returns:
+            tuple: (eta, earliest, latest) in seconds from the last sample, or None
+                   without matching runs.
+        """
+        curves = self._curves(kind)
+        times = np.asarray(times, dtype=np.float64)
+        temperatures = np.asarray(temperatures, dtype=np.float64)
+        keep = ~np.isnan(temperatures) & (temperatures > 0)
+        times, temperatures = times[keep], temperatures[keep]
+        if curves.shape[0] == 0 or times.size == 0:
+            return None
+
+        sign = -1.0 if kind == WARMUP else 1.0
+        now = times[-1]
+        points = max(1, int(min(window, now - times[0]) / self.step) + 1)
+        grid = now - self.step * np.arange(points)[::-1]
+        live = sign * np.interp(grid, times, np.log10(temperatures))
+        goal = sign * np.log10(target)
+        if live[-1] <= goal:
+            return 0.0, 0.0, 0.0
+
+        # Index where each run passed the current and the target temperature
+        envelope = np.fmin.accumulate(np.where(np.isnan(curves), np.inf, curves), axis=1)
+        passed = envelope <= live[-1]
+        arrived = envelope <= goal
+        valid = passed.any(axis=1) & arrived.any(axis=1)
+        if not valid.any():
+            return None
+        match = np.argmax(passed, axis=1)
+        finish = np.argmax(arrived, axis=1)
+
+        offsets = match[:, None] - np.arange(points)[::-1]
+        usable = offsets >= 0
+        history = np.take_along_axis(curves, np.maximum(offsets, 0), axis=1)
+        diff = np.where(usable, history - live, np.nan)
+        distance = np.sqrt(np.nanmean(diff * diff, axis=1))
+        distance = np.where(valid & np.isfinite(distance), distance, np.inf)
+
+        closest = np.argsort(distance)[:neighbours]
+        closest = closest[np.isfinite(distance[closest])]
+        remaining = (finish[closest] - match[closest]).clip(min=0) * self.step
+        weights = 1.0 / (distance[closest] + 1e-3) ** 2
+        return float(np.average(remaining, weights=weights)), float(remaining.min()), float(remaining.max())
+
+    def save(self, path: str) -> None:
+        arrays = {}
+        for kind, runs in self.runs.items():
+            for i, run in enumerate(runs):
+                arrays[f"{kind}_{i}"] = run['curve']
+                arrays[f"{kind}_{i}_start"] = np.array(run['start'])
+        np.savez_compressed(path, channel=np.array(self.channel), step=np.array(self.step), **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "CurveIndex":
+        with np.load(path) as data:
+            index = cls(str(data['channel']), float(data['step']))
+            for kind in index.runs:
+                i = 0
+                while f"{kind}_{i}" in data:
+                    index.runs[kind].append({'start': float(data[f"{kind}_{i}_start"]),
+                                             'curve': data[f"{kind}_{i}"]})
+                    i += 1
+        return index
+
+
+class CooldownStatus:
+    """
+    Progress of a cooldown or warmup at one moment.
+    """
+
+    def __init__(self, kind: str, elapsed: float, readings: dict, eta):
+        self.kind = kind
+        self.elapsed = elapsed
+        self.readings = readings
+        self.eta = eta
+
+    @property
+    def ready_at(self) -> float:
+        """
+        Predicted Unix time of arrival, None without an ETA.
+        """
+        return None if self.eta is None else time.time() + self.eta[0]
+
+    def __str__(self) -> str:
+        temperatures = ", ".join(f"{k} {v:.2f}" for k, v in self.readings.items() if k.endswith("temperature"))
+        if self.eta is None:
+            eta = "no ETA"
+        else:
+            eta = f"ETA {self.eta[0] / 60:.0f} min ({self.eta[1] / 60:.0f}-{self.eta[2] / 60:.0f})"
+        return f"{self.kind} {self.elapsed / 60:.0f} min: {temperatures}; {eta}"
+
+
+class CooldownOrchestrator:
+    """
+    Drives a cooldown to base temperature or a warmup to room temperature.
+    """
+
+    def __init__(self, interface, index: CurveIndex = None, base_temperature: float = 2.0,
+                 room_temperature: float = 290.0, hold: float = 300.0, interval: float = 10.0,
+                 on_update=None, lock=None):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface.
+            index (CurveIndex): Past runs for the ETA; no ETA if None.
+            base_temperature (float): Sample temperature at which a cooldown is done.
+            room_temperature (float): Sample temperature at which a warmup is done.
+            hold (float): Seconds the temperature has to stay past the target.
+            interval (float): Seconds between readings.
+            on_update (callable): Called with a CooldownStatus after every reading.
+            lock (threading.RLock): Lock shared with other threads using the interface.
+        """
+        self._ad = interface
+        self.index = index or CurveIndex()
+        self.targets = {COOLDOWN: base_temperature, WARMUP: room_temperature}
+        self.hold = hold
+        self.interval = interval
+        self.on_update = on_update
+        self.lock = lock or threading.RLock()
+
+        self.ready = threading.Event()
+        self.status = None
+        self.history = {name: [] for name in MONITORED}
+        self.times = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _begin(self, kind: str) -> None:
+        with self.lock:
+            running = self._ad.is_system_running()
+            if kind == COOLDOWN:
+                if not running:
+                    logger.info("Starting up the attoDRY")
+                    self._ad.toggle_startup_shutdown()
+                if not self._ad.is_going_to_base_temperature():
+                    logger.info("Going to base temperature")
+                    self._ad.go_to_base_temperature()
+            elif running:
+                logger.info("Shutting down the attoDRY")
+                self._ad.toggle_startup_shutdown()
+
+    def _arrived(self, kind: str, temperature: float) -> bool:
+        target = self.targets[kind]
+        return temperature <= target if kind == COOLDOWN else temperature >= target
+
+    @tracing.traced("cooldown")
+    def run(self, kind: str = COOLDOWN, timeout: float = None) -> float:
+        """
+        Starts the phase and blocks until the sample temperature stayed past the
+        target for hold seconds.
+
+        Returns:
+            float: Duration of the phase in seconds.
+        """
+        self.ready.clear()
+        self._stop.clear()
+        # Each run records its own curve, so record() and eta() never mix runs
+        self.history = {name: [] for name in MONITORED}
+        self.times = []
+        self.status = None
+        self._begin(kind)
+        start = time.monotonic()
+        channel = self.index.channel
+        arrived_since = None
+        while not self._stop.is_set():
+            with self.lock:
+                readings = read_snapshot(self._ad, MONITORED)
+            now = time.monotonic()
+            self.times.append(now)
+            for name in MONITORED:
+                self.history[name].append(readings[name])
+
+            eta = self.index.eta(kind, self.times, self.history[channel], self.targets[kind])
+            self.status = CooldownStatus(kind, now - start, readings, eta)
+            if self.on_update is not None:
+                self.on_update(self.status)
+
+            if self._arrived(kind, readings[channel]):
+                arrived_since = now if arrived_since is None else arrived_since
+                if now - arrived_since >= self.hold:
+                    self.ready.set()
+                    duration = now - start
+                    logger.info("%s finished after %.1f h", kind, duration / 3600)
+                    return duration
+            else:
+                arrived_since = None
+            if timeout is not None and now - start > timeout:
+                raise TimeoutError(f"{kind} did not finish within {timeout} s")
+            self._stop.wait(self.interval)
+        return time.monotonic() - start
+
+    def start(self, kind: str = COOLDOWN) -> None:
+        """
+        Runs the phase in a background thread; ready is set when it is done.
+        """
+        self._thread = threading.Thread(target=self.run, args=(kind,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops monitoring. The attoDRY keeps running the current procedure.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def record(self) -> None:
+        """
+        Adds the monitored run to the index, so the next ETA can use it.
+        """
+        if self.status is not None and self.ready.is_set():
+            self.index.add_run(self.status.kind, self.times, self.history[self.index.channel])
@@ -0,0 +1,210 @@
+"""
+Multi-resolution min/max/mean rollups of telemetry channels for plotting long histories.
+
+The pyramid keeps buckets of 1 s, 10 s, 1 min, 10 min and 1 h per channel and updates
+them as batches arrive. query() picks the finest level that returns at most the
+requested number of points, so a dashboard draws a two week cooldown from a few
+thousand buckets instead of millions of samples:
+
+    pyramid = DecimationPyramid()
+    poller.subscribe(pyramid)
+    t, low, high, mean = pyramid.query("sample_temperature", t0, t1, max_points=2000)
+"""
+
+import threading
+
+import numpy as np
+
+
+# Bucket widths in seconds
+LEVELS = (1.0, 10.0, 60.0, 600.0, 3600.0)
+
+# Buckets kept per level; older buckets are only available from coarser levels
+RETENTION = 200_000
+
+
+class _Rollup:
+    """
+    Growable arrays of bucket aggregates for one channel at one bucket width.
+    """
+
+    def __init__(self, width: float, retention: int):
+        self.width = width
+        self.retention = retention
+        self.size = 0
+        capacity = 1024
+        self.bucket = np.empty(capacity, dtype=np.int64)
+        self.low = np.empty(capacity, dtype=np.float64)
+        self.high = np.empty(capacity, dtype=np.float64)
+        self.total = np.empty(capacity, dtype=np.float64)
+        self.count = np.empty(capacity, dtype=np.int64)
+
+    def _arrays(self):
+        return ('bucket', 'low', 'high', 'total', 'count')
+
+    def _reserve(self, extra: int) -> None:
+        needed = self.size + extra
+        if needed <= len(self.bucket):
+            return
+        capacity = max(needed, 2 * len(self.bucket))
+        for name in self._arrays():
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _trim(self) -> None:
+        # Drop the oldest half of the allowed history once twice the retention is reached
+        if self.retention is None or self.size < 2 * self.retention:
+            return
+        drop = self.size - self.retention
+        for name in self._arrays():
+            array = getattr(self, name)
+            array[:self.retention] = array[drop:self.size]
+        self.size = self.retention
+
+    def append(self, times: np.ndarray, values: np.ndarray) -> None:
+        """
+        Adds samples with increasing times. NaN values are ignored.
+        """
+        keep = ~np.isnan(values)
+        times, values = times[keep], values[keep]
+        if times.size == 0:
+            return
+
+        buckets = np.floor(times / self.width).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        ids = buckets[starts]
+        low = np.minimum.reduceat(values, starts)
+        high = np.maximum.reduceat(values, starts)
+        total = np.add.reduceat(values, starts)
+        count = np.diff(np.append(starts, values.size))
+
+        # Merge into the last bucket if it is still open
+        if self.size and ids[0] == self.bucket[self.size - 1]:
+            last = self.size - 1
+            self.low[last] = min(self.low[last], low[0])
+            self.high[last] = max(self.high[last], high[0])
+            self.total[last] += total[0]
+            self.count[last] += count[0]
+            ids, low, high, total, count = ids[1:], low[1:], high[1:], total[1:], count[1:]
+
+        n = ids.size
+        self._reserve(n)
+        end = self.size + n
+        self.bucket[self.size:end] = ids
+        self.low[self.size:end] = low
+        self.high[self.size:end] = high
+        self.total[self.size:end] = total
+        self.count[self.size:end] = count
+        self.size = end
+        self._trim()
+
+    def first_time(self) -> float:
+        return self.bucket[0] * self.width if self.size else np.inf
+
+    def span(self, t0: float, t1: float) -> tuple:
+        """
+        Index range of the buckets overlapping [t0, t1).
+        """
+        buckets = self.bucket[:self.size]
+        lo = np.searchsorted(buckets, np.floor(t0 / self.width), side='left')
+        hi = np.searchsorted(buckets, np.floor(t1 / self.width), side='right')
+        return lo, hi
+
+
+class DecimationPyramid:
+    """
+    Incrementally maintained rollup pyramid over any number of channels.
+    """
+
+    def __init__(self, channels=None, levels=LEVELS, retention: int = RETENTION):
+        """
+        Args:
+            channels (list): Channels to keep, all channels of incoming batches if None.
+            levels (tuple): Increasing bucket widths in seconds.
+            retention (int): Buckets kept per level, None to keep everything.
+        """
+        self.channels = None if channels is None else list(channels)
+        self.levels = tuple(levels)
+        self.retention = retention
+        self._rollups = {}
+        self._first_time = {}
+        self._lock = threading.Lock()
+
+    def _channel(self, name: str) -> list:
+        rollups = self._rollups.get(name)
+        if rollups is None:
+            # The coarsest level always keeps the full history
+            retention = [self.retention] * (len(self.levels) - 1) + [None]
+            rollups = [_Rollup(w, r) for w, r in zip(self.levels, retention)]
+            self._rollups[name] = rollups
+        return rollups
+
+    def append(self, times, values: dict) -> None:
+        """
+        Adds samples of several channels sharing one time column.
+
+        Args:
+            times (np.ndarray): Increasing Unix timestamps in seconds.
+            values (dict): Channel name -> np.ndarray aligned with times.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        with self._lock:
+            for name, column in values.items():
+                if self.channels is not None and name not in self.channels:
+                    continue
+                column = np.asarray(column, dtype=np.float64)
+                self._first_time.setdefault(name, times[0] if times.size else np.inf)
+                for rollup in self._channel(name):
+                    rollup.append(times, column)
+
+    def __call__(self, batch) -> None:
+        """
+        Subscriber entry point for TelemetryPoller.
+        """
+        self.append(batch.times, batch.values)
+
+    def query(self, channel: str, t0: float, t1: float, max_points: int = 2000) -> tuple:
+        """
+        Returns at most max_points buckets of a channel between t0 and t1.
+
+        The finest level that covers t0 and fits in max_points is used. If even the
+        coarsest level has too many buckets, neighbouring buckets are merged.
+
+        Returns:
+            tuple: (times, minimum, maximum, mean) arrays; times are bucket centres.
+        """
+        with self._lock:
+            rollups = self._rollups.get(channel)
+            if not rollups:
+                empty = np.empty(0)
+                return empty, empty, empty, empty
+
+            # A level is usable if it was not trimmed after t0
+            covered = max(t0, self._first_time[channel])
+            chosen = rollups[-1]
+            for rollup in rollups:
+                lo, hi = rollup.span(t0, t1)
+                if rollup.first_time() <= covered and hi - lo <= max_points:
+                    chosen = rollup
+                    break
+            lo, hi = chosen.span(t0, t1)
+            bucket = chosen.bucket[lo:hi].copy()
+            low = chosen.low[lo:hi].copy()
+            high = chosen.high[lo:hi].copy()
+            total = chosen.total[lo:hi].copy()
+            count = chosen.count[lo:hi].copy()
+            width = chosen.width
+
+        if bucket.size > max_points:
+            starts = np.arange(0, bucket.size, int(np.ceil(bucket.size / max_points)))
+            span = np.diff(np.append(bucket[starts], bucket[-1] + 1))
+            times = (bucket[starts] + span / 2) * width
+            low = np.minimum.reduceat(low, starts)
+            high = np.maximum.reduceat(high, starts)
+            total = np.add.reduceat(total, starts)
+            count = np.add.reduceat(count, starts)
+        else:
+            times = (bucket + 0.5) * width
+        return times, low, high, total / count
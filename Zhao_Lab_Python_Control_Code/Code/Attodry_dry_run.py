@@ -0,0 +1,312 @@
+"""
+Dry run of measurement scripts against a simulated attoDRY in virtual time.
+
+DryRunInterface has the methods of AttoDRYInterface, read from the wrapper source so
+the DLL is never loaded. Setters, toggles and other commands are recorded instead of
+sent; getters return a simulated state where temperature and field ramp towards the
+setpoints following a TransitionModel. time.sleep, time.time and time.monotonic are
+replaced by a virtual clock, so waits and settle loops finish in milliseconds and the
+whole script runs in seconds:
+
+    python Attodry_dry_run.py Set_temp_mag.py
+
+prints the time budget of every recorded step and flags the ones that dominate.
+"""
+
+import ast
+import numbers
+import os
+import runpy
+import sys
+import time
+import types
+from contextlib import contextmanager
+
+from Attodry_recipe import TransitionModel
+
+
+WRAPPER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Attodry_wrapper_class.py")
+
+# Defaults returned by getters that are not simulated, by return annotation
+_DEFAULTS = {'bool': False, 'int': 0, 'float': 0.0, 'str': ""}
+
+
+def wrapper_methods(path: str = WRAPPER_SOURCE) -> dict:
+    """
+    Public methods of AttoDRYInterface and their return annotations, read with ast.
+
+    Returns:
+        dict: Method name -> annotation name, None for methods without a value.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    methods = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef) and node.name == "AttoDRYInterface":
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef) and not item.name.startswith('_'):
+                    returns = item.returns
+                    name = returns.id if isinstance(returns, ast.Name) else None
+                    methods[item.name] = None if name == 'None' else name
+    return methods
+
+
+class VirtualClock:
+    """
+    Clock that only advances when something sleeps.
+    """
+
+    def __init__(self, start: float = None):
+        self.start = time.time() if start is None else start
+        self.elapsed = 0.0
+
+    def time(self) -> float:
+        return self.start + self.elapsed
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def sleep(self, seconds: float) -> None:
+        self.elapsed += max(seconds, 0.0)
+
+    @contextmanager
+    def patch(self):
+        """
+        Replaces the functions of the time module with this clock.
+        """
+        saved = {name: getattr(time, name) for name in ('sleep', 'time', 'monotonic', 'perf_counter')}
+        time.sleep = self.sleep
+        time.time = self.time
+        time.monotonic = self.monotonic
+        time.perf_counter = self.monotonic
+        try:
+            yield self
+        finally:
+            for name, func in saved.items():
+                setattr(time, name, func)
+
+
+class _Ramp:
+    """
+    Linear move of one simulated quantity that arrives at its target after a settle time.
+    """
+
+    def __init__(self, value: float):
+        self.start = self.target = value
+        self.t0 = 0.0
+        self.duration = 0.0
+
+    def value(self, t: float) -> float:
+        if t >= self.t0 + self.duration:
+            return self.target
+        return self.start + (self.target - self.start) * (t - self.t0) / self.duration
+
+    def move(self, t: float, target: float, rate: float, settle: float) -> None:
+        """
+        Args:
+            rate (float): Units per minute.
+            settle (float): Seconds added to the move before the target is read back.
+        """
+        self.start = self.value(t)
+        self.target = target
+        self.t0 = t
+        delta = abs(target - self.start)
+        self.duration = delta / rate * 60 + settle if delta else 0.0
+
+
+class DryRunStep:
+    """
+    One recorded command and the virtual time until the next one.
+    """
+
+    def __init__(self, index: int, call: str, start: float):
+        self.index = index
+        self.call = call
+        self.start = start
+        self.duration = 0.0
+        self.dominant = False
+
+
+class DryRunInterface:
+    """
+    Stand-in for AttoDRYInterface that records commands and simulates readings.
+    """
+
+    AXES = ('X', 'Y', 'Z')
+
+    def __init__(self, model: TransitionModel = None, clock: VirtualClock = None,
+                 temperature: float = 300.0, methods: dict = None):
+        """
+        Args:
+            model (TransitionModel): Ramp and settling model, 1 K/min and 0.1 T/min if None.
+            clock (VirtualClock): Clock the simulation runs on.
+            temperature (float): Initial sample temperature in K.
+            methods (dict): Method table from wrapper_methods(), read from the wrapper if None.
+        """
+        self.model = model or TransitionModel(heating_rate=1.0)
+        self.clock = clock or VirtualClock()
+        self._methods = methods or wrapper_methods()
+        self._temperature = _Ramp(temperature)
+        self._field = {axis: _Ramp(0.0) for axis in self.AXES}
+        self.steps = [DryRunStep(0, "start", 0.0)]
+
+        # Simulated getters; everything else returns the default of its annotation
+        self._getters = {
+            'is_connected': lambda: True,
+            'is_initialised': lambda: True,
+            'is_system_running': lambda: True,
+            'get_sample_temperature': self._read_temperature,
+            'get_vti_temperature': self._read_temperature,
+            'get_user_temperature_setpoint': lambda: self._temperature.target,
+            'get_temperature_setpoint': lambda: self._temperature.target,
+            'get_temperature_ramp_rate': lambda: self.model.heating_rate,
+            'get_magnet_sweep_rate': lambda: self.model.field_rate,
+            'get_magnetic_field': lambda: self._read_field('Y'),
+            'get_magnet_field': lambda: self._read_field('Y'),
+            'get_magnetic_field_axis': self._read_field,
+            'get_user_magnet_setpoint': lambda: self._field['Y'].target,
+            'get_magnetic_field_set_point': lambda: self._field['Y'].target,
+            'get_user_magnetic_field_setpoint_axis': lambda axis: self._field[axis.upper()].target,
+        }
+
+    def _read_temperature(self) -> float:
+        return self._temperature.value(self.clock.monotonic())
+
+    def _read_field(self, axis: str = 'Y') -> float:
+        return self._field[axis.upper()].value(self.clock.monotonic())
+
+    def _move_temperature(self, target: float) -> None:
+        now = self.clock.monotonic()
+        rate = self.model.heating_rate if target >= self._temperature.value(now) else self.model.cooling_rate
+        self._temperature.move(now, target, rate, self.model.temperature_settle)
+
+    def _move_field(self, axis: str, target: float) -> None:
+        self._field[axis.upper()].move(self.clock.monotonic(), target, self.model.field_rate,
+                                       self.model.field_settle)
+
+    def _simulate(self, name: str, args: tuple) -> None:
+        """
+        Applies commands that change the simulated state.
+        """
+        if name in ('set_user_temperature', 'set_temperature_setpoint'):
+            self._move_temperature(args[0])
+        elif name in ('set_user_magnetic_field', 'set_user_magnet_setpoint'):
+            self._move_field('Y', args[0])
+        elif name == 'set_user_magnetic_field_axis':
+            self._move_field(args[0], args[1])
+        elif name == 'sweep_field_to_zero':
+            for axis in self.AXES:
+                self._move_field(axis, 0.0)
+        elif name == 'set_temperature_ramp_rate':
+            ratio = self.model.cooling_rate / self.model.heating_rate
+            self.model.heating_rate = args[0]
+            self.model.cooling_rate = args[0] * ratio
+        elif name == 'set_magnet_sweep_rate':
+            self.model.field_rate = args[0]
+
+    def _record(self, name: str, args: tuple, kwargs: dict) -> None:
+        now = self.clock.monotonic()
+        self.steps[-1].duration = now - self.steps[-1].start
+        arguments = [_format_argument(a) for a in args]
+        arguments += [f"{k}={_format_argument(v)}" for k, v in kwargs.items()]
+        self.steps.append(DryRunStep(len(self.steps), f"{name}({', '.join(arguments)})", now))
+        self._simulate(name, args)
+
+    def __getattr__(self, name: str):
+        methods = self.__dict__.get('_methods', {})
+        if name not in methods:
+            raise AttributeError(f"AttoDRYInterface has no method {name}")
+        if name in self._getters:
+            getter = self._getters[name]
+            return lambda *args, **kwargs: getter(*args, **kwargs)
+        annotation = methods[name]
+        if name.startswith(('get_', 'is_')) and annotation in _DEFAULTS:
+            return lambda *args, **kwargs: _DEFAULTS[annotation]
+        return lambda *args, **kwargs: self._record(name, args, kwargs)
+
+    def finish(self, dominant_fraction: float = 0.8) -> list:
+        """
+        Closes the last step and flags the longest steps that together make up
+        dominant_fraction of the total time.
+
+        Returns:
+            list: The recorded DryRunSteps.
+        """
+        last = self.steps[-1]
+        last.duration = self.clock.monotonic() - last.start
+        total = self.clock.monotonic()
+        covered = 0.0
+        for step in sorted(self.steps, key=lambda s: s.duration, reverse=True):
+            if covered >= dominant_fraction * total or step.duration <= 0:
+                break
+            step.dominant = True
+            covered += step.duration
+        return self.steps
+
+    def report(self) -> str:
+        """
+        Time budget of all steps; dominant steps are marked with '*'.
+        """
+        steps = self.finish()
+        total = self.clock.monotonic()
+        lines = [f"{'':1} {'#':>4} {'start':>10} {'duration':>10} {'share':>6}  command"]
+        for step in steps:
+            share = step.duration / total if total else 0.0
+            lines.append(f"{'*' if step.dominant else ' '} {step.index:>4} "
+                         f"{_format_seconds(step.start):>10} {_format_seconds(step.duration):>10} "
+                         f"{share:>6.1%}  {step.call}")
+        lines.append(f"Total {_format_seconds(total)} in {len(steps) - 1} commands")
+        return "\n".join(lines)
+
+
+def _format_argument(value) -> str:
+    # NumPy scalars from recipes print like plain numbers
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return repr(int(value) if isinstance(value, numbers.Integral) else float(value))
+    return repr(value)
+
+
+def _format_seconds(seconds: float) -> str:
+    hours, rest = divmod(int(round(seconds)), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+
+def run_script(path: str, model: TransitionModel = None, temperature: float = 300.0) -> DryRunInterface:
+    """
+    Runs a measurement script against a DryRunInterface in virtual time.
+
+    The script gets a fake Attodry_wrapper_class module whose AttoDRYInterface returns
+    the dry-run interface, so scripts using the wrapper directly or through
+    AttoDRYSession run unchanged. Modules imported by the script are unloaded afterwards.
+
+    Returns:
+        DryRunInterface: The interface with the recorded steps.
+    """
+    clock = VirtualClock()
+    interface = DryRunInterface(model, clock, temperature)
+
+    fake = types.ModuleType("Attodry_wrapper_class")
+    fake.AttoDRYInterface = lambda *args, **kwargs: interface
+
+    modules = dict(sys.modules)
+    script_dir = os.path.dirname(os.path.abspath(path))
+    sys.path.insert(0, script_dir)
+    sys.modules["Attodry_wrapper_class"] = fake
+    try:
+        with clock.patch():
+            runpy.run_path(path, run_name="__main__")
+    finally:
+        sys.path.remove(script_dir)
+        for name in set(sys.modules) - set(modules):
+            del sys.modules[name]
+        sys.modules.update(modules)
+        if "Attodry_wrapper_class" not in modules:
+            sys.modules.pop("Attodry_wrapper_class", None)
+    return interface
+
+
+if __name__ == "__main__":
+    dry_run = run_script(sys.argv[1])
+    print()
+    print(dry_run.report())
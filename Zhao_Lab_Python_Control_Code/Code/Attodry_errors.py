@@ -0,0 +1,114 @@
+"""
+Exceptions for error codes returned by the attoDRY DLL.
+
+The DLL functions return LabVIEW error codes. Most of the ones seen in practice come
+from NI-VISA while talking to the COM port, e.g. -1073807246 from connect() when
+another program (such as the attoDRY LabView Interface) still holds the port.
+SafetyLimitError is raised by SafeInterface before a command outside the safety
+envelope reaches the DLL, UnsupportedFunctionError instead of calling a function
+the connected cryostat model does not have.
+"""
+
+
+class AttoDRYError(RuntimeError):
+    """
+    Error code returned by a DLL function.
+
+    Attributes:
+        code (int): LabVIEW error code.
+    """
+
+    description = "Unknown error"
+
+    # Transient errors may go away when the call is retried
+    transient = False
+
+    def __init__(self, code: int):
+        self.code = code
+        super().__init__(f"C function returned error code: {code} ({self.description})")
+
+
+class PortBusyError(AttoDRYError):
+    description = "COM port is in use by another program"
+    transient = True
+
+
+class ResourceNotFoundError(AttoDRYError):
+    description = "COM port not found"
+
+
+class InvalidResourceNameError(AttoDRYError):
+    description = "Invalid COM port name"
+
+
+class DeviceTimeoutError(AttoDRYError):
+    description = "Timeout while communicating with the attoDRY"
+    transient = True
+
+
+class ConnectionLostError(AttoDRYError):
+    description = "Connection to the attoDRY was lost"
+    transient = True
+
+
+class ExternalCodeError(AttoDRYError):
+    description = "Exception in the LabVIEW run-time engine"
+
+
+class UnsupportedFunctionError(AttoDRYError):
+    """
+    Function not available on the connected cryostat model, the DLL was not called.
+
+    Attributes:
+        method (str): Name of the AttoDRYInterface method.
+        model (str): Model selected by begin().
+    """
+
+    description = "Function not supported by this model"
+
+    def __init__(self, method: str, model: str):
+        self.code = None
+        self.method = method
+        self.model = model
+        RuntimeError.__init__(self, f"{method} is not supported on the {model}")
+
+
+class SafetyLimitError(ValueError):
+    """
+    Command rejected by the safety envelope, nothing was sent to the attoDRY.
+
+    Attributes:
+        command (str): Name of the rejected AttoDRYInterface method.
+        value (float): Rejected value.
+        limit (str): Description of the violated limit.
+    """
+
+    def __init__(self, command: str, value: float, limit: str):
+        self.command = command
+        self.value = value
+        self.limit = limit
+        super().__init__(f"{command}({value!r}) rejected: {limit}")
+
+
+# NI-VISA / LabVIEW error codes
+ERROR_CODES = {
+    -1073807246: PortBusyError,             # VI_ERROR_RSRC_BUSY
+    -1073807343: ResourceNotFoundError,     # VI_ERROR_RSRC_NFOUND
+    -1073807342: InvalidResourceNameError,  # VI_ERROR_INV_RSRC_NAME
+    -1073807339: DeviceTimeoutError,        # VI_ERROR_TMO
+    -1073807194: ConnectionLostError,       # VI_ERROR_CONN_LOST
+    1097:        ExternalCodeError,         # Exception occurred within the external code
+}
+
+
+def error_from_code(code: int) -> AttoDRYError:
+    """
+    Creates the exception matching a DLL return code.
+
+    Args:
+        code (int): Non-zero return code.
+
+    Returns:
+        AttoDRYError: Instance of the most specific known subclass.
+    """
+    return ERROR_CODES.get(code, AttoDRYError)(code)
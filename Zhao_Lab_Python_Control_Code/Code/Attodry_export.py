@@ -0,0 +1,277 @@
+"""
+Arrow and Parquet export of cryostat telemetry for pandas/polars.
+
+Telemetry columns are float64 NumPy arrays, which Arrow wraps without copying; only
+the time column is converted to an Arrow timestamp. ParquetExporter writes a
+partitioned dataset (one directory per day or per cooldown) in row groups, so
+memory stays bounded by one row group however long the recording is. It is a
+TelemetryPoller subscriber and can also convert archives:
+
+    export_archive(ArchiveReader("telemetry.adry"), "parquet/", partition="cooldown")
+    table = load_parquet("parquet/", ["sample_temperature", "magnetic_field_z"])
+    frame = table.to_pandas()
+
+pyarrow is only needed for this module.
+"""
+
+import datetime
+import os
+
+import numpy as np
+
+
+DAY = "day"
+COOLDOWN = "cooldown"
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError("Arrow/Parquet export needs pyarrow (pip install pyarrow)") from err
+    return pyarrow
+
+
+def to_arrow(times, values: dict, channels=None):
+    """
+    Builds an Arrow table of telemetry.
+
+    Float64 channel arrays are wrapped without a copy; NaN stays NaN (it is not
+    turned into null). The time column becomes a UTC timestamp in microseconds.
+
+    Args:
+        times (np.ndarray): Unix timestamps in seconds.
+        values (dict): Channel name -> np.ndarray aligned with times.
+        channels (list): Columns to include, all if None.
+
+    Returns:
+        pyarrow.Table: Columns "time" and one per channel.
+    """
+    pa = _arrow()
+    channels = list(values) if channels is None else list(channels)
+    micros = np.rint(np.asarray(times, dtype=np.float64) * 1e6).astype(np.int64)
+    arrays = [pa.array(micros, type=pa.timestamp('us', tz='UTC'))]
+    for name in channels:
+        arrays.append(pa.array(np.ascontiguousarray(values[name], dtype=np.float64)))
+    return pa.Table.from_arrays(arrays, names=["time"] + channels)
+
+
+def ring_buffer_to_arrow(buffer, seconds: float = None, channels=None):
+    """
+    Arrow table of the last seconds of a RingBuffer.
+    """
+    times, values = buffer.latest(seconds, channels)
+    return to_arrow(times, values)
+
+
+class ParquetExporter:
+    """
+    Streaming writer of a Hive-partitioned Parquet dataset.
+
+    Rows are buffered until a row group is full, then written to the file of the
+    current partition. A new partition starts at midnight UTC (partition="day") or
+    when the sample temperature drops below warm after having been below cold since
+    the previous cooldown (partition="cooldown").
+
+    A cooldown partition is named after the Unix time in seconds at which the
+    cooldown started, so restarted exporters and repeated exports into the same
+    root agree on it. Samples before the first cooldown an exporter sees go to the
+    latest cooldown under root that started before them, or to cooldown=0.
+    """
+
+    def __init__(self, root: str, channels, partition: str = DAY, row_group_size: int = 65536,
+                 warm: float = 250.0, cold: float = 5.0, compression: str = "zstd"):
+        """
+        Args:
+            root (str): Dataset directory.
+            channels (list): Channels written, in column order.
+            partition (str): DAY or COOLDOWN.
+            row_group_size (int): Rows per Parquet row group.
+            warm, cold (float): Sample temperatures in K that delimit a cooldown.
+            compression (str): Parquet compression codec.
+        """
+        if partition not in (DAY, COOLDOWN):
+            raise ValueError(f"partition must be {DAY!r} or {COOLDOWN!r}")
+        if partition == COOLDOWN and "sample_temperature" not in channels:
+            raise ValueError("Cooldown partitioning needs the sample_temperature channel")
+        self.root = root
+        self.channels = list(channels)
+        self.partition = partition
+        self.row_group_size = row_group_size
+        self.warm = warm
+        self.cold = cold
+        self.compression = compression
+
+        self._key = None
+        self._writer = None
+        self._times = []
+        self._columns = []
+        self._pending = 0
+        self._pending_key = None
+        # Start time of the current cooldown (None until the first samples), whether
+        # the last temperature was warm and whether the next drop below warm starts a
+        # new cooldown
+        self._cooldown = None
+        self._was_warm = False
+        self._armed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _existing_cooldown(self, t: float) -> int:
+        """
+        Start of the latest cooldown partition under root that started at or before t.
+        """
+        prefix = f"{COOLDOWN}="
+        starts = []
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if name.startswith(prefix) and name[len(prefix):].isdigit():
+                    starts.append(int(name[len(prefix):]))
+        return max((start for start in starts if start <= t), default=0)
+
+    def _partition_keys(self, times: np.ndarray, values: dict) -> np.ndarray:
+        if self.partition == DAY:
+            return np.floor(times / 86400).astype(np.int64)
+        if self._cooldown is None:
+            self._cooldown = self._existing_cooldown(times[0])
+
+        # A cooldown partition starts where the temperature drops below warm, once
+        # per visit to cold, so noise around warm does not start new partitions
+        temperature = np.asarray(values["sample_temperature"], dtype=np.float64)
+        known = np.maximum.accumulate(np.where(np.isnan(temperature), -1, np.arange(temperature.size)))
+        warm = np.where(known >= 0, temperature[np.maximum(known, 0)] >= self.warm, self._was_warm)
+        before = np.concatenate(([self._was_warm], warm[:-1]))
+        drops = np.flatnonzero(before & ~warm)
+        cold = np.flatnonzero(temperature <= self.cold)
+
+        starts = np.zeros(temperature.size, dtype=np.int64)
+        previous = 0
+        for drop in drops:
+            if not self._armed and np.searchsorted(cold, previous) < np.searchsorted(cold, drop):
+                self._armed = True
+            if self._armed:
+                starts[drop] = 1
+                self._armed = False
+            previous = drop
+        if not self._armed and np.searchsorted(cold, previous) < cold.size:
+            self._armed = True
+
+        # Every sample gets the start time of the cooldown it belongs to
+        last_start = np.maximum.accumulate(np.where(starts == 1, np.arange(starts.size), -1))
+        keys = np.where(last_start >= 0, np.floor(times[np.maximum(last_start, 0)]).astype(np.int64),
+                        self._cooldown)
+        self._was_warm = bool(warm[-1])
+        self._cooldown = int(keys[-1])
+        return keys
+
+    def _path(self, key: int, first_time: float) -> str:
+        if self.partition == DAY:
+            label = datetime.datetime.fromtimestamp(key * 86400, datetime.timezone.utc).strftime("%Y-%m-%d")
+        else:
+            label = f"{key:d}"
+        directory = os.path.join(self.root, f"{self.partition}={label}")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"part-{int(first_time * 1000)}.parquet")
+
+    def _write(self, key: int, times: np.ndarray, columns: list) -> None:
+        pa = _arrow()
+        table = to_arrow(times, dict(zip(self.channels, columns)), self.channels)
+        if key != self._key:
+            if self._writer is not None:
+                self._writer.close()
+            self._writer = pa.parquet.ParquetWriter(self._path(key, times[0]), table.schema,
+                                                    compression=self.compression)
+            self._key = key
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+
+    def _flush_pending(self) -> None:
+        if not self._pending:
+            return
+        times = np.concatenate(self._times)
+        columns = [np.concatenate([c[i] for c in self._columns]) for i in range(len(self.channels))]
+        self._times, self._columns, self._pending = [], [], 0
+        self._write(self._pending_key, times, columns)
+
+    def append(self, times, values: dict) -> None:
+        """
+        Adds samples. Channels missing from values are written as NaN.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if times.size == 0:
+            return
+        nan = np.full(times.size, np.nan)
+        columns = [np.asarray(values.get(name, nan), dtype=np.float64) for name in self.channels]
+        keys = self._partition_keys(times, values)
+
+        # Split at partition changes, then into row groups
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [times.size]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            key = int(keys[lo])
+            if self._pending and key != self._pending_key:
+                self._flush_pending()
+            self._pending_key = key
+            while lo < hi:
+                take = min(hi - lo, self.row_group_size - self._pending)
+                self._times.append(times[lo:lo + take])
+                self._columns.append([c[lo:lo + take] for c in columns])
+                self._pending += take
+                lo += take
+                if self._pending >= self.row_group_size:
+                    self._flush_pending()
+
+    def __call__(self, batch) -> None:
+        """
+        Subscriber entry point for TelemetryPoller.
+        """
+        self.append(batch.times, batch.values)
+
+    def close(self) -> None:
+        """
+        Writes the buffered rows and closes the current file.
+        """
+        self._flush_pending()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._key = None
+
+
+def export_archive(reader, root: str, partition: str = DAY, channels=None, **kwargs) -> None:
+    """
+    Converts an archive to a Parquet dataset one block at a time.
+    """
+    channels = reader.channels if channels is None else list(channels)
+    with ParquetExporter(root, channels, partition, **kwargs) as exporter:
+        for times, values in reader.iter_blocks(channels):
+            exporter.append(times, values)
+
+
+def load_parquet(root: str, channels=None, t0: float = None, t1: float = None):
+    """
+    Loads selected channels of a dataset written by ParquetExporter.
+
+    Only the requested columns are read, and row groups outside [t0, t1] are skipped
+    using the Parquet statistics.
+
+    Returns:
+        pyarrow.Table: Columns "time", the partition column and the channels.
+    """
+    pa = _arrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(root, format="parquet", partitioning="hive")
+    partitions = [name for name in (DAY, COOLDOWN) if name in dataset.schema.names]
+    columns = None if channels is None else ["time"] + partitions + list(channels)
+    condition = None
+    if t0 is not None:
+        condition = ds.field("time") >= pa.scalar(int(t0 * 1e6), type=pa.timestamp('us', tz='UTC'))
+    if t1 is not None:
+        upper = ds.field("time") <= pa.scalar(int(t1 * 1e6), type=pa.timestamp('us', tz='UTC'))
+        condition = upper if condition is None else condition & upper
+    return dataset.to_table(columns=columns, filter=condition)
@@ -0,0 +1,135 @@
+"""
+Live plot of telemetry channels read from a RingBuffer.
+
+The plot never calls the DLL: a TelemetryPoller fills the buffer in its own thread
+and the plot only copies the recent window out of it. Redraws use blitting, so a
+frame only repaints the lines; axes and labels are redrawn only when a line leaves
+its y range. The frame rate is capped and frames are skipped when the buffer did
+not change.
+
+    buffer = RingBuffer(CHANNELS)
+    poller = TelemetryPoller(AD, interval=0.5, batch_size=1)
+    poller.subscribe(buffer)
+    poller.start()
+    LivePlot(buffer, ["sample_temperature", "magnetic_field_z"]).show()
+"""
+
+import math
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+class LivePlot:
+    """
+    Blitted strip chart of the last window seconds of several channels.
+    """
+
+    def __init__(self, buffer, channels, window: float = 600.0, max_fps: float = 5.0,
+                 max_points: int = 2000, columns: int = None):
+        """
+        Args:
+            buffer (RingBuffer): Buffer filled by a TelemetryPoller.
+            channels (list): Channels to plot, one axis each.
+            window (float): Seconds of history shown.
+            max_fps (float): Upper limit of the redraw rate.
+            max_points (int): Lines are decimated to at most this many points.
+            columns (int): Columns of the axes grid, chosen automatically if None.
+        """
+        self.buffer = buffer
+        self.channels = list(channels)
+        self.window = window
+        self.max_points = max_points
+        self.interval_ms = int(1000 / max_fps)
+
+        n = len(self.channels)
+        columns = columns or max(1, math.ceil(math.sqrt(n / 2)))
+        rows = math.ceil(n / columns)
+        self.figure, axes = plt.subplots(rows, columns, sharex=True, squeeze=False,
+                                         figsize=(6 * columns, 1.8 * rows))
+        self.axes = axes.ravel()[:n]
+        for ax in axes.ravel()[n:]:
+            ax.set_visible(False)
+
+        self.lines = []
+        for ax, name in zip(self.axes, self.channels):
+            ax.set_title(name, fontsize=8, loc='left')
+            ax.set_xlim(-window, 0)
+            ax.tick_params(labelsize=7)
+            line, = ax.plot([], [], lw=1, animated=True)
+            self.lines.append(line)
+        for ax in axes[-1]:
+            ax.set_xlabel("seconds ago", fontsize=7)
+        self.figure.tight_layout()
+
+        self._background = None
+        self._version = None
+        self.frame_time = 0.0
+        self.figure.canvas.mpl_connect('draw_event', self._on_draw)
+        self._timer = self.figure.canvas.new_timer(interval=self.interval_ms)
+        self._timer.add_callback(self.update)
+
+    def _on_draw(self, event) -> None:
+        # Full redraws happen on resize and when the y limits change
+        self._background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        for ax, line in zip(self.axes, self.lines):
+            ax.draw_artist(line)
+
+    def _rescale(self, ax, values: np.ndarray) -> bool:
+        """
+        Widens or narrows the y limits when the data left them or uses a small part.
+
+        A constant channel (zero-width range) fits as long as it lies inside the limits.
+        """
+        finite = values[np.isfinite(values)]
+        if finite.size == 0:
+            return False
+        low, high = finite.min(), finite.max()
+        bottom, top = ax.get_ylim()
+        span = top - bottom
+        if low >= bottom and high <= top and (high == low or (high - low) > 0.25 * span):
+            return False
+        margin = 0.1 * (high - low) or 0.1 * abs(high) or 1.0
+        ax.set_ylim(low - margin, high + margin)
+        return True
+
+    def update(self) -> None:
+        """
+        Draws one frame if the buffer changed since the last frame.
+        """
+        if self.buffer.version == self._version:
+            return
+        start = time.perf_counter()
+        self._version = self.buffer.version
+        times, values = self.buffer.latest(self.window, self.channels)
+        if times.size == 0:
+            return
+
+        x = times - times[-1]
+        step = max(1, x.size // self.max_points)
+        x = x[::step]
+        rescaled = False
+        for ax, line, name in zip(self.axes, self.lines, self.channels):
+            y = values[name][::step]
+            line.set_data(x, y)
+            rescaled |= self._rescale(ax, y)
+
+        canvas = self.figure.canvas
+        if rescaled or self._background is None:
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            for ax, line in zip(self.axes, self.lines):
+                ax.draw_artist(line)
+            canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+        self.frame_time = time.perf_counter() - start
+
+    def show(self) -> None:
+        """
+        Starts the redraw timer and blocks in the matplotlib event loop.
+        """
+        self._timer.start()
+        plt.show()
+        self._timer.stop()
@@ -0,0 +1,203 @@
+"""
+Field hold scheduling with persistent mode where it pays off.
+
+Entering and leaving persistent mode costs switch heater time, so it is only worth it
+for holds that are long compared with that overhead. The scheduler measures the time
+each transition takes (toggle_persistent_mode until is_persistent_mode_set() agrees
+and the field reads back stable), keeps a running average in a JSON file and puts
+every hold whose transitions stay below a fraction of its duration in persistent mode:
+
+    scheduler = PersistentHoldScheduler(AD, state_path="persistent.json")
+    holds = [FieldHold((0, 0, 1.0), 4 * 3600, measure), FieldHold((0, 0, 0.5), 600, measure)]
+    print(scheduler.run(holds))
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+import Attodry_tracing as tracing
+
+
+logger = logging.getLogger(__name__)
+
+
+class FieldHold:
+    """
+    One field held for a duration.
+    """
+
+    def __init__(self, field, duration: float, action=None):
+        """
+        Args:
+            field (tuple): (Bx, By, Bz) in T.
+            duration (float): Seconds to hold the field.
+            action (callable): Called once the field is ready, e.g. a measurement. If
+                               it returns before duration, the rest is waited out.
+        """
+        self.field = np.asarray(field, dtype=np.float64)
+        self.duration = duration
+        self.action = action
+
+
+class PersistentHoldScheduler:
+    """
+    Runs field holds, switching persistent mode on for the ones where it pays off.
+    """
+
+    # Transition times assumed before any were measured, in seconds
+    DEFAULT_ENTER_SECONDS = 120.0
+    DEFAULT_EXIT_SECONDS = 120.0
+
+    def __init__(self, interface, state_path: str = None, max_overhead: float = 0.1,
+                 tolerance: float = 4e-4, hits: int = 4, poll: float = 1.0,
+                 transition_timeout: float = 1800.0, lock=None):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface with field control active.
+            state_path (str): JSON file keeping the measured transition times.
+            max_overhead (float): Largest fraction of a hold that transitions may take.
+            tolerance (float): Field tolerance in T for the verification.
+            hits (int): Consecutive readings inside the tolerance needed.
+            poll (float): Seconds between readings.
+            transition_timeout (float): Seconds before a transition counts as failed.
+            lock (threading.RLock): Lock shared with other threads using the interface.
+        """
+        self._ad = interface
+        self.state_path = state_path
+        self.max_overhead = max_overhead
+        self.tolerance = tolerance
+        self.hits = hits
+        self.poll = poll
+        self.transition_timeout = transition_timeout
+        self.lock = lock or threading.RLock()
+
+        self._state = {"enter_seconds": None, "exit_seconds": None}
+        if state_path is not None and os.path.isfile(state_path):
+            with open(state_path, 'r') as f:
+                self._state.update(json.load(f))
+
+    @property
+    def enter_seconds(self) -> float:
+        return self._state.get("enter_seconds") or self.DEFAULT_ENTER_SECONDS
+
+    @property
+    def exit_seconds(self) -> float:
+        return self._state.get("exit_seconds") or self.DEFAULT_EXIT_SECONDS
+
+    def _record_duration(self, key: str, seconds: float) -> None:
+        previous = self._state.get(key)
+        self._state[key] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+        if self.state_path is None:
+            return
+        tmp = self.state_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def plan(self, holds) -> list:
+        """
+        Decides per hold whether to use persistent mode.
+
+        Returns:
+            list: One bool per hold.
+        """
+        overhead = self.enter_seconds + self.exit_seconds
+        return [hold.duration * self.max_overhead >= overhead for hold in holds]
+
+    def _read_field(self) -> np.ndarray:
+        with self.lock:
+            return np.array([self._ad.get_magnetic_field_axis('X'),
+                             self._ad.get_magnetic_field(),
+                             self._ad.get_magnetic_field_axis('Z')])
+
+    def _set_field(self, field: np.ndarray) -> None:
+        with self.lock:
+            self._ad.set_user_magnetic_field_axis('X', field[0])
+            self._ad.set_user_magnetic_field(field[1])
+            self._ad.set_user_magnetic_field_axis('Z', field[2])
+
+    def _wait(self, field: np.ndarray, persistent: bool = None) -> float:
+        """
+        Polls until the field is stable at field and, if given, the persistent mode
+        flag has the expected value.
+
+        Returns:
+            float: Seconds waited.
+        """
+        start = time.monotonic()
+        count = 0
+        while count < self.hits:
+            inside = np.all(np.abs(self._read_field() - field) <= self.tolerance)
+            if persistent is not None:
+                with self.lock:
+                    inside = inside and self._ad.is_persistent_mode_set() == persistent
+            count = count + 1 if inside else 0
+            if time.monotonic() - start > self.transition_timeout:
+                raise TimeoutError(f"Field {field} T not verified within {self.transition_timeout} s")
+            if count < self.hits:
+                time.sleep(self.poll)
+        return time.monotonic() - start
+
+    def set_persistent(self, persistent: bool, field: np.ndarray) -> float:
+        """
+        Switches persistent mode if needed and verifies the transition.
+
+        Returns:
+            float: Seconds the transition took, 0 if nothing changed.
+        """
+        with self.lock:
+            if self._ad.is_persistent_mode_set() == persistent:
+                return 0.0
+            self._ad.toggle_persistent_mode()
+        with tracing.span("persistent" if persistent else "driven", "persistent_mode"):
+            seconds = self._wait(field, persistent)
+        self._record_duration("enter_seconds" if persistent else "exit_seconds", seconds)
+        logger.info("%s persistent mode in %.0f s", "Entered" if persistent else "Left", seconds)
+        return seconds
+
+    def run(self, holds, restore: bool = True) -> dict:
+        """
+        Runs all holds in order.
+
+        Args:
+            holds (list): FieldHolds.
+            restore (bool): Return to the initial persistent mode setting at the end.
+
+        Returns:
+            dict: Number of persistent holds, seconds spent in transitions and seconds
+                  the magnet supply did not have to drive the field.
+        """
+        plan = self.plan(holds)
+        with self.lock:
+            initial = self._ad.is_persistent_mode_set()
+        report = {"persistent_holds": sum(plan), "transition_seconds": 0.0, "persistent_seconds": 0.0}
+
+        for hold, persistent in zip(holds, plan):
+            # Leave persistent mode before changing the field of a driven hold; for a
+            # persistent hold the attoDRY heats the switch for the change by itself
+            if not persistent:
+                report["transition_seconds"] += self.set_persistent(False, self._read_field())
+            self._set_field(hold.field)
+            with tracing.span("field", "ramping"):
+                self._wait(hold.field)
+            if persistent:
+                report["transition_seconds"] += self.set_persistent(True, hold.field)
+
+            start = time.monotonic()
+            if hold.action is not None:
+                with tracing.span("hold", "acquisition"):
+                    hold.action()
+            remaining = hold.duration - (time.monotonic() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+            if persistent:
+                report["persistent_seconds"] += time.monotonic() - start
+
+        if restore:
+            report["transition_seconds"] += self.set_persistent(initial, self._read_field())
+        return report
@@ -0,0 +1,344 @@
+"""
+Offline PID autotuning from recorded step responses.
+
+Traces of get_sample_temperature and get_heater_output are cut at every step of the
+heater output, and a first-order-plus-dead-time (FOPDT) model is fitted to each step
+with a vectorized grid search. Models are grouped in temperature bands, and for every
+band the IMC-PID closed loop is simulated for a range of tuning constants at once to
+pick the gains with the shortest settling time.
+
+The gains are returned in parallel form (P = Kc, I = Kc/Ti, D = Kc*Td). Pass a
+different to_device function if the temperature controller expects another convention.
+"""
+
+import numpy as np
+
+
+class FOPDTModel:
+    """
+    First-order-plus-dead-time process model, dT/du = K exp(-theta s) / (tau s + 1).
+
+    Attributes:
+        gain (float): Static gain K in Kelvin per heater output percent.
+        tau (float): Time constant in seconds.
+        dead_time (float): Dead time theta in seconds.
+        temperature (float): Temperature at which the step was recorded, in Kelvin.
+        heater_output (float): Heater output before the step, in percent.
+        rms_error (float): RMS residual of the fit in Kelvin.
+    """
+
+    def __init__(self, gain: float, tau: float, dead_time: float,
+                 temperature: float = float('nan'), heater_output: float = 0.0,
+                 rms_error: float = float('nan')):
+        self.gain = gain
+        self.tau = tau
+        self.dead_time = dead_time
+        self.temperature = temperature
+        self.heater_output = heater_output
+        self.rms_error = rms_error
+
+    def __repr__(self) -> str:
+        return (f"FOPDTModel(K={self.gain:.4g} K/%, tau={self.tau:.4g} s, "
+                f"theta={self.dead_time:.4g} s, T={self.temperature:.4g} K)")
+
+
+class GainBand:
+    """
+    PID gains used while the setpoint lies in [low, high).
+    """
+
+    def __init__(self, low: float, high: float, p: float, i: float, d: float,
+                 settling_time: float = float('nan')):
+        self.low = low
+        self.high = high
+        self.p = p
+        self.i = i
+        self.d = d
+        self.settling_time = settling_time
+
+    def contains(self, temperature: float) -> bool:
+        return self.low <= temperature < self.high
+
+    def __repr__(self) -> str:
+        return (f"GainBand({self.low:g}-{self.high:g} K: P={self.p:.4g}, I={self.i:.4g}, "
+                f"D={self.d:.4g}, settles in {self.settling_time:.0f} s)")
+
+
+def ideal_to_parallel(kc: float, ti: float, td: float) -> tuple:
+    """
+    Converts ideal PID parameters (Kc, Ti, Td) to parallel gains (P, I, D).
+    """
+    return kc, kc / ti, kc * td
+
+
+def find_steps(heater_output: np.ndarray, min_step: float = 1.0) -> np.ndarray:
+    """
+    Indices at which the heater output jumps by more than min_step percent.
+    """
+    u = np.asarray(heater_output, dtype=np.float64)
+    return np.flatnonzero(np.abs(np.diff(u)) > min_step) + 1
+
+
+def _grid_fit(ts: np.ndarray, dy: np.ndarray, taus: np.ndarray, thetas: np.ndarray) -> tuple:
+    """
+    Least-squares fit of dy = A (1 - exp(-(ts - theta)/tau)) over a (tau, theta) grid.
+
+    Returns:
+        tuple: (tau, theta, amplitude, sse) of the best candidate.
+    """
+    tau, theta = (a.reshape(-1, 1) for a in np.meshgrid(taus, thetas, indexing='ij'))
+    shape = 1 - np.exp(-np.clip(ts - theta, 0, None) / tau)
+    shape_dy = shape @ dy
+    shape_sq = np.einsum('ij,ij->i', shape, shape)
+    amplitude = np.divide(shape_dy, shape_sq, out=np.zeros_like(shape_dy), where=shape_sq > 0)
+    sse = dy @ dy - amplitude * shape_dy
+    best = int(np.argmin(sse))
+    return float(tau[best, 0]), float(theta[best, 0]), float(amplitude[best]), float(sse[best])
+
+
+def fit_fopdt(t: np.ndarray, temperature: np.ndarray, heater_output: np.ndarray,
+              step_index: int, end_index: int = None, n_grid: int = 48,
+              max_points: int = 2000) -> FOPDTModel:
+    """
+    Fits an FOPDT model to the response following one heater output step.
+
+    All (tau, theta) candidates are evaluated at once by broadcasting. For each
+    candidate the gain has a closed form least-squares solution, so only the two
+    time parameters are searched, first on a coarse grid and then on a finer grid
+    around the best candidate. The temperature is assumed to be steady before the step.
+
+    Args:
+        t (np.ndarray): Sample times in seconds.
+        temperature (np.ndarray): Sample temperature in Kelvin.
+        heater_output (np.ndarray): Heater output in percent.
+        step_index (int): First sample after the step.
+        end_index (int): End of the segment, defaults to the end of the trace.
+        n_grid (int): Number of candidates per time parameter.
+        max_points (int): The segment is decimated to at most this many samples.
+
+    Returns:
+        FOPDTModel: Best fitting model.
+    """
+    end_index = len(t) if end_index is None else end_index
+    if step_index < 1 or end_index - step_index < 4:
+        raise ValueError("Step response segment is too short to fit")
+
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(temperature, dtype=np.float64)
+    u = np.asarray(heater_output, dtype=np.float64)
+    decimate = max(1, (end_index - step_index) // max_points)
+    ts = t[step_index:end_index:decimate] - t[step_index - 1]
+    dy = y[step_index:end_index:decimate] - y[step_index - 1]
+    du = u[step_index] - u[step_index - 1]
+    span = ts[-1]
+
+    taus = np.geomspace(max(span / 1000, 1e-3), span, n_grid)
+    thetas = np.linspace(0, span / 2, n_grid)
+    tau, theta, amplitude, sse = _grid_fit(ts, dy, taus, thetas)
+
+    tau_ratio = taus[1] / taus[0]
+    theta_step = thetas[1] - thetas[0]
+    taus = np.geomspace(tau / tau_ratio, tau * tau_ratio, n_grid)
+    thetas = np.linspace(max(theta - theta_step, 0), theta + theta_step, n_grid)
+    tau, theta, amplitude, sse = _grid_fit(ts, dy, taus, thetas)
+
+    return FOPDTModel(gain=amplitude / du, tau=tau, dead_time=theta,
+                      temperature=float(y[step_index - 1]),
+                      heater_output=float(u[step_index - 1]),
+                      rms_error=float(np.sqrt(max(sse, 0) / len(ts))))
+
+
+def imc_pid(model: FOPDTModel, tau_c: np.ndarray) -> tuple:
+    """
+    IMC-PID settings for an FOPDT model (Rivera, Morari and Skogestad).
+
+    Args:
+        model (FOPDTModel): Process model.
+        tau_c (np.ndarray): Desired closed loop time constants in seconds.
+
+    Returns:
+        tuple: Arrays (Kc, Ti, Td), one entry per tau_c.
+    """
+    tau_c = np.asarray(tau_c, dtype=np.float64)
+    half_theta = model.dead_time / 2
+    kc = (model.tau + half_theta) / (model.gain * (tau_c + half_theta))
+    ti = np.full_like(tau_c, model.tau + half_theta)
+    td = np.full_like(tau_c, model.tau * model.dead_time / (2 * model.tau + model.dead_time))
+    return kc, ti, td
+
+
+def simulate_settling(model: FOPDTModel, kc: np.ndarray, ti: np.ndarray, td: np.ndarray,
+                      step: float, tolerance: float, duration: float = None,
+                      dt: float = None) -> np.ndarray:
+    """
+    Simulates a setpoint step for several PID settings at once.
+
+    The loop over time is in Python, the candidates are a vector. The heater output
+    is limited to 0-100 percent around the operating point of the model, with
+    conditional integration as anti-windup and derivative on measurement.
+
+    Args:
+        model (FOPDTModel): Process model.
+        kc, ti, td (np.ndarray): Ideal PID parameters, one entry per candidate.
+        step (float): Setpoint step in Kelvin.
+        tolerance (float): Settling band in Kelvin.
+        duration (float): Simulated time, defaults to 20 (tau + theta).
+        dt (float): Time step, defaults to a fiftieth of the smaller time parameter but
+                    at least tau / 500, so a tiny dead time does not blow up the step
+                    count. A non-zero dead time is delayed by at least one step.
+
+    Returns:
+        np.ndarray: Settling time per candidate in seconds, inf if it never settles.
+    """
+    kc, ti, td = (np.asarray(a, dtype=np.float64) for a in (kc, ti, td))
+    duration = duration or 20 * (model.tau + model.dead_time)
+    dt = dt or max(model.tau / 500, min(model.tau, model.dead_time or model.tau) / 50)
+    n_steps = int(np.ceil(duration / dt))
+    delay = max(int(round(model.dead_time / dt)), 1 if model.dead_time > 0 else 0)
+
+    u_low, u_high = -model.heater_output, 100.0 - model.heater_output
+    y = np.zeros_like(kc)
+    y_prev = np.zeros_like(kc)
+    integral = np.zeros_like(kc)
+    history = np.zeros((delay + 1, kc.size))
+    last_outside = np.zeros_like(kc)
+    a = dt / model.tau
+
+    for n in range(n_steps):
+        error = step - y
+        unsat = kc * (error + integral / ti - td * (y - y_prev) / dt)
+        u = np.clip(unsat, u_low, u_high)
+        # Only integrate while the output is not saturated, or when it helps to leave saturation
+        integrate = (u == unsat) | (np.sign(error) != np.sign(unsat))
+        integral += np.where(integrate, error * dt, 0.0)
+
+        history[n % (delay + 1)] = u
+        delayed = history[(n + 1) % (delay + 1)] if delay else u
+        y_prev = y
+        y = y + a * (model.gain * delayed - y)
+
+        outside = np.abs(y - step) > tolerance
+        last_outside = np.where(outside, (n + 1) * dt, last_outside)
+
+    settled = np.abs(y - step) <= tolerance
+    return np.where(settled, last_outside, np.inf)
+
+
+def tune_model(model: FOPDTModel, step: float = 1.0, tolerance: float = 0.01,
+               to_device=ideal_to_parallel, n_candidates: int = 32) -> tuple:
+    """
+    Picks the IMC tuning constant with the shortest simulated settling time.
+
+    Args:
+        model (FOPDTModel): Process model.
+        step (float): Setpoint step in Kelvin used for the simulation.
+        tolerance (float): Settling band in Kelvin.
+        to_device (callable): Converts (Kc, Ti, Td) to the gains passed to the setters.
+        n_candidates (int): Number of closed loop time constants tried.
+
+    Returns:
+        tuple: ((P, I, D), settling_time)
+    """
+    scale = max(model.dead_time, model.tau / 10)
+    tau_c = np.geomspace(scale / 10, 10 * scale, n_candidates)
+    kc, ti, td = imc_pid(model, tau_c)
+    settling = simulate_settling(model, kc, ti, td, step, tolerance)
+    best = int(np.argmin(settling))
+    return to_device(kc[best], ti[best], td[best]), float(settling[best])
+
+
+def autotune(t: np.ndarray, temperature: np.ndarray, heater_output: np.ndarray,
+             band_edges, min_step: float = 1.0, tolerance: float = 0.01,
+             to_device=ideal_to_parallel) -> list:
+    """
+    Builds a gain schedule from recorded traces.
+
+    Every heater output step is fitted, models are assigned to the band that
+    contains the temperature before the step, and the median model of each band
+    is tuned. Bands without any step are left out of the schedule.
+
+    Args:
+        t (np.ndarray): Sample times in seconds.
+        temperature (np.ndarray): Sample temperature in Kelvin.
+        heater_output (np.ndarray): Heater output in percent.
+        band_edges (list): Increasing temperatures separating the bands.
+        min_step (float): Smallest heater output change treated as a step, in percent.
+        tolerance (float): Settling band in Kelvin.
+        to_device (callable): Converts (Kc, Ti, Td) to device gains.
+
+    Returns:
+        list: GainBand per band with data, ordered by temperature.
+    """
+    edges = np.asarray(band_edges, dtype=np.float64)
+    steps = find_steps(heater_output, min_step)
+    bounds = np.append(steps, len(t))
+
+    models = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end - start >= 4:
+            models.append(fit_fopdt(t, temperature, heater_output, start, end))
+
+    band_of = np.searchsorted(edges, [m.temperature for m in models], side='right')
+    schedule = []
+    for band in range(len(edges) - 1):
+        members = [m for m, b in zip(models, band_of) if b == band + 1]
+        if not members:
+            continue
+        median = FOPDTModel(
+            gain=float(np.median([m.gain for m in members])),
+            tau=float(np.median([m.tau for m in members])),
+            dead_time=float(np.median([m.dead_time for m in members])),
+            temperature=float(np.median([m.temperature for m in members])),
+            heater_output=float(np.median([m.heater_output for m in members])),
+        )
+        (p, i, d), settling = tune_model(median, step=10 * tolerance, tolerance=tolerance,
+                                         to_device=to_device)
+        schedule.append(GainBand(edges[band], edges[band + 1], p, i, d, settling))
+    return schedule
+
+
+class GainScheduler:
+    """
+    Applies a gain schedule through set_proportional_gain, set_integral_gain and
+    set_derivative_gain whenever the temperature setpoint moves to another band.
+    """
+
+    def __init__(self, interface, schedule: list):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface.
+            schedule (list): GainBand list, e.g. from autotune().
+        """
+        self._ad = interface
+        self.schedule = sorted(schedule, key=lambda band: band.low)
+        self.active = None
+
+    def band_for(self, temperature: float) -> GainBand:
+        for band in self.schedule:
+            if band.contains(temperature):
+                return band
+        return None
+
+    def update(self, setpoint: float) -> bool:
+        """
+        Sends the gains of the band containing setpoint, if it is not active yet.
+        Call this from ramp loops where the setpoint changes gradually.
+
+        Returns:
+            bool: True if gains were sent.
+        """
+        band = self.band_for(setpoint)
+        if band is None or band is self.active:
+            return False
+        self._ad.set_proportional_gain(band.p)
+        self._ad.set_integral_gain(band.i)
+        self._ad.set_derivative_gain(band.d)
+        self.active = band
+        return True
+
+    def set_user_temperature(self, temperature_k: float) -> None:
+        """
+        Applies the gains for the new setpoint, then sets the user temperature.
+        """
+        self.update(temperature_k)
+        self._ad.set_user_temperature(temperature_k)
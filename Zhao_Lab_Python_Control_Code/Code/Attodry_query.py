@@ -0,0 +1,355 @@
+"""
+Query engine over archived telemetry with zone maps and predicate pushdown.
+
+Questions like "all intervals where the sample is below 2 K and |B| is above 5 T" are
+answered without decoding every archive. Each block of an archive has a zone map
+(minimum and maximum per channel); blocks whose zone map cannot satisfy the
+predicate are skipped. The remaining blocks are decoded in a thread pool, only for
+the channels the predicate uses, and evaluated vectorized. Results are lists of
+(start, end) intervals and the most recent ones are kept in an LRU cache:
+
+    engine = QueryEngine(glob.glob("archives/*.adry"))
+    field = magnitude("magnetic_field_x", "magnetic_field_y", "magnetic_field_z")
+    intervals = engine.query((channel("sample_temperature") < 2) & (field > 5), t0=time.time() - 365 * 86400)
+
+Comparisons bind weaker than & and | in Python, so put them in parentheses.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Attodry_archive import ArchiveReader
+
+
+class Expression:
+    """
+    Value computed from channels. Comparing it with a number gives a Predicate.
+    """
+
+    channels = ()
+
+    def bounds(self, low: dict, high: dict) -> tuple:
+        """
+        Smallest and largest value per block, from the zone maps of the channels.
+        """
+        raise NotImplementedError
+
+    def value(self, values: dict) -> np.ndarray:
+        raise NotImplementedError
+
+    def __lt__(self, limit):
+        return Compare(self, '<', limit)
+
+    def __le__(self, limit):
+        return Compare(self, '<=', limit)
+
+    def __gt__(self, limit):
+        return Compare(self, '>', limit)
+
+    def __ge__(self, limit):
+        return Compare(self, '>=', limit)
+
+    def between(self, low: float, high: float) -> "Predicate":
+        return Compare(self, '>=', low) & Compare(self, '<=', high)
+
+
+class Channel(Expression):
+    def __init__(self, name: str):
+        self.name = name
+        self.channels = (name,)
+
+    def bounds(self, low: dict, high: dict) -> tuple:
+        return low[self.name], high[self.name]
+
+    def value(self, values: dict) -> np.ndarray:
+        return values[self.name]
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+class Magnitude(Expression):
+    """
+    Euclidean norm of several channels, e.g. |B| of the three field axes.
+    """
+
+    def __init__(self, *names: str):
+        self.channels = tuple(names)
+
+    def bounds(self, low: dict, high: dict) -> tuple:
+        smallest, largest = 0.0, 0.0
+        for name in self.channels:
+            lo, hi = low[name], high[name]
+            lo2, hi2 = lo * lo, hi * hi
+            largest = largest + np.maximum(lo2, hi2)
+            # An axis whose range contains zero can contribute nothing
+            smallest = smallest + np.where((lo <= 0) & (hi >= 0), 0.0, np.minimum(lo2, hi2))
+        return np.sqrt(smallest), np.sqrt(largest)
+
+    def value(self, values: dict) -> np.ndarray:
+        return np.sqrt(sum(values[name] ** 2 for name in self.channels))
+
+    def __repr__(self) -> str:
+        return f"|{', '.join(self.channels)}|"
+
+
+def channel(name: str) -> Channel:
+    return Channel(name)
+
+
+def magnitude(*names: str) -> Magnitude:
+    return Magnitude(*names)
+
+
+class Predicate:
+    """
+    Boolean condition on telemetry samples. Combine with &, | and ~.
+    """
+
+    channels = ()
+
+    def prune(self, low: dict, high: dict) -> np.ndarray:
+        """
+        True for blocks that may contain matching samples, False only if they cannot.
+        """
+        raise NotImplementedError
+
+    def evaluate(self, values: dict) -> np.ndarray:
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Compare(Predicate):
+    def __init__(self, expression: Expression, op: str, limit: float):
+        self.expression = expression
+        self.op = op
+        self.limit = float(limit)
+        self.channels = expression.channels
+
+    def prune(self, low: dict, high: dict) -> np.ndarray:
+        lo, hi = self.expression.bounds(low, high)
+        if self.op == '<':
+            return lo < self.limit
+        if self.op == '<=':
+            return lo <= self.limit
+        if self.op == '>':
+            return hi > self.limit
+        return hi >= self.limit
+
+    def evaluate(self, values: dict) -> np.ndarray:
+        x = self.expression.value(values)
+        if self.op == '<':
+            return x < self.limit
+        if self.op == '<=':
+            return x <= self.limit
+        if self.op == '>':
+            return x > self.limit
+        return x >= self.limit
+
+    def __repr__(self) -> str:
+        return f"({self.expression!r} {self.op} {self.limit!r})"
+
+
+class And(Predicate):
+    def __init__(self, left: Predicate, right: Predicate):
+        self.left, self.right = left, right
+        self.channels = tuple(dict.fromkeys(left.channels + right.channels))
+
+    def prune(self, low: dict, high: dict) -> np.ndarray:
+        return self.left.prune(low, high) & self.right.prune(low, high)
+
+    def evaluate(self, values: dict) -> np.ndarray:
+        return self.left.evaluate(values) & self.right.evaluate(values)
+
+    def __repr__(self) -> str:
+        return f"({self.left!r} & {self.right!r})"
+
+
+class Or(Predicate):
+    def __init__(self, left: Predicate, right: Predicate):
+        self.left, self.right = left, right
+        self.channels = tuple(dict.fromkeys(left.channels + right.channels))
+
+    def prune(self, low: dict, high: dict) -> np.ndarray:
+        return self.left.prune(low, high) | self.right.prune(low, high)
+
+    def evaluate(self, values: dict) -> np.ndarray:
+        return self.left.evaluate(values) | self.right.evaluate(values)
+
+    def __repr__(self) -> str:
+        return f"({self.left!r} | {self.right!r})"
+
+
+class Not(Predicate):
+    def __init__(self, inner: Predicate):
+        self.inner = inner
+        self.channels = inner.channels
+
+    def prune(self, low: dict, high: dict) -> np.ndarray:
+        # Zone maps cannot rule out a negation, every block has to be checked
+        return np.ones(np.shape(next(iter(low.values()))), dtype=bool)
+
+    def evaluate(self, values: dict) -> np.ndarray:
+        return ~self.inner.evaluate(values)
+
+    def __repr__(self) -> str:
+        return f"~{self.inner!r}"
+
+
+def _runs(times: np.ndarray, mask: np.ndarray, max_gap: float = None) -> list:
+    """
+    Intervals of consecutive True samples, split where samples are more than max_gap apart.
+
+    Returns:
+        list: (start index, end index) pairs, end inclusive.
+    """
+    edges = np.diff(mask.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    if max_gap is not None and starts.size:
+        gaps = np.flatnonzero(np.diff(times) > max_gap)
+        # Gaps inside a run split it into two
+        inside = gaps[mask[gaps] & mask[gaps + 1]]
+        if inside.size:
+            starts = np.sort(np.concatenate((starts, inside + 1)))
+            ends = np.sort(np.concatenate((ends, inside)))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class QueryEngine:
+    """
+    Interval queries over a set of telemetry archives.
+    """
+
+    def __init__(self, paths, workers: int = None, cache_size: int = 64):
+        """
+        Args:
+            paths (list): Archive files.
+            workers (int): Threads decoding blocks, the number of CPUs if None.
+            cache_size (int): Query results kept in the LRU cache.
+        """
+        self.paths = list(paths)
+        self.workers = workers or os.cpu_count()
+        self.cache_size = cache_size
+        self.last_stats = {}
+        self._readers = {}
+        self._zones = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _reader(self, path: str) -> ArchiveReader:
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        entry = self._readers.get(path)
+        if entry is None or entry[0] != key:
+            if entry is not None:
+                entry[1].close()
+            reader = ArchiveReader(path)
+            low, high = reader.zone_maps(self.workers)
+            self._readers[path] = (key, reader)
+            self._zones[path] = ({name: low[:, i] for i, name in enumerate(reader.channels)},
+                                 {name: high[:, i] for i, name in enumerate(reader.channels)})
+        return self._readers[path][1]
+
+    def _candidates(self, predicate: Predicate, t0: float, t1: float) -> list:
+        """
+        (path, block index, block) of all blocks in the time range that may match.
+        """
+        candidates = []
+        total = 0
+        for path in self.paths:
+            reader = self._reader(path)
+            if not reader.blocks or any(name not in reader.channels for name in predicate.channels):
+                continue
+            low, high = self._zones[path]
+            with np.errstate(invalid='ignore'):
+                keep = predicate.prune(low, high)
+            for i, block in enumerate(reader.blocks):
+                if (t0 is not None and block.t_last < t0) or (t1 is not None and block.t_first > t1):
+                    continue
+                total += 1
+                if keep[i]:
+                    candidates.append((path, i, block))
+        self.last_stats = {"blocks": total, "scanned": len(candidates)}
+        return candidates
+
+    def _evaluate(self, predicate: Predicate, path: str, block, t0: float, t1: float,
+                  max_gap: float) -> tuple:
+        times, values = self._readers[path][1].decode_block(block, list(predicate.channels))
+        with np.errstate(invalid='ignore'):
+            mask = predicate.evaluate(values)
+        if t0 is not None:
+            mask &= times >= t0
+        if t1 is not None:
+            mask &= times <= t1
+        runs = _runs(times, mask, max_gap)
+        return times, runs
+
+    def query(self, predicate: Predicate, t0: float = None, t1: float = None,
+              max_gap: float = None) -> list:
+        """
+        Finds the time intervals in which the predicate holds.
+
+        Args:
+            predicate (Predicate): Condition on the channels.
+            t0, t1 (float): Time range in Unix seconds, open ended if None.
+            max_gap (float): Samples further apart than this end an interval, e.g.
+                             to split at recording gaps. No limit if None.
+
+        Returns:
+            list: (start, end) Unix time pairs of the first and last matching sample.
+        """
+        with self._lock:
+            files = tuple((p, os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in self.paths)
+            key = (repr(predicate), t0, t1, max_gap, files)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.last_stats = {"cached": True}
+                return list(self._cache[key])
+
+            start = time.perf_counter()
+            candidates = self._candidates(predicate, t0, t1)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(lambda c: self._evaluate(predicate, c[0], c[2], t0, t1, max_gap),
+                                        candidates))
+
+            # Join intervals that continue across consecutive blocks of one archive
+            intervals = []
+            previous = None
+            for (path, index, _), (times, runs) in zip(candidates, results):
+                for first, last in runs:
+                    t_start, t_end = float(times[first]), float(times[last])
+                    joins = (previous is not None and previous[0] == path and previous[1] == index - 1
+                             and previous[2] and first == 0
+                             and (max_gap is None or t_start - intervals[-1][1] <= max_gap))
+                    if joins:
+                        intervals[-1] = (intervals[-1][0], t_end)
+                    else:
+                        intervals.append((t_start, t_end))
+                open_end = bool(runs) and runs[-1][1] == times.size - 1
+                previous = (path, index, open_end)
+
+            intervals.sort()
+            self.last_stats["seconds"] = time.perf_counter() - start
+            self._cache[key] = intervals
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return list(intervals)
+
+    def close(self) -> None:
+        for _, reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
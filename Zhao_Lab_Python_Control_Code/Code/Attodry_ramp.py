@@ -0,0 +1,156 @@
+"""
+Concurrent ramps of the temperature and the three magnet axes.
+
+Instead of ramping the temperature and then each field axis with its own polling
+loop, the executor sends all setpoints at once and watches every actuator from one
+loop that reads a single snapshot per tick. A move is complete when every target
+holds at the same time, so it takes as long as the slowest actuator instead of the
+sum of all of them:
+
+    executor = RampExecutor(AD)
+    report = executor.run({"temperature": 4.0, "field_z": 1.0, "field_x": 0.2})
+    print(report["seconds"], report["reached"])
+
+Actuators that depend on each other go into consecutive stages, e.g.
+executor.run({"temperature": 4.0}, {"field_z": 5.0}). The executor can also wait
+for a RecipeRunner: RecipeRunner(AD, points, wait=executor.wait_for_point).
+"""
+
+import logging
+import threading
+import time
+
+import Attodry_tracing as tracing
+from Attodry_telemetry import read_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+# Actuator name -> (setter, leading arguments, telemetry channel, default tolerance)
+ACTUATORS = {
+    "temperature": ("set_user_temperature", (), "sample_temperature", 0.05),
+    "field_x":     ("set_user_magnetic_field_axis", ("X",), "magnetic_field_x", 4e-4),
+    "field_y":     ("set_user_magnetic_field", (), "magnetic_field_y", 4e-4),
+    "field_z":     ("set_user_magnetic_field_axis", ("Z",), "magnetic_field_z", 4e-4),
+}
+
+# Order of the actuators in a recipe point (T, Bx, By, Bz)
+POINT = ("temperature", "field_x", "field_y", "field_z")
+
+
+class RampExecutor:
+    """
+    Sends setpoints to several actuators and waits for all of them in one loop.
+    """
+
+    def __init__(self, interface, poll: float = 0.5, hits: int = 4, tolerance: dict = None,
+                 timeout: float = None, poller=None, lock=None):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface with temperature and
+                                          field control active.
+            poll (float): Seconds between snapshots.
+            hits (int): Consecutive snapshots in which all targets hold.
+            tolerance (dict): Actuator name -> tolerance, overriding ACTUATORS.
+            timeout (float): Seconds before a stage counts as failed, no limit if None.
+            poller (TelemetryPoller): Running poller to take snapshots from instead of
+                                      reading them, so the executor adds no getter calls.
+            lock (threading.RLock): Lock shared with other threads using the interface,
+                                    the poller lock if a poller is given.
+        """
+        self._ad = interface
+        self.poll = poll
+        self.hits = hits
+        self.tolerance = {name: spec[3] for name, spec in ACTUATORS.items()}
+        self.tolerance.update(tolerance or {})
+        self.timeout = timeout
+        self.poller = poller
+        self.lock = lock or (poller.lock if poller is not None else threading.RLock())
+
+    def send(self, targets: dict) -> None:
+        """
+        Sends the setpoints of all targets.
+        """
+        with self.lock:
+            for name, value in targets.items():
+                method, args, _, _ = ACTUATORS[name]
+                getattr(self._ad, method)(*args, value)
+
+    def _snapshot(self, channels: list, last_time: float) -> tuple:
+        if self.poller is None:
+            with self.lock:
+                return read_snapshot(self._ad, channels), time.monotonic()
+        # Wait up to one poll period for a snapshot newer than the last one used
+        deadline = time.monotonic() + self.poll
+        while self.poller.latest_time == last_time and time.monotonic() < deadline:
+            time.sleep(min(self.poll, self.poller.interval) / 4)
+        if self.poller.latest_time == last_time:
+            return None, last_time
+        return self.poller.latest, self.poller.latest_time
+
+    def wait(self, targets: dict) -> dict:
+        """
+        Polls until every target holds for hits consecutive snapshots.
+
+        Returns:
+            dict: Actuator name -> seconds until it first reached its target.
+        """
+        unknown = set(targets) - set(ACTUATORS)
+        if unknown:
+            raise ValueError(f"Unknown actuators {sorted(unknown)}, expected names from ACTUATORS")
+        channels = [ACTUATORS[name][2] for name in targets]
+        start = time.monotonic()
+        reached = {}
+        count = 0
+        last_time = None
+        while count < self.hits:
+            snapshot, last_time = self._snapshot(channels, last_time)
+            elapsed = time.monotonic() - start
+            if snapshot is None:
+                # The poller stalled, start counting again from its next snapshot
+                snapshot = {}
+            inside = True
+            for name, target in targets.items():
+                if abs(snapshot.get(ACTUATORS[name][2], float('nan')) - target) <= self.tolerance[name]:
+                    reached.setdefault(name, elapsed)
+                else:
+                    inside = False
+            count = count + 1 if inside else 0
+            if self.timeout is not None and elapsed > self.timeout:
+                pending = sorted(set(targets) - set(reached))
+                raise TimeoutError(f"Targets {targets} not reached within {self.timeout} s, "
+                                   f"pending: {pending or 'settling'}")
+            if count < self.hits and self.poller is None:
+                time.sleep(self.poll)
+        return reached
+
+    def run(self, *stages: dict) -> dict:
+        """
+        Runs stages one after the other, the actuators of a stage concurrently.
+
+        Args:
+            stages (dict): Actuator name -> target, in T for the field axes and K
+                           for the temperature.
+
+        Returns:
+            dict: "seconds" of the whole run, "reached" with the seconds each actuator
+                  needed in its stage and "sequential_seconds", the sum of those,
+                  which ramping one actuator after the other would have taken at least.
+        """
+        start = time.monotonic()
+        reached = {}
+        for targets in stages:
+            with tracing.span("ramp", "ramping"):
+                self.send(targets)
+                reached.update(self.wait(targets))
+        seconds = time.monotonic() - start
+        logger.info("Ramp done in %.0f s, one after the other at least %.0f s",
+                    seconds, sum(reached.values()))
+        return {"seconds": seconds, "reached": reached, "sequential_seconds": sum(reached.values())}
+
+    def wait_for_point(self, interface, point) -> dict:
+        """
+        Waits for a recipe point (T, Bx, By, Bz), for use as RecipeRunner(wait=...).
+        """
+        return self.wait(dict(zip(POINT, (float(v) for v in point))))
@@ -0,0 +1,299 @@
+"""
+Measurement recipes over (temperature, Bx, By, Bz) points with ramp-time-aware ordering.
+
+Instead of nested loops over set_user_temperature and set_user_magnetic_field_axis,
+the points of a grid are ordered to minimise the total transition time. Transition
+times come from a model based on get_temperature_ramp_rate and get_magnet_sweep_rate
+with slower cooling than heating. The order is found with nearest neighbour plus
+2-opt, and the predicted saving is known before anything is sent:
+
+    runner = RecipeRunner(AD, grid(temperatures=[2, 10, 50], bz=[-1, 0, 1]))
+    print(runner.plan())
+    runner.run(measure)
+"""
+
+import time
+
+import numpy as np
+
+import Attodry_tracing as tracing
+
+
+# Column order of recipe points
+TEMPERATURE, BX, BY, BZ = range(4)
+
+
+def grid(temperatures, bx=(0.0,), by=(0.0,), bz=(0.0,)) -> np.ndarray:
+    """
+    All combinations of the given setpoints, in nested loop order (temperature outermost).
+
+    Returns:
+        np.ndarray: Points of shape (n, 4) with columns T (K), Bx, By, Bz (T).
+    """
+    mesh = np.meshgrid(temperatures, bx, by, bz, indexing='ij')
+    return np.stack([m.ravel() for m in mesh], axis=1).astype(np.float64)
+
+
+class TransitionModel:
+    """
+    Estimated time to move between two points.
+
+    Temperature moves take |dT| / rate, with a separate (usually slower) rate when
+    cooling, plus a settling time. Field axes sweep simultaneously at the magnet sweep
+    rate, plus a settling time. Temperature and field moves add up unless concurrent.
+    """
+
+    def __init__(self, heating_rate: float, cooling_rate: float = None, field_rate: float = 0.1,
+                 temperature_settle: float = 300.0, field_settle: float = 10.0,
+                 concurrent: bool = False):
+        """
+        Args:
+            heating_rate (float): Temperature ramp rate when heating, in K/min.
+            cooling_rate (float): Ramp rate when cooling in K/min, half the heating rate if None.
+            field_rate (float): Magnet sweep rate in T/min.
+            temperature_settle (float): Seconds to settle after a temperature change.
+            field_settle (float): Seconds to settle after a field change.
+            concurrent (bool): Temperature and field move at the same time.
+        """
+        self.heating_rate = heating_rate
+        self.cooling_rate = cooling_rate or heating_rate / 2
+        self.field_rate = field_rate
+        self.temperature_settle = temperature_settle
+        self.field_settle = field_settle
+        self.concurrent = concurrent
+
+    @classmethod
+    def from_interface(cls, interface, **kwargs) -> "TransitionModel":
+        """
+        Builds a model from the ramp and sweep rates currently set on the attoDRY.
+        """
+        return cls(heating_rate=interface.get_temperature_ramp_rate(),
+                   field_rate=interface.get_magnet_sweep_rate(), **kwargs)
+
+    def cost(self, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+        """
+        Transition times in seconds, broadcasting over leading dimensions.
+
+        Args:
+            start, end (np.ndarray): Points with the 4 columns in the last dimension.
+        """
+        dt = end[..., TEMPERATURE] - start[..., TEMPERATURE]
+        rate = np.where(dt >= 0, self.heating_rate, self.cooling_rate)
+        temperature = np.abs(dt) / rate * 60 + np.where(dt != 0, self.temperature_settle, 0.0)
+
+        db = np.abs(end[..., BX:] - start[..., BX:]).max(axis=-1)
+        field = db / self.field_rate * 60 + np.where(db > 0, self.field_settle, 0.0)
+        if self.concurrent:
+            return np.maximum(temperature, field)
+        return temperature + field
+
+    def matrix(self, points: np.ndarray) -> np.ndarray:
+        """
+        Cost of going from point i to point j, shape (n, n).
+        """
+        return self.cost(points[:, None, :], points[None, :, :])
+
+
+def path_cost(costs: np.ndarray, order: np.ndarray) -> float:
+    return float(costs[order[:-1], order[1:]].sum())
+
+
+def nearest_neighbour(costs: np.ndarray) -> np.ndarray:
+    """
+    Greedy open path starting at node 0.
+    """
+    n = costs.shape[0]
+    order = [0]
+    free = np.ones(n, dtype=bool)
+    free[0] = False
+    for _ in range(n - 1):
+        row = np.where(free, costs[order[-1]], np.inf)
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        free[nxt] = False
+    return np.array(order)
+
+
+def two_opt(costs: np.ndarray, order: np.ndarray, max_rounds: int = 50) -> np.ndarray:
+    """
+    Improves an open path with fixed first node by reversing segments.
+
+    Costs may be asymmetric, so the cost of a reversed segment is taken from prefix
+    sums of the backward edge costs. For each segment start all segment ends are
+    evaluated at once.
+    """
+    order = order.copy()
+    n = order.size
+    for _ in range(max_rounds):
+        improved = False
+        for i in range(1, n - 1):
+            forward = np.concatenate(([0.0], np.cumsum(costs[order[:-1], order[1:]])))
+            backward = np.concatenate(([0.0], np.cumsum(costs[order[1:], order[:-1]])))
+            j = np.arange(i + 1, n)
+            after = np.minimum(j + 1, n - 1)
+            has_after = j + 1 < n
+            old = (costs[order[i - 1], order[i]] + forward[j] - forward[i]
+                   + np.where(has_after, costs[order[j], order[after]], 0.0))
+            new = (costs[order[i - 1], order[j]] + backward[j] - backward[i]
+                   + np.where(has_after, costs[order[i], order[after]], 0.0))
+            gain = old - new
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                order[i:j[best] + 1] = order[i:j[best] + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+class RecipePlan:
+    """
+    Ordered points and the predicted times of the naive and optimised orders.
+    """
+
+    def __init__(self, points: np.ndarray, order: np.ndarray, steps: np.ndarray,
+                 naive_time: float, planned_time: float):
+        self.points = points
+        self.order = order
+        self.steps = steps
+        self.naive_time = naive_time
+        self.planned_time = planned_time
+
+    @property
+    def saving(self) -> float:
+        return self.naive_time - self.planned_time
+
+    def __iter__(self):
+        return iter(self.points[self.order])
+
+    def __str__(self) -> str:
+        return (f"{len(self.order)} points, naive order {self.naive_time / 3600:.2f} h, "
+                f"planned {self.planned_time / 3600:.2f} h, saving {self.saving / 3600:.2f} h")
+
+
+def plan_recipe(points, model: TransitionModel, start=None) -> RecipePlan:
+    """
+    Orders points to minimise the total predicted transition time.
+
+    Args:
+        points (array_like): Points of shape (n, 4).
+        model (TransitionModel): Transition time model.
+        start (array_like): Current (T, Bx, By, Bz), the first point if None.
+
+    Returns:
+        RecipePlan: Plan with order indices into points.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 4)
+    start = points[0] if start is None else np.asarray(start, dtype=np.float64)
+    nodes = np.vstack((start, points))
+    costs = model.matrix(nodes)
+
+    naive = np.arange(nodes.shape[0])
+    order = two_opt(costs, nearest_neighbour(costs))
+    steps = costs[order[:-1], order[1:]]
+    return RecipePlan(points, order[1:] - 1, steps, path_cost(costs, naive), float(steps.sum()))
+
+
+def read_setpoints(interface) -> np.ndarray:
+    """
+    Current (T, Bx, By, Bz) user setpoints. The Y axis uses the functions without axis.
+    """
+    return np.array([interface.get_user_temperature_setpoint(),
+                     interface.get_user_magnetic_field_setpoint_axis('X'),
+                     interface.get_user_magnet_setpoint(),
+                     interface.get_user_magnetic_field_setpoint_axis('Z')])
+
+
+def wait_for_point(interface, point, temperature_tolerance: float = 0.05,
+                   field_tolerance: float = 4e-4, hits: int = 4, poll: float = 1.0,
+                   timeout: float = None) -> float:
+    """
+    Polls until sample temperature and all field axes are within tolerance of point
+    for a number of consecutive reads.
+
+    Returns:
+        float: Seconds waited.
+    """
+    start = time.monotonic()
+    count = 0
+    # Traced as ramping until the first reading inside the tolerance, then settling
+    phase = tracing.span("wait_for_point", "ramping")
+    settling = False
+    try:
+        while count < hits:
+            reading = np.array([interface.get_sample_temperature(),
+                                interface.get_magnetic_field_axis('X'),
+                                interface.get_magnetic_field(),
+                                interface.get_magnetic_field_axis('Z')])
+            error = np.abs(reading - point)
+            inside = error[TEMPERATURE] <= temperature_tolerance and np.all(error[BX:] <= field_tolerance)
+            count = count + 1 if inside else 0
+            if inside and not settling:
+                settling = True
+                phase.end()
+                phase = tracing.span("wait_for_point", "settling")
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError(f"Point {point} not reached within {timeout} s")
+            if count < hits:
+                time.sleep(poll)
+    finally:
+        phase.end()
+    return time.monotonic() - start
+
+
+class RecipeRunner:
+    """
+    Runs a measurement at every point of a recipe in the planned order.
+    """
+
+    def __init__(self, interface, points, model: TransitionModel = None, wait=wait_for_point):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface with temperature and
+                                          field control active.
+            points (array_like): Points of shape (n, 4).
+            model (TransitionModel): Transition model, read from the attoDRY if None.
+            wait (callable): wait(interface, point) blocks until the point is reached.
+        """
+        self._ad = interface
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 4)
+        self.model = model or TransitionModel.from_interface(interface)
+        self.wait = wait
+        self.durations = []
+
+    def plan(self) -> RecipePlan:
+        return plan_recipe(self.points, self.model, read_setpoints(self._ad))
+
+    def move_to(self, point) -> None:
+        """
+        Sends the setpoints of a point, skipping the ones that do not change.
+        """
+        current = read_setpoints(self._ad)
+        if point[TEMPERATURE] != current[TEMPERATURE]:
+            self._ad.set_user_temperature(point[TEMPERATURE])
+        if point[BX] != current[BX]:
+            self._ad.set_user_magnetic_field_axis('X', point[BX])
+        if point[BY] != current[BY]:
+            self._ad.set_user_magnetic_field(point[BY])
+        if point[BZ] != current[BZ]:
+            self._ad.set_user_magnetic_field_axis('Z', point[BZ])
+
+    def run(self, measure, plan: RecipePlan = None) -> RecipePlan:
+        """
+        Moves to each point of the plan, waits for it and calls measure(point).
+
+        Returns:
+            RecipePlan: The plan that was executed; durations has the measured
+                        transition time per point.
+        """
+        plan = plan or self.plan()
+        self.durations = []
+        for point in plan:
+            start = time.monotonic()
+            with tracing.span("move_to", "setpoints"):
+                self.move_to(point)
+            self.wait(self._ad, point)
+            self.durations.append(time.monotonic() - start)
+            with tracing.span("measure", "acquisition"):
+                measure(point)
+        return plan
@@ -0,0 +1,203 @@
+"""
+Safety envelope checked in the write path of AttoDRYInterface.
+
+The MATLAB code range checks every field command (Z within +-50 kG, X and Y within
++-10 kG, vector magnitude within 10 kG) and re-reads the field before a vector move;
+the wrapper itself has no limits. SafeInterface wraps an interface and checks field,
+temperature and heater power commands against a SafetyEnvelope before they are sent.
+The checks use cached setpoints and, if a TelemetryPoller runs, its latest snapshot,
+so they add no DLL call per command. A violation raises SafetyLimitError:
+
+    AD = SafeInterface(session.interface, poller=poller)
+    AD.set_user_magnetic_field_axis('Z', 4.0)   # allowed
+    AD.set_user_magnetic_field_axis('X', 0.5)   # SafetyLimitError: |B| above 1 T with X/Y field
+
+All other methods are passed through unchanged.
+"""
+
+import math
+import threading
+
+import numpy as np
+
+from Attodry_errors import SafetyLimitError
+from Attodry_recipe import read_setpoints
+
+
+# Index of each axis in the cached field vectors
+AXES = {"X": 0, "Y": 1, "Z": 2}
+
+# Telemetry channel of each axis in a TelemetryPoller snapshot
+FIELD_CHANNELS = ("magnetic_field_x", "magnetic_field_y", "magnetic_field_z")
+
+
+class SafetyEnvelope:
+    """
+    Declarative limits for commands. A limit of None is not checked.
+    """
+
+    def __init__(self, z_limit: float = 5.0, xy_limit: float = 1.0, vector_limit: float = 1.0,
+                 min_temperature: float = 0.0, max_temperature: float = None,
+                 vti_power_limit: float = None, sample_power_limit: float = None):
+        """
+        Args:
+            z_limit (float): Largest |Bz| in T.
+            xy_limit (float): Largest |Bx| and |By| in T.
+            vector_limit (float): Largest |B| in T while X or Y carry field; the
+                                  solenoid alone may go up to z_limit.
+            min_temperature, max_temperature (float): Allowed temperature setpoints in K.
+            vti_power_limit (float): Largest VTI heater power in W.
+            sample_power_limit (float): Largest sample heater power and sample heater
+                                        maximum power in W.
+        """
+        self.z_limit = z_limit
+        self.xy_limit = xy_limit
+        self.vector_limit = vector_limit
+        self.min_temperature = min_temperature
+        self.max_temperature = max_temperature
+        self.vti_power_limit = vti_power_limit
+        self.sample_power_limit = sample_power_limit
+
+    @classmethod
+    def from_interface(cls, interface, **kwargs) -> "SafetyEnvelope":
+        """
+        Envelope with the temperature limit read from get_temperature_setpoint_limit.
+        """
+        kwargs.setdefault("max_temperature", interface.get_temperature_setpoint_limit())
+        return cls(**kwargs)
+
+    def check_field(self, command: str, value: float, field) -> None:
+        """
+        Checks the field magnitudes (|Bx|, |By|, |Bz|) a command would lead to.
+        """
+        if not math.isfinite(value):
+            raise SafetyLimitError(command, value, "not a finite number")
+        x, y, z = field
+        if self.xy_limit is not None and max(x, y) > self.xy_limit:
+            raise SafetyLimitError(command, value, f"|Bx| and |By| must stay within {self.xy_limit} T")
+        if self.z_limit is not None and z > self.z_limit:
+            raise SafetyLimitError(command, value, f"|Bz| must stay within {self.z_limit} T")
+        magnitude = math.sqrt(x * x + y * y + z * z)
+        if self.vector_limit is not None and max(x, y) > 0 and magnitude > self.vector_limit:
+            raise SafetyLimitError(command, value, f"|B| = {magnitude:.4g} T above {self.vector_limit} T "
+                                                   "with field on X or Y, ramp Z down first")
+
+    def check_temperature(self, command: str, value: float) -> None:
+        if not math.isfinite(value):
+            raise SafetyLimitError(command, value, "not a finite number")
+        if self.min_temperature is not None and value < self.min_temperature:
+            raise SafetyLimitError(command, value, f"below {self.min_temperature} K")
+        if self.max_temperature is not None and value > self.max_temperature:
+            raise SafetyLimitError(command, value, f"above the setpoint limit of {self.max_temperature} K")
+
+    def check_power(self, command: str, value: float, limit: float) -> None:
+        if not math.isfinite(value):
+            raise SafetyLimitError(command, value, "not a finite number")
+        if value < 0:
+            raise SafetyLimitError(command, value, "negative power")
+        if limit is not None and value > limit:
+            raise SafetyLimitError(command, value, f"above {limit} W")
+
+
+class SafeInterface:
+    """
+    AttoDRYInterface proxy that rejects commands outside a SafetyEnvelope.
+
+    For the field checks, each other axis counts with the larger of its cached
+    setpoint and its last measured field, so a move is also rejected while another
+    axis is still ramping down. Setpoints are read once when the proxy is created
+    and then tracked from the commands sent through it. Without a poller, an axis
+    counts with its old setpoint until refresh() reads the field again, e.g. after
+    waiting for a ramp down; call refresh() too if setpoints were changed elsewhere.
+    """
+
+    def __init__(self, interface, envelope: SafetyEnvelope = None, poller=None, lock=None):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface.
+            envelope (SafetyEnvelope): Limits, SafetyEnvelope.from_interface if None.
+            poller (TelemetryPoller): Running poller whose snapshots provide the
+                                      measured field.
+            lock (threading.RLock): Lock shared with other threads using the interface,
+                                    the poller lock if a poller is given.
+        """
+        self._ad = interface
+        self.poller = poller
+        self.lock = lock or (poller.lock if poller is not None else threading.RLock())
+        with self.lock:
+            self.envelope = envelope or SafetyEnvelope.from_interface(interface)
+        self.refresh()
+
+    def __getattr__(self, name):
+        return getattr(self._ad, name)
+
+    def refresh(self) -> None:
+        """
+        Reads the field setpoints and the measured field again.
+        """
+        with self.lock:
+            self._setpoint = np.abs(read_setpoints(self._ad)[1:])
+            self._measured = np.abs([self._ad.get_magnetic_field_axis('X'),
+                                     self._ad.get_magnetic_field(),
+                                     self._ad.get_magnetic_field_axis('Z')])
+
+    def _measured_field(self) -> np.ndarray:
+        if self.poller is not None and self.poller.latest:
+            latest = np.abs([self.poller.latest.get(name, np.nan) for name in FIELD_CHANNELS])
+            # Channels the poller does not read keep the cached value
+            self._measured = np.where(np.isnan(latest), self._measured, latest)
+        return self._measured
+
+    def _set_field(self, command: str, axis: int, value: float, send) -> None:
+        # Check, send and cache update under one lock, so two threads cannot both
+        # pass the check against the same cached field
+        with self.lock:
+            field = np.maximum(self._setpoint, self._measured_field())
+            field[axis] = abs(value)
+            self.envelope.check_field(command, value, field)
+            send()
+            # Until a new measurement arrives the axis may still be at the old setpoint
+            self._measured[axis] = max(self._measured[axis], self._setpoint[axis])
+            self._setpoint[axis] = abs(value)
+
+    def set_user_magnetic_field_axis(self, axis: str, field_tesla: float):
+        axis = axis.upper()
+        if axis not in ('X', 'Z'):
+            raise ValueError("axis must be 'X' or 'Z', the Y axis uses set_user_magnetic_field")
+        self._set_field("set_user_magnetic_field_axis", AXES[axis], field_tesla,
+                        lambda: self._ad.set_user_magnetic_field_axis(axis, field_tesla))
+
+    def set_user_magnetic_field(self, field_tesla: float):
+        self._set_field("set_user_magnetic_field", AXES['Y'], field_tesla,
+                        lambda: self._ad.set_user_magnetic_field(field_tesla))
+
+    def set_user_magnet_setpoint(self, setpoint: float) -> None:
+        self._set_field("set_user_magnet_setpoint", AXES['Y'], setpoint,
+                        lambda: self._ad.set_user_magnet_setpoint(setpoint))
+
+    def set_user_temperature(self, temperature_k: float):
+        self.envelope.check_temperature("set_user_temperature", temperature_k)
+        with self.lock:
+            self._ad.set_user_temperature(temperature_k)
+
+    def set_temperature_setpoint(self, temp: float) -> None:
+        self.envelope.check_temperature("set_temperature_setpoint", temp)
+        with self.lock:
+            self._ad.set_temperature_setpoint(temp)
+
+    def set_vti_heater_power(self, power_watts: float):
+        self.envelope.check_power("set_vti_heater_power", power_watts, self.envelope.vti_power_limit)
+        with self.lock:
+            self._ad.set_vti_heater_power(power_watts)
+
+    def set_sample_heater_power(self, power_watts: float):
+        self.envelope.check_power("set_sample_heater_power", power_watts, self.envelope.sample_power_limit)
+        with self.lock:
+            self._ad.set_sample_heater_power(power_watts)
+
+    def set_sample_heater_maximum_power(self, power_watts: float):
+        # A larger maximum would let the heater controller exceed the envelope on its own
+        self.envelope.check_power("set_sample_heater_maximum_power", power_watts,
+                                  self.envelope.sample_power_limit)
+        with self.lock:
+            self._ad.set_sample_heater_maximum_power(power_watts)
@@ -0,0 +1,285 @@
+"""
+Sample exchange workflow with readiness prediction and prompt handling.
+
+SampleExchange runs start_sample_exchange() and follows the exchange through three
+phases: warming until is_sample_ready_to_exchange(), the exchange itself until the
+stick is back and the device no longer reports ready, and cooling until
+is_sample_exchange_in_progress() clears. While warming, the time until the sample
+reaches the ready temperature is predicted from the slope of the warming trace; the
+next poll is scheduled at the predicted time and, once it has passed, readiness is
+polled every fast_interval, so ready is set within a fraction of a second. Prompts from get_action_message() are passed to on_prompt, which answers them with
+confirm() or cancel(), or leaves them for the user at the touch screen:
+
+    exchange = SampleExchange(AD, on_ready=lambda: print("Sample ready"))
+    exchange.start()
+    exchange.wait_ready(early=60)   # returns a minute before the predicted time
+
+Phase durations are logged and optionally appended to a JSON lines file.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import Attodry_tracing as tracing
+from Attodry_statistics import WindowStatistics
+
+
+logger = logging.getLogger(__name__)
+
+WARMING = "warming"
+EXCHANGE = "exchange"
+COOLING = "cooling"
+
+
+def last_ready_temperature(metrics_path: str):
+    """
+    Sample temperature at which the last logged exchange became ready, None if unknown.
+    """
+    try:
+        with open(metrics_path, 'r') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            temperature = json.loads(line).get('ready_temperature')
+        except ValueError:
+            continue
+        if temperature is not None:
+            return temperature
+    return None
+
+
+class SampleExchange:
+    """
+    Sequences one sample exchange.
+    """
+
+    def __init__(self, interface, on_prompt=None, on_ready=None, ready_temperature: float = None,
+                 interval: float = 2.0, window: float = 600.0, metrics_path: str = None, lock=None,
+                 fast_interval: float = 0.25, fast_window: float = 120.0):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface.
+            on_prompt (callable): on_prompt(message) returns True to confirm, False to
+                                  cancel or None to leave the prompt to the user.
+            on_ready (callable): Called once when the sample is ready to exchange.
+            ready_temperature (float): Sample temperature at which the exchange becomes
+                                       ready, taken from the metrics file if None.
+            interval (float): Seconds between polls.
+            window (float): Seconds of warming trace used for the prediction.
+            metrics_path (str): JSON lines file the phase durations are appended to.
+            lock (threading.RLock): Lock shared with other threads using the interface.
+            fast_interval (float): Seconds between polls once the predicted ready time
+                                   has passed.
+            fast_window (float): Seconds after the predicted ready time during which
+                                 fast_interval is used, interval after that.
+        """
+        self._ad = interface
+        self.on_prompt = on_prompt
+        self.on_ready = on_ready
+        self.ready_temperature = ready_temperature
+        if ready_temperature is None and metrics_path is not None:
+            self.ready_temperature = last_ready_temperature(metrics_path)
+        self.interval = interval
+        self.window = window
+        self.metrics_path = metrics_path
+        self.lock = lock or threading.RLock()
+        self.fast_interval = fast_interval
+        self.fast_window = fast_window
+
+        self.ready = threading.Event()
+        self.phase = None
+        self.durations = {}
+        self.predicted_ready = None
+        self.prompts = []
+        self._last_message = ""
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _handle_prompt(self) -> None:
+        """
+        Reacts once to each new action message.
+        """
+        with self.lock:
+            message = self._ad.get_action_message().strip()
+        if not message or message == self._last_message:
+            self._last_message = message
+            return
+        self._last_message = message
+        answer = None if self.on_prompt is None else self.on_prompt(message)
+        self.prompts.append((time.time(), self.phase, message, answer))
+        if answer is True:
+            logger.info("Confirming: %s", message)
+            with self.lock:
+                self._ad.confirm()
+        elif answer is False:
+            logger.info("Cancelling: %s", message)
+            with self.lock:
+                self._ad.cancel()
+        else:
+            logger.info("Waiting for the user: %s", message)
+
+    def _predict(self, stats: WindowStatistics, temperature: float) -> None:
+        """
+        Extrapolates the warming trace to the ready temperature.
+        """
+        if self.ready_temperature is None or len(stats) < 3:
+            return
+        slope = stats.slope
+        remaining = self.ready_temperature - temperature
+        if remaining <= 0:
+            # Keep the time the temperature first got there, so the fast window ends
+            if self.predicted_ready is None or self.predicted_ready > time.time():
+                self.predicted_ready = time.time()
+        elif slope > 0:
+            self.predicted_ready = time.time() + remaining / slope
+
+    def _poll_delay(self, phase: str) -> float:
+        """
+        Seconds until the next poll: wake up at the predicted ready time, poll fast
+        for fast_window seconds after it.
+        """
+        if phase != WARMING or self.predicted_ready is None:
+            return self.interval
+        remaining = self.predicted_ready - time.time()
+        if remaining > 0:
+            return min(self.interval, remaining)
+        if -remaining < self.fast_window:
+            return self.fast_interval
+        return self.interval
+
+    def _wait(self, phase: str, done, timeout: float = None) -> float:
+        """
+        Polls until done() is true, handling prompts on the way.
+
+        Returns:
+            float: Duration of the phase in seconds.
+        """
+        self.phase = phase
+        start = time.monotonic()
+        stats = WindowStatistics(self.window)
+        with tracing.span(phase, "sample_exchange"):
+            while not self._stop.is_set():
+                self._handle_prompt()
+                if done():
+                    break
+                if phase == WARMING:
+                    with self.lock:
+                        temperature = self._ad.get_sample_temperature()
+                    stats.add(time.monotonic(), temperature)
+                    self._predict(stats, temperature)
+                if timeout is not None and time.monotonic() - start > timeout:
+                    raise TimeoutError(f"Sample exchange {phase} did not finish within {timeout} s")
+                self._stop.wait(self._poll_delay(phase))
+        duration = time.monotonic() - start
+        self.durations[phase] = duration
+        logger.info("Sample exchange %s took %.1f min", phase, duration / 60)
+        return duration
+
+    def _query(self, name: str):
+        def query():
+            with self.lock:
+                return getattr(self._ad, name)()
+        return query
+
+    def run(self, timeout: float = None) -> dict:
+        """
+        Runs the whole exchange and blocks until cooling has finished.
+
+        Args:
+            timeout (float): Limit per phase in seconds.
+
+        Returns:
+            dict: Phase name -> duration in seconds.
+        """
+        self.ready.clear()
+        self._stop.clear()
+        self.durations = {}
+        self.prompts = []
+        # A prediction from an earlier exchange must not be logged as this one's
+        self.predicted_ready = None
+        started = time.time()
+        with self.lock:
+            if not self._ad.is_sample_exchange_in_progress():
+                self._ad.start_sample_exchange()
+
+        ready = self._query('is_sample_ready_to_exchange')
+        in_progress = self._query('is_sample_exchange_in_progress')
+
+        self._wait(WARMING, ready, timeout)
+        if self._stop.is_set():
+            return self.durations
+        with self.lock:
+            ready_temperature = self._ad.get_sample_temperature()
+        if self.predicted_ready is not None:
+            logger.info("Readiness predicted %.0f s off", time.time() - self.predicted_ready)
+        self.ready.set()
+        if self.on_ready is not None:
+            self.on_ready()
+
+        for phase, done in ((EXCHANGE, lambda: not ready()), (COOLING, lambda: not in_progress())):
+            self._wait(phase, done, timeout)
+            if self._stop.is_set():
+                return self.durations
+        self.phase = None
+        self._log_metrics(started, ready_temperature)
+        return self.durations
+
+    def _log_metrics(self, started: float, ready_temperature: float) -> None:
+        if self.metrics_path is None:
+            return
+        record = {'start': started, 'durations': self.durations,
+                  'ready_temperature': ready_temperature,
+                  'prompts': [[t, phase, message, answer] for t, phase, message, answer in self.prompts]}
+        with open(self.metrics_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+    def wait_ready(self, timeout: float = None, early: float = 0.0) -> bool:
+        """
+        Blocks until the sample is ready to exchange or, with early > 0, until early
+        seconds before the predicted ready time.
+
+        Args:
+            timeout (float): Longest wait in seconds, no limit if None.
+            early (float): Seconds before the predicted ready time to return.
+
+        Returns:
+            bool: True if the device reports the sample ready, False if the wait ended
+                  on the prediction, the timeout or stop().
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready.is_set() and not self._stop.is_set():
+            # Short waits on the event only, they cost no DLL calls
+            delay = self.fast_interval
+            if early > 0 and self.predicted_ready is not None:
+                # Re-checked on every wake-up, the prediction moves while warming
+                until = self.predicted_ready - early - time.time()
+                if until <= 0:
+                    break
+                delay = min(delay, until)
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                delay = min(delay, left)
+            self.ready.wait(delay)
+        return self.ready.is_set()
+
+    def start(self) -> None:
+        """
+        Runs the exchange in a background thread; ready is set when the sample can be exchanged.
+        """
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops following the exchange. The attoDRY keeps running the procedure.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,168 @@
+"""
+Session management for the attoDRY: startup, retry and automatic reconnection.
+
+    with AttoDRYSession(com_port="COM3") as AD:
+        print(AD.get_sample_temperature())
+
+The session runs begin(), connect() and waits for is_initialised(), retrying
+transient errors (COM port busy, timeouts) with exponential backoff. During a run,
+ensure_connected() checks is_connected() and reconnects with disconnect()/connect()
+only, falling back to a full end()/begin() cycle if that does not work.
+"""
+
+import time
+
+import Attodry_tracing as tracing
+from Attodry_capabilities import ATTODRY2100
+from Attodry_errors import AttoDRYError
+
+
+class SessionError(RuntimeError):
+    """
+    Raised when the session could not get the attoDRY ready in time.
+    """
+
+
+class AttoDRYSession:
+    """
+    Context manager that owns the server and COM port for one AttoDRYInterface.
+
+    Attributes:
+        time_to_ready (float): Seconds from open() until the device was initialised.
+        recoveries (list): Seconds needed for each reconnection.
+    """
+
+    def __init__(self, interface=None, com_port: str = "COM3", device: int = ATTODRY2100,
+                 retries: int = 5, backoff: float = 0.5, max_backoff: float = 10.0,
+                 init_timeout: float = 60.0, poll_interval: float = 0.05):
+        """
+        Args:
+            interface (AttoDRYInterface): Interface to use, a new one is created if None.
+            com_port (str): COM port of the attoDRY.
+            device (int): Device identifier passed to begin(), one of ATTODRY1100,
+                          ATTODRY2100 (default) and ATTODRY800 from Attodry_capabilities.
+            retries (int): Attempts per connect before giving up.
+            backoff (float): Initial delay between attempts in seconds, doubled each time.
+            max_backoff (float): Upper limit of the delay between attempts.
+            init_timeout (float): Seconds to wait for is_initialised().
+            poll_interval (float): Delay between is_initialised() polls.
+        """
+        if interface is None:
+            from Attodry_wrapper_class import AttoDRYInterface
+            interface = AttoDRYInterface()
+        self.interface = interface
+        self.com_port = com_port
+        self.device = device
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.init_timeout = init_timeout
+        self.poll_interval = poll_interval
+
+        self.time_to_ready = None
+        self.recoveries = []
+        self._server_running = False
+
+    def __enter__(self):
+        self.open()
+        return self.interface
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _retry(self, func, *args):
+        """
+        Calls func, retrying transient AttoDRYErrors with exponential backoff.
+        """
+        delay = self.backoff
+        for attempt in range(self.retries):
+            try:
+                return func(*args)
+            except AttoDRYError as err:
+                if not err.transient or attempt == self.retries - 1:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    def _wait_initialised(self) -> None:
+        deadline = time.monotonic() + self.init_timeout
+        while not self.interface.is_initialised():
+            if time.monotonic() > deadline:
+                raise SessionError(f"attoDRY on {self.com_port} did not initialise "
+                                   f"within {self.init_timeout} s")
+            time.sleep(self.poll_interval)
+
+    def _connect(self) -> None:
+        self._retry(self.interface.connect, self.com_port)
+        self._wait_initialised()
+
+    def open(self) -> None:
+        """
+        Starts the server, connects and waits until the device is initialised.
+        If that fails, the server is stopped again before the error is raised.
+        """
+        start = time.monotonic()
+        with tracing.span("open", "connecting"):
+            if not self._server_running:
+                self.interface.begin(self.device)
+                self._server_running = True
+            try:
+                self._connect()
+            except BaseException:
+                # __exit__ does not run when __enter__ fails, nothing else would call end()
+                self.close()
+                raise
+        self.time_to_ready = time.monotonic() - start
+
+    def close(self) -> None:
+        """
+        Disconnects and stops the server. Errors while disconnecting are ignored so
+        the server is always stopped.
+        """
+        if not self._server_running:
+            return
+        try:
+            self.interface.disconnect()
+        except AttoDRYError:
+            pass
+        self.interface.end()
+        self._server_running = False
+
+    def reconnect(self) -> float:
+        """
+        Re-establishes the connection, first by reconnecting the COM port only and,
+        if that fails, by restarting the server.
+
+        Returns:
+            float: Seconds needed to recover.
+        """
+        start = time.monotonic()
+        try:
+            try:
+                self.interface.disconnect()
+            except AttoDRYError:
+                pass
+            self._connect()
+        except (AttoDRYError, SessionError):
+            self.close()
+            self.open()
+        recovery = time.monotonic() - start
+        self.recoveries.append(recovery)
+        return recovery
+
+    def ensure_connected(self) -> bool:
+        """
+        Checks the link with is_connected() and reconnects if it dropped.
+
+        Returns:
+            bool: True if a reconnection was needed.
+        """
+        try:
+            connected = self.interface.is_connected()
+        except AttoDRYError:
+            connected = False
+        if connected:
+            return False
+        self.reconnect()
+        return True
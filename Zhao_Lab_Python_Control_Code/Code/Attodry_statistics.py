@@ -0,0 +1,240 @@
+"""
+Streaming statistics of telemetry channels for stability criteria.
+
+Each tracked (channel, window) keeps a sliding time window with O(1) work per sample:
+Welford mean/variance, an EWMA, the least-squares slope (drift) and min/max through
+monotonic deques. Questions like "is the sample temperature within +-5 mK of 1.5 K
+with a drift below 1 mK/min over the last 2 minutes" are then answered from memory:
+
+    monitor = StabilityMonitor()
+    monitor.track("sample_temperature", window=120)
+    poller.subscribe(monitor)
+    ...
+    monitor.is_stable("sample_temperature", 120, tolerance=0.005, max_drift=0.001, target=1.5)
+"""
+
+import math
+import threading
+from collections import deque
+
+
+class WindowStatistics:
+    """
+    Statistics of the samples of the last window seconds.
+    """
+
+    def __init__(self, window: float, halflife: float = None):
+        """
+        Args:
+            window (float): Length of the sliding window in seconds.
+            halflife (float): Half-life of the EWMA in seconds, window / 4 if None.
+        """
+        self.window = window
+        self.halflife = halflife or window / 4
+        self.first_time = None
+        self.last_time = None
+        self.ewma = math.nan
+
+        self._samples = deque()
+        self._low = deque()
+        self._high = deque()
+        self._mean = 0.0
+        self._m2 = 0.0
+        # Regression sums over times relative to _origin
+        self._origin = None
+        self._st = self._sv = self._stt = self._stv = 0.0
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def _rebase(self, origin: float) -> None:
+        # Recompute the regression sums around a new origin to keep them small
+        self._origin = origin
+        self._st = self._sv = self._stt = self._stv = 0.0
+        for t, v in self._samples:
+            t -= origin
+            self._st += t
+            self._sv += v
+            self._stt += t * t
+            self._stv += t * v
+
+    def _remove_oldest(self) -> None:
+        t, v = self._samples.popleft()
+        n = len(self._samples)
+        if n == 0:
+            self._mean = self._m2 = 0.0
+        else:
+            delta = v - self._mean
+            self._mean -= delta / n
+            self._m2 = max(self._m2 - delta * (v - self._mean), 0.0)
+        rel = t - self._origin
+        self._st -= rel
+        self._sv -= v
+        self._stt -= rel * rel
+        self._stv -= rel * v
+        if self._low[0][0] <= t:
+            self._low.popleft()
+        if self._high[0][0] <= t:
+            self._high.popleft()
+
+    def add(self, t: float, value: float) -> None:
+        """
+        Adds one sample. Times must not decrease; NaN values are ignored.
+        """
+        if math.isnan(value):
+            return
+        if self.first_time is None:
+            self.first_time = t
+            self._origin = t
+        elif t - self._origin > 100 * self.window:
+            self._rebase(t)
+
+        # EWMA with irregular sample spacing
+        if math.isnan(self.ewma):
+            self.ewma = value
+        else:
+            alpha = 1 - 0.5 ** ((t - self.last_time) / self.halflife)
+            self.ewma += alpha * (value - self.ewma)
+        self.last_time = t
+
+        self._samples.append((t, value))
+        n = len(self._samples)
+        delta = value - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (value - self._mean)
+        rel = t - self._origin
+        self._st += rel
+        self._sv += value
+        self._stt += rel * rel
+        self._stv += rel * value
+
+        while self._low and self._low[-1][1] >= value:
+            self._low.pop()
+        self._low.append((t, value))
+        while self._high and self._high[-1][1] <= value:
+            self._high.pop()
+        self._high.append((t, value))
+
+        while self._samples[0][0] < t - self.window:
+            self._remove_oldest()
+
+    @property
+    def covered(self) -> bool:
+        """
+        True if the samples in the window span all of it.
+
+        The oldest sample still in the window must lie within one average sample
+        spacing of the window start, so after a gap in the data the window counts as
+        covered again only once it has filled up with fresh samples.
+        """
+        n = len(self._samples)
+        if n < 2:
+            return False
+        oldest = self._samples[0][0]
+        spacing = (self.last_time - oldest) / (n - 1)
+        return oldest - (self.last_time - self.window) <= spacing
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self._samples else math.nan
+
+    @property
+    def variance(self) -> float:
+        n = len(self._samples)
+        return self._m2 / (n - 1) if n > 1 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def minimum(self) -> float:
+        return self._low[0][1] if self._low else math.nan
+
+    @property
+    def maximum(self) -> float:
+        return self._high[0][1] if self._high else math.nan
+
+    @property
+    def slope(self) -> float:
+        """
+        Least-squares slope of the window in units per second.
+        """
+        n = len(self._samples)
+        denominator = n * self._stt - self._st * self._st
+        if n < 2 or denominator <= 0:
+            return math.nan
+        return (n * self._stv - self._st * self._sv) / denominator
+
+
+class StabilityMonitor:
+    """
+    Window statistics for any number of (channel, window) pairs, fed from telemetry batches.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def track(self, channel: str, window: float, halflife: float = None) -> WindowStatistics:
+        """
+        Starts keeping statistics of a channel over a window in seconds.
+        """
+        with self._lock:
+            key = (channel, float(window))
+            if key not in self._stats:
+                self._stats[key] = WindowStatistics(window, halflife)
+            return self._stats[key]
+
+    def add(self, times, values: dict) -> None:
+        """
+        Adds samples of several channels sharing one time column.
+        """
+        with self._lock:
+            for (channel, _), stats in self._stats.items():
+                column = values.get(channel)
+                if column is None:
+                    continue
+                for t, v in zip(times, column):
+                    stats.add(float(t), float(v))
+
+    def __call__(self, batch) -> None:
+        """
+        Subscriber entry point for TelemetryPoller.
+        """
+        self.add(batch.times, batch.values)
+
+    def statistics(self, channel: str, window: float) -> WindowStatistics:
+        stats = self._stats.get((channel, float(window)))
+        if stats is None:
+            raise KeyError(f"{channel} is not tracked over {window} s, call track() first")
+        return stats
+
+    def is_stable(self, channel: str, window: float, tolerance: float,
+                  max_drift: float = None, target: float = None) -> bool:
+        """
+        Checks a stability criterion on the last window seconds.
+
+        Args:
+            channel (str): Tracked channel.
+            window (float): Tracked window in seconds.
+            tolerance (float): All samples must lie within +-tolerance of target, or
+                               within a band of 2 * tolerance if target is None.
+            max_drift (float): Largest allowed absolute slope in units per minute.
+            target (float): Value the samples should be close to.
+
+        Returns:
+            bool: False as long as less than one window of data was received.
+        """
+        with self._lock:
+            stats = self.statistics(channel, window)
+            if not stats.covered:
+                return False
+            low, high = stats.minimum, stats.maximum
+            if target is None:
+                within = high - low <= 2 * tolerance
+            else:
+                within = target - tolerance <= low and high <= target + tolerance
+            if not within:
+                return False
+            return max_drift is None or abs(stats.slope) * 60 <= max_drift
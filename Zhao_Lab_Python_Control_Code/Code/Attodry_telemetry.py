@@ -0,0 +1,526 @@
+"""
+Polling of AttoDRYInterface getters into batches of NumPy arrays.
+
+A telemetry channel is a getter of AttoDRYInterface with fixed arguments. The poller
+reads one snapshot of all channels per tick and hands batches of ticks to its
+subscribers (alarm rules, recorders, plots), so consumers never call the DLL
+themselves.
+
+The LabVIEW server behind the DLL refreshes its values at its own rate, reading
+faster only returns the same float again. The poller measures the refresh period of
+every channel and, with adaptive=True, skips channels that cannot have changed yet.
+SwingingDoorFilter drops samples that a straight line through the kept samples
+reproduces within a deadband, before they reach a recorder:
+
+    poller = TelemetryPoller(AD, interval=0.5, adaptive=True)
+    poller.subscribe(SwingingDoorFilter(ArchiveWriter("telemetry.adry", poller.channels),
+                                        deadband={"sample_temperature": 1e-3}))
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from Attodry_capabilities import supported_names
+from Attodry_errors import AttoDRYError
+
+
+# Channel name -> (AttoDRYInterface method, arguments)
+CHANNELS = {
+    "sample_temperature":        ("get_sample_temperature", ()),
+    "user_temperature_setpoint": ("get_user_temperature_setpoint", ()),
+    "vti_temperature":           ("get_vti_temperature", ()),
+    "stage_4k_temperature":      ("get_4kstage_temperature", ()),
+    "reservoir_temperature":     ("get_reservoir_temperature", ()),
+    "cryostat_in_pressure":      ("get_cryostat_in_pressure", ()),
+    "cryostat_out_pressure":     ("get_cryostat_out_pressure", ()),
+    "dump_pressure":             ("get_dump_pressure", ()),
+    "reservoir_heater_power":    ("get_reservoir_heater_power", ()),
+    "vti_heater_power":          ("get_vti_heater_power", ()),
+    "sample_heater_power":       ("get_sample_heater_power", ()),
+    "heater_output":             ("get_heater_output", ()),
+    "magnetic_field_x":          ("get_magnetic_field_axis", ("X",)),
+    "magnetic_field_y":          ("get_magnetic_field", ()),
+    "magnetic_field_z":          ("get_magnetic_field_axis", ("Z",)),
+    "turbopump_frequency":       ("get_turbopump_frequency", ()),
+}
+
+
+def read_snapshot(interface, channels) -> dict:
+    """
+    Reads the current value of each channel.
+
+    Channels whose getter raises an AttoDRYError are reported as NaN, so one
+    failing call does not drop the whole snapshot.
+
+    Args:
+        interface (AttoDRYInterface): Connected interface.
+        channels (iterable): Channel names from CHANNELS.
+
+    Returns:
+        dict: Channel name -> float value.
+    """
+    snapshot = {}
+    for name in channels:
+        method, args = CHANNELS[name]
+        try:
+            snapshot[name] = float(getattr(interface, method)(*args))
+        except AttoDRYError:
+            snapshot[name] = float('nan')
+    return snapshot
+
+
+class TelemetryBatch:
+    """
+    Consecutive snapshots of a set of channels.
+
+    Attributes:
+        times (np.ndarray): Unix timestamps in seconds, one per snapshot.
+        values (dict): Channel name -> np.ndarray of values, aligned with times.
+    """
+
+    def __init__(self, times: np.ndarray, values: dict):
+        self.times = times
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def channels(self) -> list:
+        return list(self.values)
+
+    @classmethod
+    def from_snapshots(cls, times: list, snapshots: list, channels: list) -> "TelemetryBatch":
+        matrix = np.array([[s[name] for name in channels] for s in snapshots],
+                          dtype=np.float64).reshape(len(snapshots), len(channels))
+        return cls(np.asarray(times, dtype=np.float64),
+                   {name: matrix[:, i] for i, name in enumerate(channels)})
+
+
+class RefreshEstimator:
+    """
+    Estimates how often the server updates each channel.
+
+    The period of a channel is a low quantile of the intervals between observed
+    value changes, so intervals in which the value happened to stay the same do
+    not inflate it. Channels with fewer than min_changes intervals have no estimate.
+    """
+
+    def __init__(self, channels, window: int = 32, quantile: float = 0.25, min_changes: int = 3):
+        """
+        Args:
+            channels (list): Channel names.
+            window (int): Number of recent change intervals kept per channel.
+            quantile (float): Quantile of the intervals taken as the period.
+            min_changes (int): Intervals needed before a period is reported.
+        """
+        self.channels = list(channels)
+        self.window = window
+        self.quantile = quantile
+        self.min_changes = min_changes
+        self._index = {name: i for i, name in enumerate(self.channels)}
+        n = len(self.channels)
+        self._value = np.full(n, np.nan)
+        self._seen = np.full(n, np.nan)
+        self._changed = np.full(n, np.nan)
+        self._intervals = np.full((n, window), np.nan)
+        self._count = np.zeros(n, dtype=np.int64)
+
+    def update(self, t: float, values: dict) -> None:
+        """
+        Feeds one reading of some or all channels.
+        """
+        rows = np.array([self._index[name] for name in values], dtype=np.int64)
+        if rows.size == 0:
+            return
+        x = np.fromiter(values.values(), dtype=np.float64, count=rows.size)
+        previous = self._value[rows]
+        changed = (x != previous) & ~np.isnan(x) & ~np.isnan(previous)
+
+        timed = rows[changed & ~np.isnan(self._changed[rows])]
+        self._intervals[timed, self._count[timed] % self.window] = t - self._changed[timed]
+        self._count[timed] += 1
+        self._changed[rows[changed]] = t
+        self._seen[rows[np.isnan(self._seen[rows])]] = t
+        self._value[rows[~np.isnan(x)]] = x[~np.isnan(x)]
+
+    def periods(self) -> dict:
+        """
+        Returns:
+            dict: Channel name -> refresh period in seconds, NaN if unknown.
+        """
+        known = self._count >= self.min_changes
+        periods = np.full(len(self.channels), np.nan)
+        if known.any():
+            periods[known] = np.nanquantile(self._intervals[known], self.quantile, axis=1)
+        return dict(zip(self.channels, periods.tolist()))
+
+    def unchanged(self, t: float) -> dict:
+        """
+        Returns:
+            dict: Channel name -> seconds since the value last changed (or was first
+                  read), NaN if never read.
+        """
+        since = np.where(np.isnan(self._changed), self._seen, self._changed)
+        return dict(zip(self.channels, (t - since).tolist()))
+
+
+class TelemetryPoller:
+    """
+    Reads snapshots in a background thread and publishes them in batches.
+
+    Other threads that send commands through the same interface should hold
+    poller.lock around their calls, the DLL is not called concurrently then.
+
+    In adaptive mode a channel is read again only once its measured refresh period
+    has passed (at most max_interval); in between, snapshots repeat its last value.
+    Until a period is measured, a channel is read again after half the time its
+    value has been constant, so constant channels are backed off too.
+
+    Attributes:
+        latest (dict): Most recent snapshot.
+        latest_time (float): Unix timestamp of the most recent snapshot.
+        refresh (RefreshEstimator): Measured refresh periods of the channels.
+        calls (int): DLL getter calls made.
+        skipped (int): Getter calls saved by adaptive polling.
+    """
+
+    def __init__(self, interface, channels=None, interval: float = 1.0, batch_size: int = 10,
+                 adaptive: bool = False, max_interval: float = 30.0):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface.
+            channels (list): Channel names to poll, the CHANNELS the connected
+                             model supports if None.
+            interval (float): Seconds between snapshots.
+            batch_size (int): Snapshots per published batch.
+            adaptive (bool): Do not read channels faster than they refresh.
+            max_interval (float): Longest time in seconds between reads of a channel
+                                  in adaptive mode.
+        """
+        self._ad = interface
+        self.channels = list(channels or supported_names(interface, CHANNELS))
+        self.interval = interval
+        self.batch_size = batch_size
+        self.adaptive = adaptive
+        self.max_interval = max_interval
+        self.lock = threading.RLock()
+
+        self.latest = {}
+        self.latest_time = None
+        self.refresh = RefreshEstimator(self.channels)
+        self.calls = 0
+        self.skipped = 0
+        self._due = {}
+        self._subscribers = []
+        self._times = []
+        self._snapshots = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback) -> None:
+        """
+        Registers callback(batch) to be called with every published TelemetryBatch.
+        """
+        self._subscribers.append(callback)
+
+    def _due_channels(self, now: float) -> list:
+        if not self.adaptive or not self.latest:
+            return self.channels
+        return [name for name in self.channels if self._due.get(name, now) <= now]
+
+    def _schedule(self, now: float, channels: list) -> None:
+        periods = self.refresh.periods()
+        unchanged = self.refresh.unchanged(time.time())
+        for name in channels:
+            period = periods[name]
+            if np.isnan(period):
+                period = unchanged[name] / 2
+            if np.isnan(period):
+                period = self.interval
+            period = min(max(period, self.interval), self.max_interval)
+            # Half a tick early, so a channel is read on the first tick after its period
+            self._due[name] = now + period - self.interval / 2
+
+    def poll_once(self) -> dict:
+        """
+        Reads one snapshot and publishes a batch once batch_size snapshots are pending.
+        """
+        due = self._due_channels(time.monotonic())
+        with self.lock:
+            readings = read_snapshot(self._ad, due)
+        now = time.time()
+        self.calls += len(due)
+        self.skipped += len(self.channels) - len(due)
+        self.refresh.update(now, readings)
+        if self.adaptive:
+            self._schedule(time.monotonic(), due)
+        snapshot = {name: readings[name] if name in readings else self.latest.get(name, float('nan'))
+                    for name in self.channels}
+        self.latest = snapshot
+        self.latest_time = now
+        self._times.append(now)
+        self._snapshots.append(snapshot)
+        if len(self._snapshots) >= self.batch_size:
+            self.flush()
+        return snapshot
+
+    def flush(self) -> None:
+        """
+        Publishes the pending snapshots, if any.
+        """
+        if not self._snapshots:
+            return
+        batch = TelemetryBatch.from_snapshots(self._times, self._snapshots, self.channels)
+        self._times = []
+        self._snapshots = []
+        for callback in self._subscribers:
+            callback(batch)
+
+    def _run(self) -> None:
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            self.poll_once()
+            next_tick += self.interval
+            self._stop.wait(max(0.0, next_tick - time.monotonic()))
+        self.flush()
+
+    def start(self) -> None:
+        """
+        Starts polling in a daemon thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attodry-telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the polling thread and publishes the remaining snapshots.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+
+class SwingingDoorFilter:
+    """
+    Subscriber that forwards only the samples needed to reconstruct the telemetry
+    within a deadband (swinging door compression).
+
+    Starting from the last kept sample, every channel keeps a "door" of slopes for
+    which a straight line stays within the deadband of all samples since. When the
+    line to a new sample falls outside the door of any channel, the previous sample
+    is kept and becomes the new start. Linear interpolation between kept samples (e.g.
+    asof_join(..., method="linear")) then differs from every dropped sample by at
+    most the deadband of its channel. With a deadband of 0 only samples that break
+    a straight line are kept, in particular repeated values are dropped.
+
+    Samples are forwarded with a delay of one sample. A sample is kept at least
+    every max_gap seconds, so gaps in the record still mean missing data.
+
+    Attributes:
+        received (int): Samples received.
+        kept (int): Samples forwarded.
+    """
+
+    def __init__(self, *subscribers, deadband=0.0, max_gap: float = 60.0):
+        """
+        Args:
+            subscribers (callable): Called with each TelemetryBatch of kept samples,
+                                    e.g. an ArchiveWriter.
+            deadband (float or dict): Largest reconstruction error, one value for all
+                                      channels or channel name -> value (0 if missing).
+            max_gap (float): Longest time in seconds between kept samples.
+        """
+        self.subscribers = list(subscribers)
+        self.deadband = deadband
+        self.max_gap = max_gap
+        self.received = 0
+        self.kept = 0
+        self.channels = None
+        self._anchor = None
+        self._held = None
+        self._lock = threading.Lock()
+
+    def _start(self, channels: list) -> None:
+        self.channels = channels
+        if isinstance(self.deadband, dict):
+            self._band = np.array([self.deadband.get(name, 0.0) for name in channels], dtype=np.float64)
+        else:
+            self._band = np.full(len(channels), float(self.deadband))
+
+    def _open(self, t: float, x: np.ndarray) -> None:
+        # New door from the anchor through the first sample after it
+        t_a, x_a = self._anchor
+        dt = t - t_a
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._upper = (x + self._band - x_a) / dt
+            self._lower = (x - self._band - x_a) / dt
+
+    def append(self, times, values: dict) -> None:
+        """
+        Adds samples and forwards the ones that are kept.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if times.size == 0:
+            return
+        kept_times, kept_rows = [], []
+        with self._lock:
+            if self.channels is None:
+                self._start(list(values))
+            nan = np.full(times.size, np.nan)
+            matrix = np.stack([np.asarray(values.get(name, nan), dtype=np.float64)
+                               for name in self.channels], axis=1)
+            self.received += times.size
+
+            for t, x in zip(times.tolist(), matrix):
+                if self._anchor is None:
+                    self._anchor = (t, x)
+                    kept_times.append(t)
+                    kept_rows.append(x)
+                    continue
+                if self._held is None:
+                    if t > self._anchor[0]:
+                        self._open(t, x)
+                        self._held = (t, x)
+                    continue
+
+                t_a, x_a = self._anchor
+                dt = t - t_a
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    # The line from the anchor to x has to pass every door since the anchor
+                    slope = (x - x_a) / dt
+                    closed = np.any((slope > self._upper) | (slope < self._lower))
+                # A channel turning NaN or back needs kept samples on both sides
+                gaps = np.isnan(x_a)
+                closed = closed or np.any(np.isnan(x) != gaps) or np.any(np.isnan(self._held[1]) != gaps)
+                if closed or self._held[0] - t_a >= self.max_gap:
+                    self._anchor = self._held
+                    kept_times.append(self._held[0])
+                    kept_rows.append(self._held[1])
+                    self._open(t, x)
+                else:
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        self._upper = np.fmin(self._upper, (x + self._band - x_a) / dt)
+                        self._lower = np.fmax(self._lower, (x - self._band - x_a) / dt)
+                self._held = (t, x)
+
+        self._publish(kept_times, kept_rows)
+
+    def _publish(self, times: list, rows: list) -> None:
+        if not times:
+            return
+        self.kept += len(times)
+        matrix = np.array(rows, dtype=np.float64).reshape(len(times), len(self.channels))
+        batch = TelemetryBatch(np.asarray(times, dtype=np.float64),
+                               {name: matrix[:, i] for i, name in enumerate(self.channels)})
+        for callback in self.subscribers:
+            callback(batch)
+
+    def __call__(self, batch) -> None:
+        """
+        Subscriber entry point for TelemetryPoller.
+        """
+        self.append(batch.times, batch.values)
+
+    def flush(self) -> None:
+        """
+        Forwards the held back sample, e.g. before closing the recorder.
+        """
+        with self._lock:
+            held = self._held
+            if held is not None:
+                self._anchor = held
+                self._held = None
+        if held is not None:
+            self._publish([held[0]], [held[1]])
+
+
+class RingBuffer:
+    """
+    Fixed size in-process buffer of the most recent samples of a set of channels.
+
+    Subscribe it to a TelemetryPoller to let plots and monitors read recent data
+    without calling the DLL. Readers get copies, so they never hold the lock for
+    longer than a memcpy.
+
+    Attributes:
+        version (int): Incremented on every append, lets readers skip unchanged data.
+    """
+
+    def __init__(self, channels, capacity: int = 100_000):
+        """
+        Args:
+            channels (list): Channel names stored in the buffer.
+            capacity (int): Number of samples kept per channel.
+        """
+        self.channels = list(channels)
+        self.capacity = capacity
+        self._index = {name: i for i, name in enumerate(self.channels)}
+        self._times = np.full(capacity, np.nan)
+        self._values = np.full((len(self.channels), capacity), np.nan)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, times, values: dict) -> None:
+        """
+        Adds samples. Channels missing from values are stored as NaN.
+        """
+        times = np.asarray(times, dtype=np.float64)[-self.capacity:]
+        n = times.size
+        if n == 0:
+            return
+        rows = np.full((len(self.channels), n), np.nan)
+        for name, column in values.items():
+            i = self._index.get(name)
+            if i is not None:
+                rows[i] = np.asarray(column, dtype=np.float64)[-n:]
+
+        with self._lock:
+            positions = (self._head + np.arange(n)) % self.capacity
+            self._times[positions] = times
+            self._values[:, positions] = rows
+            self._head = (self._head + n) % self.capacity
+            self._count = min(self._count + n, self.capacity)
+            self.version += 1
+
+    def __call__(self, batch) -> None:
+        """
+        Subscriber entry point for TelemetryPoller.
+        """
+        self.append(batch.times, batch.values)
+
+    def latest(self, seconds: float = None, channels=None) -> tuple:
+        """
+        Returns the buffered samples in chronological order.
+
+        Args:
+            seconds (float): Only return samples of the last seconds, relative to the
+                             newest sample. All buffered samples if None.
+            channels (list): Channels to return, all if None.
+
+        Returns:
+            tuple: (times, dict of channel name -> values)
+        """
+        channels = self.channels if channels is None else list(channels)
+        rows = [self._index[name] for name in channels]
+        with self._lock:
+            start = (self._head - self._count) % self.capacity
+            order = (start + np.arange(self._count)) % self.capacity
+            times = self._times[order]
+            values = self._values[np.ix_(rows, order)]
+        if seconds is not None and times.size:
+            first = np.searchsorted(times, times[-1] - seconds, side='left')
+            times, values = times[first:], values[:, first:]
+        return times, {name: values[i] for i, name in enumerate(channels)}
@@ -0,0 +1,261 @@
+"""
+attodry-top: terminal monitor of all attoDRY channels.
+
+In owner mode the monitor opens the COM port, reads one snapshot of all telemetry
+channels and status getters per refresh and can publish it to a JSON file. In attach
+mode it only reads such a file, so it runs next to a measurement script that owns the
+port (that script subscribes a SnapshotPublisher to its TelemetryPoller):
+
+    python Attodry_top.py --port COM3 --publish attodry_snapshot.json
+    python Attodry_top.py --attach attodry_snapshot.json
+
+Only lines whose text changed are redrawn and the loop sleeps in getch() between
+refreshes, so the monitor can stay open for weeks. Press q to quit.
+
+The display needs curses, on Windows from the windows-curses package. The module
+imports without it, so SnapshotPublisher can be used in measurement scripts anyway.
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+
+from Attodry_capabilities import supported_names
+from Attodry_errors import AttoDRYError
+from Attodry_telemetry import CHANNELS, read_snapshot
+
+
+# Status name -> (AttoDRYInterface method, arguments); values are shown as returned
+STATUS = {
+    "cryostat_in_valve":  ("get_cryostat_in_valve_status", ()),
+    "cryostat_out_valve": ("get_cryostat_out_valve_status", ()),
+    "dump_in_valve":      ("get_dump_in_valve_status", ()),
+    "dump_out_valve":     ("get_dump_out_valve_status", ()),
+    "controlling_temperature": ("is_controlling_temperature", ()),
+    "controlling_field":  ("is_controlling_field", ()),
+    "persistent_mode":    ("is_persistent_mode_set", ()),
+    "pumping":            ("is_pumping", ()),
+    "error_count":        ("get_error_count", ()),
+    "warning_count":      ("get_warning_count", ()),
+    "action_message":     ("get_action_message", ()),
+}
+
+# Section title, unit and channels of the display
+SECTIONS = (
+    ("Temperatures", "K", ("sample_temperature", "user_temperature_setpoint", "vti_temperature",
+                           "stage_4k_temperature", "reservoir_temperature")),
+    ("Pressures", "mbar", ("cryostat_in_pressure", "cryostat_out_pressure", "dump_pressure")),
+    ("Heaters", "W", ("reservoir_heater_power", "vti_heater_power", "sample_heater_power")),
+    ("Heater output", "%", ("heater_output",)),
+    ("Field", "T", ("magnetic_field_x", "magnetic_field_y", "magnetic_field_z")),
+    ("Pump", "Hz", ("turbopump_frequency",)),
+)
+
+
+def _curses():
+    try:
+        import curses
+    except ImportError as err:
+        raise ImportError("attodry-top needs curses, on Windows install it with "
+                          "pip install windows-curses") from err
+    return curses
+
+
+def read_status(interface, names=None) -> dict:
+    """
+    Reads the status getters; a getter that raises an AttoDRYError gives None.
+    By default only the getters the connected model supports are read.
+    """
+    status = {}
+    for name in names or supported_names(interface, STATUS):
+        method, args = STATUS[name]
+        try:
+            status[name] = getattr(interface, method)(*args)
+        except AttoDRYError:
+            status[name] = None
+    return status
+
+
+def write_snapshot(path: str, t: float, values: dict, status: dict) -> None:
+    """
+    Atomically replaces the snapshot file, so readers never see a partial file.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump({"time": t, "values": {k: None if math.isnan(v) else v for k, v in values.items()},
+                   "status": status}, f)
+    os.replace(tmp, path)
+
+
+class SnapshotPublisher:
+    """
+    TelemetryPoller subscriber that publishes the latest row of each batch for
+    attodry-top in attach mode.
+    """
+
+    def __init__(self, path: str, interface=None, lock=None):
+        """
+        Args:
+            path (str): Snapshot JSON file.
+            interface (AttoDRYInterface): If given, the status getters are read too.
+            lock (threading.RLock): The poller lock, held while reading the status.
+        """
+        self.path = path
+        self._ad = interface
+        self.lock = lock
+
+    def __call__(self, batch) -> None:
+        if len(batch) == 0:
+            return
+        values = {name: float(column[-1]) for name, column in batch.values.items()}
+        status = {}
+        if self._ad is not None:
+            if self.lock is not None:
+                with self.lock:
+                    status = read_status(self._ad)
+            else:
+                status = read_status(self._ad)
+        write_snapshot(self.path, float(batch.times[-1]), values, status)
+
+
+def _format_value(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float):
+        return f"{value:.4g}" if abs(value) < 1e5 else f"{value:.3e}"
+    return str(value)
+
+
+def render(t: float, values: dict, status: dict, source: str, width: int = 80) -> list:
+    """
+    Lines of the display for one snapshot.
+    """
+    age = time.time() - t if t else math.nan
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) if t else "no data"
+    lines = [f"attodry-top  {source}  {stamp}  ({age:.0f} s old)"[:width], ""]
+    for title, unit, channels in SECTIONS:
+        shown = [name for name in channels if name in values]
+        if not shown:
+            continue
+        lines.append(f"{title} [{unit}]")
+        for name in shown:
+            lines.append(f"  {name:<28}{_format_value(values[name]):>14}"[:width])
+        lines.append("")
+    if status:
+        lines.append("Status")
+        for name, value in status.items():
+            if name != "action_message":
+                lines.append(f"  {name:<28}{_format_value(value):>14}"[:width])
+        lines.append("")
+        lines.append(f"Action: {status.get('action_message') or '-'}"[:width])
+    return lines
+
+
+class Top:
+    """
+    Curses loop that draws snapshots with differential updates.
+    """
+
+    def __init__(self, interface=None, attach: str = None, publish: str = None, interval: float = 2.0):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface (owner mode).
+            attach (str): Snapshot file to read instead of the interface (attach mode).
+            publish (str): Snapshot file written in owner mode.
+            interval (float): Seconds between refreshes.
+        """
+        if (interface is None) == (attach is None):
+            raise ValueError("Give either an interface or a snapshot file to attach to")
+        self._ad = interface
+        self.attach = attach
+        self.publish = publish
+        self.interval = interval
+        self._channels = supported_names(interface, CHANNELS)
+        self._lines = []
+        self._mtime = None
+        self._snapshot = (None, {}, {})
+
+    def snapshot(self) -> tuple:
+        """
+        Returns:
+            tuple: (time, values, status) of the newest snapshot.
+        """
+        if self._ad is not None:
+            t = time.time()
+            values = read_snapshot(self._ad, self._channels)
+            status = read_status(self._ad)
+            if self.publish:
+                write_snapshot(self.publish, t, values, status)
+            self._snapshot = (t, values, status)
+            return self._snapshot
+
+        # Attach mode: parse the file only when it changed
+        try:
+            mtime = os.stat(self.attach).st_mtime_ns
+            if mtime != self._mtime:
+                with open(self.attach, 'r') as f:
+                    data = json.load(f)
+                values = {k: math.nan if v is None else v for k, v in data["values"].items()}
+                self._snapshot = (data["time"], values, data.get("status", {}))
+                self._mtime = mtime
+        except (OSError, ValueError, KeyError):
+            pass
+        return self._snapshot
+
+    def draw(self, screen) -> None:
+        height, width = screen.getmaxyx()
+        t, values, status = self.snapshot()
+        source = "owner" if self._ad is not None else f"attached to {self.attach}"
+        lines = render(t, values, status, source, width - 1)[:height - 1]
+        for row, text in enumerate(lines):
+            if row >= len(self._lines) or self._lines[row] != text:
+                screen.move(row, 0)
+                screen.clrtoeol()
+                screen.addstr(row, 0, text)
+        for row in range(len(lines), len(self._lines)):
+            screen.move(row, 0)
+            screen.clrtoeol()
+        self._lines = lines
+        screen.noutrefresh()
+        _curses().doupdate()
+
+    def _loop(self, screen) -> None:
+        curses = _curses()
+        curses.curs_set(0)
+        screen.timeout(int(self.interval * 1000))
+        while True:
+            self.draw(screen)
+            key = screen.getch()
+            if key in (ord('q'), ord('Q')):
+                break
+            if key == curses.KEY_RESIZE:
+                self._lines = []
+                screen.clear()
+
+    def run(self) -> None:
+        _curses().wrapper(self._loop)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Terminal monitor of the attoDRY")
+    parser.add_argument("--port", default="COM3", help="COM port in owner mode")
+    parser.add_argument("--attach", help="read-only mode: snapshot file written by another process")
+    parser.add_argument("--publish", help="owner mode: write snapshots to this file")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between refreshes")
+    args = parser.parse_args()
+
+    if args.attach:
+        Top(attach=args.attach, interval=args.interval).run()
+        return
+
+    from Attodry_session import AttoDRYSession
+    with AttoDRYSession(com_port=args.port) as interface:
+        Top(interface, publish=args.publish, interval=args.interval).run()
+
+
+if __name__ == "__main__":
+    main()
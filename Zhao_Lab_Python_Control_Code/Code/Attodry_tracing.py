@@ -0,0 +1,251 @@
+"""
+Lightweight tracing of nested spans to attribute the wall time of a measurement run.
+
+Spans are opened with a context manager or a decorator and carry a category. The
+wait helpers of the recipe, cooldown and sample exchange modules open spans, and
+instrument_interface() wraps every AttoDRYInterface method in a "dll" span:
+
+    import Attodry_tracing as tracing
+    tracing.enable("run.trace")
+    AD = tracing.instrument_interface(AD)
+    with tracing.span("sweep", "acquisition"):
+        ...
+    tracing.disable()
+    print(tracing.format_summary(tracing.summarize("run.trace")))
+
+The summary uses the self time of each span (its duration minus its children), so
+nested categories add up to 100%. While tracing is disabled, span() returns a shared
+no-op object and costs a fraction of a microsecond.
+"""
+
+import functools
+import itertools
+import json
+import sys
+import threading
+import time
+
+
+class _NullSpan:
+    """
+    Span returned while tracing is disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def end(self) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One timed region. Use as a context manager or call end().
+    """
+
+    __slots__ = ('tracer', 'id', 'parent', 'name', 'category', 'start', 'duration')
+
+    def __init__(self, tracer, name: str, category: str):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.duration = None
+        stack = tracer._stack()
+        self.parent = stack[-1].id if stack else 0
+        self.id = next(tracer._ids)
+        stack.append(self)
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end()
+        return False
+
+    def end(self) -> None:
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        stack = self.tracer._stack()
+        if self in stack:
+            # Also closes children that were never ended
+            del stack[stack.index(self):]
+        self.tracer._record(self)
+
+
+class Tracer:
+    """
+    Collects spans and writes them to a JSON lines trace file.
+    """
+
+    def __init__(self, buffer_size: int = 1000):
+        self.enabled = False
+        self.buffer_size = buffer_size
+        self._file = None
+        self._origin = 0.0
+        self._buffer = []
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._ids = None
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enable(self, path: str) -> None:
+        """
+        Starts tracing into a new trace file.
+        """
+        self.disable()
+        self._ids = itertools.count(1)
+        self._origin = time.perf_counter()
+        self._file = open(path, 'w')
+        self._file.write(json.dumps({'start': time.time(), 'fields': ["id", "parent", "thread", "category",
+                                                                      "name", "start", "duration"]}) + "\n")
+        self.enabled = True
+
+    def disable(self) -> None:
+        """
+        Stops tracing and closes the trace file.
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.flush()
+        self._file.close()
+        self._file = None
+
+    def span(self, name: str, category: str = "other"):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category)
+
+    def _record(self, span: Span) -> None:
+        record = (span.id, span.parent, threading.get_ident(), span.category, span.name,
+                  round(span.start - self._origin, 6), round(span.duration, 6))
+        # Under the flush lock, so a record is never appended to a buffer being swapped out
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.buffer_size:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            if self._file is not None and buffer:
+                self._file.write("".join(json.dumps(record, separators=(',', ':')) + "\n"
+                                         for record in buffer))
+                self._file.flush()
+
+
+tracer = Tracer()
+
+
+def enable(path: str) -> None:
+    tracer.enable(path)
+
+
+def disable() -> None:
+    tracer.disable()
+
+
+def span(name: str, category: str = "other"):
+    """
+    Opens a span on the module tracer, a no-op while tracing is disabled.
+    """
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return Span(tracer, name, category)
+
+
+def traced(category: str = "other", name: str = None):
+    """
+    Decorator that runs the function inside a span named after it.
+    """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, label, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_interface(interface, category: str = "dll"):
+    """
+    Wraps the public methods of an interface instance in spans, in place.
+
+    Returns:
+        The same interface, for chaining.
+    """
+    for attribute in dir(type(interface)):
+        if attribute.startswith('_'):
+            continue
+        method = getattr(interface, attribute)
+        if callable(method):
+            setattr(interface, attribute, traced(category, attribute)(method))
+    return interface
+
+
+def read_trace(path: str) -> list:
+    """
+    Returns:
+        list: Span records (id, parent, thread, category, name, start, duration).
+    """
+    with open(path, 'r') as f:
+        f.readline()
+        return [tuple(json.loads(line)) for line in f if line.strip()]
+
+
+def summarize(trace) -> dict:
+    """
+    Self time per category of a trace file or a list of span records.
+
+    Time of root spans that is not covered by children counts towards the root's
+    category, so the values add up to the total time of the root spans.
+
+    Returns:
+        dict: Category -> seconds, sorted by decreasing time.
+    """
+    records = read_trace(trace) if isinstance(trace, str) else trace
+    children = {}
+    for span_id, parent, _, _, _, _, duration in records:
+        if parent:
+            children[parent] = children.get(parent, 0.0) + duration
+    totals = {}
+    for span_id, _, _, category, _, _, duration in records:
+        own = max(duration - children.get(span_id, 0.0), 0.0)
+        totals[category] = totals.get(category, 0.0) + own
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def format_summary(totals: dict) -> str:
+    """
+    One line summary like "ramping 52%, settling 31%, dll 3%, acquisition 14%".
+    """
+    total = sum(totals.values())
+    if total == 0:
+        return "empty trace"
+    return ", ".join(f"{category} {seconds / total:.0%}" for category, seconds in totals.items())
+
+
+if __name__ == "__main__":
+    totals = summarize(sys.argv[1])
+    for category, seconds in totals.items():
+        print(f"{category:<20} {seconds:>12.1f} s")
+    print(format_summary(totals))
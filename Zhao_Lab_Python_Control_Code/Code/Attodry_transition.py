@@ -0,0 +1,271 @@
+"""
+Reservoir setpoint optimizer for faster temperature transitions.
+
+The reservoir Tset values and the heater range are usually left at their defaults,
+which makes large temperature steps slower than they need to be. The optimizer
+records how long every transition took with which settings in a JSON history and,
+for a new step, picks the candidate settings with the shortest predicted time for a
+similar start and end temperature. The settings are applied around the
+set_user_temperature call and restored afterwards:
+
+    optimizer = TransitionOptimizer(AD, history_path="transitions.json", candidates=[
+        {"tset_cold_sample": 4.0, "heater_range": 2},
+        {"tset_cold_sample": 6.0, "tset_warm_sample": 20.0, "heater_range": 3},
+    ])
+    optimizer.set_user_temperature(50.0)
+    print(optimizer.improvement())
+
+Candidates without nearby history are tried once each before the fastest one is used.
+"""
+
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+import Attodry_tracing as tracing
+
+
+logger = logging.getLogger(__name__)
+
+
+# Setting name -> (query method or None, getter, setter) of AttoDRYInterface
+SETTINGS = {
+    "tset_cold_sample": ("query_reservoir_tset_cold_sample", "get_reservoir_tset_cold_sample",
+                         "set_reservoir_tset_cold_sample"),
+    "tset_warm_sample": ("query_reservoir_tset_warm_sample", "get_reservoir_tset_warm_sample",
+                         "set_reservoir_tset_warm_sample"),
+    "tset_warm_magnet": ("query_reservoir_tset_warm_magnet", "get_reservoir_tset_warm_magnet",
+                         "set_reservoir_tset_warm_magnet"),
+    "heater_range":     (None, "get_heater_range", "set_heater_range"),
+}
+
+
+def _key(settings: dict) -> str:
+    """
+    Hashable form of a settings dict, rounded so read back floats compare equal.
+    """
+    return json.dumps({name: round(float(settings[name]), 3) for name in sorted(settings)})
+
+
+class TransitionOptimizer:
+    """
+    Learns and applies the reservoir settings that reach a new temperature fastest.
+    """
+
+    def __init__(self, interface, history_path: str = None, candidates=None,
+                 tolerance: float = 0.05, hits: int = 4, poll: float = 2.0,
+                 timeout: float = 4 * 3600, bandwidth: float = 0.15, min_weight: float = 0.5,
+                 explore: bool = True, query_delay: float = 0.5, lock=None):
+        """
+        Args:
+            interface (AttoDRYInterface): Connected interface with temperature control active.
+            history_path (str): JSON file keeping the measured transitions.
+            candidates (list): Dicts of settings to try, names from SETTINGS. Settings
+                               missing from a candidate keep their current value. The
+                               current settings are always a candidate.
+            tolerance (float): Temperature tolerance in K of the target.
+            hits (int): Consecutive readings inside the tolerance that end a transition.
+            poll (float): Seconds between readings.
+            timeout (float): Seconds before a transition counts as failed.
+            bandwidth (float): Width of the similarity kernel in log temperature, 0.15
+                               weights a step from 4.6 K like one from 4 K by 0.6.
+            min_weight (float): Kernel weight of history needed for a prediction.
+            explore (bool): Try candidates without a prediction before using the best.
+            query_delay (float): Seconds between a query_reservoir_tset_* call and
+                                 reading the value.
+            lock (threading.RLock): Lock shared with other threads using the interface.
+        """
+        self._ad = interface
+        self.history_path = history_path
+        self.candidates = [dict(c) for c in candidates or []]
+        for candidate in self.candidates:
+            unknown = set(candidate) - set(SETTINGS)
+            if unknown:
+                raise ValueError(f"Unknown settings {sorted(unknown)}, expected names from SETTINGS")
+        self.tolerance = tolerance
+        self.hits = hits
+        self.poll = poll
+        self.timeout = timeout
+        self.bandwidth = bandwidth
+        self.min_weight = min_weight
+        self.explore = explore
+        self.query_delay = query_delay
+        self.lock = lock or threading.RLock()
+
+        self.history = []
+        if history_path is not None and os.path.isfile(history_path):
+            with open(history_path, 'r') as f:
+                self.history = json.load(f).get("runs", [])
+
+    def read_settings(self, names=None) -> dict:
+        """
+        Reads the current reservoir settings.
+        """
+        names = list(names or SETTINGS)
+        with self.lock:
+            queried = [SETTINGS[name][0] for name in names if SETTINGS[name][0] is not None]
+            for method in queried:
+                getattr(self._ad, method)()
+            if queried:
+                time.sleep(self.query_delay)
+            return {name: float(getattr(self._ad, SETTINGS[name][1])()) for name in names}
+
+    def apply_settings(self, settings: dict) -> None:
+        with self.lock:
+            for name, value in settings.items():
+                if name == "heater_range":
+                    value = int(value)
+                getattr(self._ad, SETTINGS[name][2])(value)
+
+    def _save(self) -> None:
+        if self.history_path is None:
+            return
+        tmp = self.history_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"runs": self.history}, f, indent=2)
+        os.replace(tmp, self.history_path)
+
+    def record(self, start: float, end: float, settings: dict, default: dict, seconds: float) -> None:
+        """
+        Adds a measured transition to the history.
+
+        Args:
+            start, end (float): Start and target temperature in K.
+            settings (dict): Settings in effect during the transition.
+            default (dict): Settings before the optimizer changed them.
+            seconds (float): Time until the target was reached.
+        """
+        self.history.append({"time": time.time(), "start": start, "end": end,
+                             "settings": settings, "default": default, "seconds": seconds})
+        self._save()
+
+    def predict(self, start: float, end: float, settings: dict) -> float:
+        """
+        Kernel weighted mean time of similar transitions with these settings.
+
+        Returns:
+            float: Predicted seconds, NaN if there is not enough similar history.
+        """
+        key = _key(settings)
+        runs = [run for run in self.history
+                if _key(run["settings"]) == key and (run["end"] > run["start"]) == (end > start)]
+        if not runs:
+            return math.nan
+        s = np.log([max(run["start"], 1e-3) for run in runs]) - math.log(max(start, 1e-3))
+        e = np.log([max(run["end"], 1e-3) for run in runs]) - math.log(max(end, 1e-3))
+        weight = np.exp(-(s * s + e * e) / (2 * self.bandwidth ** 2))
+        if weight.sum() < self.min_weight:
+            return math.nan
+        return float(np.dot(weight, [run["seconds"] for run in runs]) / weight.sum())
+
+    def choose(self, start: float, end: float, current: dict) -> tuple:
+        """
+        Picks the settings for a transition.
+
+        Args:
+            current (dict): Settings in effect now.
+
+        Returns:
+            tuple: (settings, predicted seconds or NaN)
+        """
+        options = [dict(current)] + [dict(current, **c) for c in self.candidates]
+        unique = list({_key(o): o for o in options}.values())
+        predictions = [self.predict(start, end, o) for o in unique]
+        if self.explore:
+            for option, predicted in zip(unique, predictions):
+                if math.isnan(predicted):
+                    return option, predicted
+        known = [(p, i) for i, p in enumerate(predictions) if not math.isnan(p)]
+        if not known:
+            return dict(current), math.nan
+        predicted, best = min(known)
+        return unique[best], predicted
+
+    def _wait(self, target: float) -> float:
+        """
+        Polls until the sample temperature is stable at target.
+
+        Returns:
+            float: Seconds waited.
+        """
+        start = time.monotonic()
+        count = 0
+        while count < self.hits:
+            with self.lock:
+                temperature = self._ad.get_sample_temperature()
+            count = count + 1 if abs(temperature - target) <= self.tolerance else 0
+            if time.monotonic() - start > self.timeout:
+                raise TimeoutError(f"Temperature {target} K not reached within {self.timeout} s")
+            if count < self.hits:
+                time.sleep(self.poll)
+        return time.monotonic() - start
+
+    @contextlib.contextmanager
+    def transition(self, target: float):
+        """
+        Context for a temperature change with optimized settings.
+
+        On entry the chosen settings are applied and the setpoint is changed, on exit
+        the previous settings are restored and, without an exception, the time spent
+        in the context is recorded. Wait for the target inside the context.
+        """
+        names = set(SETTINGS) if not self.candidates else set().union(*self.candidates)
+        default = self.read_settings(sorted(names))
+        with self.lock:
+            start_temperature = float(self._ad.get_sample_temperature())
+        settings, predicted = self.choose(start_temperature, target, default)
+        logger.info("Transition %.2f K -> %.2f K with %s (predicted %.0f s)",
+                    start_temperature, target, settings, predicted)
+
+        start = time.monotonic()
+        try:
+            self.apply_settings({k: v for k, v in settings.items() if v != default[k]})
+            with self.lock:
+                self._ad.set_user_temperature(target)
+            yield settings
+        finally:
+            self.apply_settings({k: v for k, v in default.items() if v != settings[k]})
+        self.record(start_temperature, target, settings, default, time.monotonic() - start)
+
+    def set_user_temperature(self, temperature_k: float) -> float:
+        """
+        Changes the temperature with optimized settings and waits until it is reached.
+
+        Returns:
+            float: Seconds the transition took.
+        """
+        with self.transition(temperature_k):
+            with tracing.span("temperature", "ramping"):
+                seconds = self._wait(temperature_k)
+        return seconds
+
+    def improvement(self) -> dict:
+        """
+        Measured effect of the optimizer.
+
+        Compares every transition that ran with changed settings with the time
+        predicted for the default settings of the same step.
+
+        Returns:
+            dict: Number of compared transitions, mean seconds saved per transition
+                  and mean ratio of actual to default time (below 1 is faster).
+        """
+        saved, ratios = [], []
+        for run in self.history:
+            if _key(run["settings"]) == _key(run["default"]):
+                continue
+            baseline = self.predict(run["start"], run["end"], run["default"])
+            if math.isnan(baseline) or baseline <= 0:
+                continue
+            saved.append(baseline - run["seconds"])
+            ratios.append(run["seconds"] / baseline)
+        if not saved:
+            return {"transitions": 0, "saved_seconds": math.nan, "ratio": math.nan}
+        return {"transitions": len(saved), "saved_seconds": float(np.mean(saved)),
+                "ratio": float(np.mean(ratios))}
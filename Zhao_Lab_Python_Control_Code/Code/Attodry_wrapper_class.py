@@ -2,6 +2,9 @@ import os
 import ctypes
 from ctypes import c_int32, c_float, c_char_p, c_int, c_uint8, c_uint16, POINTER
 
+from Attodry_capabilities import Capabilities, unbind
+from Attodry_errors import error_from_code
+
 
 loc = r"..\64 bit\attoDRYxyz64bit.dll"
 
@@ -23,7 +26,9 @@ an x or z specificied is for the y dir.
 # Define ctypes wrappers for the additional AttoDRY C API
 class AttoDRYInterface:
 
+    ATTODRY1100 = 0
     ATTODRY2100 = 1
+    ATTODRY800  = 2
 
     # Can probably remove
     _1SECOND     = 0
@@ -45,6 +50,8 @@ class AttoDRYInterface:
             dll_path (str): Path to the AttoDRY shared library (.dll or .so).
         """
         self._dll = ctypes.CDLL(dll_path)
+        self.capabilities = None
+        self.dispatch = {}
 
     def _check_return(self, ret_code):
         """
@@ -54,10 +61,11 @@ class AttoDRYInterface:
             ret_code (int): Return code from a C function.
 
         Raises:
-            RuntimeError: If the return code is non-zero.
+            AttoDRYError: If the return code is non-zero. This is a RuntimeError, 
+                          the subclass depends on the code (see Attodry_errors).
         """
         if ret_code != 0:
-            raise RuntimeError(f"C function returned error code: {ret_code}")
+            raise error_from_code(ret_code)
 
     def begin(self, device:int=ATTODRY2100) -> None:
         """
@@ -68,10 +76,15 @@ class AttoDRYInterface:
 
         Starts the communication server for a specified device.
 
+        Methods the device does not support raise UnsupportedFunctionError from
+        then on instead of calling the DLL (see Attodry_capabilities).
+
         Args:
-            device (int): Device identifier.
+            device (int): Device identifier (ATTODRY1100, ATTODRY2100 or ATTODRY800).
         """
         self._check_return(self._dll.AttoDRY_Interface_begin(c_uint16(device)))
+        self.capabilities = Capabilities(device)
+        self.dispatch = self.capabilities.bind(self)
 
     def connect(self, com_port:str="COM3") -> None:
         """
@@ -115,6 +128,9 @@ class AttoDRYInterface:
         Stops the server. Device must be disconnected first.
         """
         self._check_return(self._dll.AttoDRY_Interface_end())
+        unbind(self)
+        self.capabilities = None
+        self.dispatch = {}
 
     def is_connected(self) -> bool:
         """
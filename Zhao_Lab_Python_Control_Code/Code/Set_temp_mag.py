@@ -1,22 +1,17 @@
-from Attodry_wrapper_class import AttoDRYInterface
+from Attodry_session import AttoDRYSession
 import time
 """
 The "C function returned error code: -1073807246" error from connect
-means there is another program open using the com port the Attocube is on
+means there is another program open using the com port the Attocube is on.
+It is raised as PortBusyError and retried by the session before giving up.
 """
 
-AD = AttoDRYInterface()
+session = AttoDRYSession(com_port="COM3")
+AD = session.interface
 
+session.open()
 
-AD.begin()
-AD.connect()
-
-initialized = 0
-
-while initialized==0:
-    initialized = AD.is_initialised()
-
-print("Connected and Initliazed")
+print(f"Connected and Initliazed in {session.time_to_ready:.1f} s")
 
 print(f"VTI Temp. {AD.get_vti_temperature()}K")
 
@@ -55,7 +50,6 @@ print(f"This is the sample temp. {AD.get_sample_temperature()}K")
 # print(f"Z: {AD.get_user_magnetic_field_setpoint_axis('Z')} Tesla")
 
 
-AD.Disconnect()
-AD.End()
+session.close()
 
 print("Script Done")
\ No newline at end of file
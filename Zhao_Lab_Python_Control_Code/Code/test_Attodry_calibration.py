@@ -0,0 +1,33 @@
+"""
+Tests of the calibration curve conversion. Run with pytest from this directory.
+"""
+
+import numpy as np
+
+from Attodry_calibration import CalibrationCurve, FORMAT_LOG_OHM_K, FORMAT_OHM_K
+
+
+def _curve(data_format: int) -> CalibrationCurve:
+    return CalibrationCurve(np.array([1.0, 2.0, 3.0]), np.array([300.0, 100.0, 10.0]),
+                            {"data_format": data_format})
+
+
+def test_invalid_readings_give_nan_without_affecting_the_others():
+    curve = _curve(FORMAT_LOG_OHM_K)
+    temperatures = curve.to_temperature([np.nan, 100.0, 0.0, -5.0, 1000.0])
+    assert np.isnan(temperatures[[0, 2, 3]]).all()
+    np.testing.assert_allclose(temperatures[[1, 4]], [100.0, 10.0], rtol=1e-6)
+
+
+def test_nan_reading_on_linear_curve():
+    curve = _curve(FORMAT_OHM_K)
+    temperatures = curve.to_temperature(np.array([2.0, np.nan, 0.0, -5.0]))
+    assert np.isnan(temperatures[1])
+    # Readings below the curve range are clamped to its first breakpoint
+    np.testing.assert_allclose(temperatures[[0, 2, 3]], [100.0, 300.0, 300.0], rtol=1e-6)
+
+
+def test_out_argument_receives_nan():
+    out = np.empty(2)
+    assert _curve(FORMAT_LOG_OHM_K).to_temperature([10.0, np.nan], out=out) is out
+    assert out[0] == 300.0 and np.isnan(out[1])